@@ -4,11 +4,13 @@
 """
 import sys
 from pathlib import Path
+import yaml
 
 sys.path.insert(0, str(Path(__file__).parent))
 
 from storage.hbase_client import HBaseClient
 from search.indexer import Indexer
+from search.manager import publish_generation
 
 if __name__ == '__main__':
     print("=" * 50)
@@ -22,6 +24,13 @@ if __name__ == '__main__':
     # 构建索引
     indexer.build_index()
     
+    # 通知正在运行的搜索服务加载新一代索引
+    config_path = Path(__file__).parent / 'config' / 'config.yaml'
+    with open(config_path, 'r', encoding='utf-8') as f:
+        config = yaml.safe_load(f)
+    generation = publish_generation(config.get('search', {}).get('generation_file', './data/index_generation'))
+    print(f"Published index generation {generation}")
+    
     print("=" * 50)
     print("索引构建完成")
     print("=" * 50)
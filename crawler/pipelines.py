@@ -2,11 +2,17 @@
 Scrapy Pipelines
 """
 import os
+import queue
+import time
 import hashlib
+import threading
+from collections import deque
 from urllib.parse import urlparse
 from scrapy.exceptions import DropItem
 from scrapy.pipelines.files import FilesPipeline
 from scrapy.http import Request
+from twisted.internet import defer
+from twisted.internet.threads import deferToThread
 from pathlib import Path
 import sys
 
@@ -14,10 +20,14 @@ import sys
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from storage.hbase_client import HBaseClient
+from storage.batch_writer import BatchWriter, BatchWriteError
 from storage.data_model import Document
 from utils.text_processor import extract_text_from_html, clean_text
 from utils.file_handler import get_file_type, extract_text_from_file, get_file_size
 
+# 通知写入线程退出
+_STOP = object()
+
 
 class DuplicatesPipeline:
     """
@@ -102,27 +112,141 @@ class FileDownloadPipeline(FilesPipeline):
 class StoragePipeline:
     """
     存储Pipeline：将数据存储到HBase
+    
+    HBase写入不在Twisted reactor线程中执行：process_item只把文档放入有界的写入队列，
+    由后台写入线程批量写入，存储变慢或重试时不会阻塞下载和解析。
+    队列已满时process_item返回一个Deferred，腾出空间后才完成，
+    Scrapy据此减缓处理新的item，形成对爬取的反压。
+    写入失败的一批文档在写入线程中按指数退避整批重试，仍失败时逐个记录URL
     """
     
     def __init__(self):
         self.hbase_client = None
+        self.writer = None
+        self.queue = None
+        self.workers = []
+        self.spider = None
+        self.write_retries = 3
+        self.write_retry_backoff = 1.0
+        # 重试后写入成功的文档数、最终未能写入的文档数
+        self.retried = 0
+        self.dropped = 0
+        self._stats_lock = threading.Lock()
+        # 队列满时等待入队的(文档, Deferred)，只在reactor线程中访问
+        self._waiting = deque()
     
     def open_spider(self, spider):
         """
-        Spider启动时初始化HBase客户端
+        Spider启动时初始化HBase客户端、批量写入器和写入线程
         """
+        self.spider = spider
         self.hbase_client = HBaseClient()
+        self.writer = BatchWriter(self.hbase_client)
+        
+        storage_config = self.hbase_client.storage_config
+        self.write_retries = storage_config.get('write_retries', 3)
+        self.write_retry_backoff = storage_config.get('write_retry_backoff', 1.0)
+        self.queue = queue.Queue(maxsize=storage_config.get('write_queue_size', 1000))
+        self.workers = [
+            threading.Thread(target=self._write_loop, name=f'storage-writer-{i}', daemon=True)
+            for i in range(storage_config.get('write_workers', 2))
+        ]
+        for worker in self.workers:
+            worker.start()
     
     def close_spider(self, spider):
         """
-        Spider关闭时关闭HBase连接
+        Spider关闭时在后台线程中等待写入队列排空，写入剩余文档并关闭HBase连接
         """
+        return deferToThread(self._shutdown)
+    
+    def _shutdown(self):
+        for _ in self.workers:
+            self.queue.put(_STOP)
+        for worker in self.workers:
+            worker.join()
+        
+        if self.writer:
+            try:
+                self.writer.flush()
+            except BatchWriteError as e:
+                self._retry_batch(e.docs)
+            except Exception as e:
+                self.spider.logger.error(f"Error flushing documents: {e}")
+            self.spider.logger.info(f"Document writes: {self.writer.stats()}, "
+                                    f"retried: {self.retried}, not stored: {self.dropped}")
         if self.hbase_client:
             self.hbase_client.close()
     
+    def _write_loop(self):
+        """
+        写入线程：从队列取出文档交给批量写入器；队列空闲时写入已缓冲的文档
+        """
+        # 在Scrapy安装reactor之后才导入，避免提前安装默认reactor
+        from twisted.internet import reactor
+        
+        while True:
+            try:
+                doc = self.queue.get(timeout=self.writer.flush_interval)
+            except queue.Empty:
+                doc = None
+            if doc is _STOP:
+                break
+            
+            try:
+                if doc is None:
+                    self.writer.flush()
+                else:
+                    self.writer.add(doc)
+            except BatchWriteError as e:
+                # 失败的是之前缓冲的整批文档，不只是当前文档
+                self._retry_batch(e.docs)
+            except Exception as e:
+                self.spider.logger.error(f"Error storing documents: {e}")
+            
+            if self._waiting:
+                reactor.callFromThread(self._admit_waiting)
+    
+    def _retry_batch(self, docs):
+        """
+        在写入线程中按指数退避重试写入失败的一批文档，重试用尽后记录每个未写入文档的URL
+        """
+        delay = self.write_retry_backoff
+        for attempt in range(1, self.write_retries + 1):
+            time.sleep(delay)
+            delay *= 2
+            try:
+                self.hbase_client.save_documents(docs)
+            except Exception as e:
+                self.spider.logger.warning(
+                    f"Retry {attempt}/{self.write_retries} of {len(docs)} documents failed: {e}")
+                continue
+            with self._stats_lock:
+                self.retried += len(docs)
+            self.spider.logger.info(f"Stored {len(docs)} documents on retry {attempt}")
+            return
+        
+        with self._stats_lock:
+            self.dropped += len(docs)
+        for doc in docs:
+            self.spider.logger.error(f"Document not stored: {doc.url}")
+    
+    def _admit_waiting(self):
+        """
+        在reactor线程中将等待的文档按顺序放入队列，并完成对应的Deferred
+        """
+        while self._waiting:
+            doc, d = self._waiting[0]
+            try:
+                self.queue.put_nowait(doc)
+            except queue.Full:
+                break
+            self._waiting.popleft()
+            d.callback(None)
+    
     def process_item(self, item, spider):
         """
-        处理item，存储到HBase
+        处理item，放入写入队列后批量存储到HBase
         """
         try:
             # 创建Document对象
@@ -135,14 +259,21 @@ class StoragePipeline:
                 source=item.get('source', ''),
                 file_path=item.get('file_path')
             )
-            
-            # 保存到HBase
-            row_key = self.hbase_client.save_document(doc)
-            spider.logger.info(f"Saved document: {doc.url} -> {row_key}")
-            
         except Exception as e:
             spider.logger.error(f"Error storing item: {e}")
+            return item
         
-        return item
+        # 已有item在等待时排在其后，保持写入顺序
+        if not self._waiting:
+            try:
+                self.queue.put_nowait(doc)
+                return item
+            except queue.Full:
+                pass
+        
+        d = defer.Deferred()
+        d.addCallback(lambda _: item)
+        self._waiting.append((doc, d))
+        return d
 
 
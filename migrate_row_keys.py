@@ -0,0 +1,36 @@
+#!/usr/bin/env python
+"""
+迁移文档表的row key：由"URL哈希前8位_时间戳"改为按URL确定的row key
+
+同一URL的多个旧行只保留最近爬取的一个。迁移完成后需重新构建索引：
+    python migrate_row_keys.py --dry-run
+    python migrate_row_keys.py
+    python build_index.py
+"""
+import sys
+import argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from storage.hbase_client import HBaseClient
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='迁移文档表的row key')
+    parser.add_argument('--dry-run', action='store_true', help='只统计，不写入也不删除')
+    args = parser.parse_args()
+
+    print("=" * 50)
+    print("开始迁移row key" + ("（仅统计）" if args.dry_run else ""))
+    print("=" * 50)
+
+    client = HBaseClient()
+    stats = client.migrate_row_keys(dry_run=args.dry_run)
+    client.close()
+
+    print(f"旧格式的行: {stats['old_rows']}")
+    print(f"迁移的文档: {stats['migrated']}")
+    print(f"删除的旧行: {stats['deleted']}")
+    print("=" * 50)
+    print("迁移完成" if not args.dry_run else "统计完成")
+    print("=" * 50)
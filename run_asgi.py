@@ -0,0 +1,35 @@
+#!/usr/bin/env python
+"""
+以ASGI方式启动Web服务脚本（需要安装uvicorn）
+
+    python run_asgi.py --port 5000
+"""
+import sys
+import argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from web.asgi import application, web_config
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='以ASGI方式启动Web服务')
+    parser.add_argument('--host', default=None)
+    parser.add_argument('--port', type=int, default=None)
+    args = parser.parse_args()
+
+    try:
+        import uvicorn
+    except ImportError:
+        print("未安装uvicorn，请先执行: pip install uvicorn")
+        sys.exit(1)
+
+    host = args.host or web_config.get('host', '127.0.0.1')
+    port = args.port or web_config.get('port', 5000)
+
+    print("=" * 50)
+    print("启动Web服务（ASGI）")
+    print(f"访问 http://localhost:{port}")
+    print("=" * 50)
+
+    uvicorn.run(application, host=host, port=port, lifespan='on')
@@ -0,0 +1,37 @@
+#!/usr/bin/env python
+"""
+启动搜索节点脚本
+
+示例（本地两个分区、每个分区两个副本）:
+    python run_node.py --partition 0 --partitions 2 --port 5101
+    python run_node.py --partition 0 --partitions 2 --port 5111
+    python run_node.py --partition 1 --partitions 2 --port 5102
+    python run_node.py --partition 1 --partitions 2 --port 5112
+"""
+import sys
+import argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from search.searcher import Searcher
+from web.node import create_node_app
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='启动搜索节点')
+    parser.add_argument('--partition', type=int, required=True, help='本节点服务的分区编号')
+    parser.add_argument('--partitions', type=int, required=True, help='分区总数')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5101)
+    args = parser.parse_args()
+
+    print("=" * 50)
+    print(f"启动搜索节点: 分区 {args.partition}/{args.partitions}")
+    print(f"监听 http://{args.host}:{args.port}")
+    print("=" * 50)
+
+    searcher = Searcher(partition=(args.partition, args.partitions))
+    # 启动前完成分词和倒排索引构建，避免首个请求超时
+    searcher.warm()
+    app = create_node_app(searcher)
+    app.run(host=args.host, port=args.port, threaded=True)
@@ -1,19 +1,35 @@
 #!/usr/bin/env python
 """
 启动Web服务脚本
+
+多进程模式（共享同一份只读索引）:
+    python run_web.py --workers 4
 """
 import sys
+import argparse
 from pathlib import Path
 
 sys.path.insert(0, str(Path(__file__).parent))
 
-from web.app import app
+from web.app import app, searcher, web_config, reset_after_fork
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='启动Web服务')
+    parser.add_argument('--host', default=None)
+    parser.add_argument('--port', type=int, default=None)
+    parser.add_argument('--workers', type=int, default=web_config.get('workers', 1), help='服务进程数')
+    args = parser.parse_args()
+
+    port = args.port or web_config.get('port', 5000)
+
     print("=" * 50)
     print("启动Web服务")
-    print("访问 http://localhost:5000")
+    print(f"访问 http://localhost:{port}")
     print("=" * 50)
-    app.run(debug=True)
-
 
+    if args.workers > 1:
+        from web.prefork import serve_prefork
+        serve_prefork(app, searcher, args.host or web_config.get('host', '127.0.0.1'), port, args.workers,
+                      after_fork=reset_after_fork)
+    else:
+        app.run(host=args.host, port=port, debug=True)
@@ -0,0 +1,355 @@
+"""
+分布式搜索协调器
+"""
+import sys
+import json
+import time
+import base64
+import threading
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from pathlib import Path
+from typing import List, Dict, Tuple, Optional, Iterator
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from storage.data_model import Document
+from search.tokenizer import Tokenizer
+from search.searcher import Searcher
+from search.fuzzy import select_expansions, merge_expansions
+from search.deadline import current_deadline
+
+
+class ClusterSearcher:
+    """
+    分布式搜索协调器
+
+    文档按URL哈希划分到多个分区，每个分区由一个或多个副本搜索节点（run_node.py）服务。
+    协调器并行地向所有分区发送请求：先汇总各分区的候选统计量得到全局统计，
+    再由各分区用全局统计打分并返回局部top-k，最后归并。
+    每个分区的请求带超时，副本响应慢时发出对冲请求，失败的副本暂时摘除。
+    对外提供与Searcher相同的搜索接口。
+    """
+
+    def __init__(self, cluster_config: Dict, search_config: Dict = None):
+        """
+        初始化协调器
+
+        Args:
+            cluster_config: 集群配置，partitions为每个分区的副本地址列表
+            search_config: 搜索配置（config.yaml的search部分），模糊匹配等选项与单机模式相同
+        """
+        search_config = search_config or {}
+        self.partitions: List[List[str]] = [
+            [url.rstrip('/') for url in replicas] for replicas in cluster_config.get('partitions', [])
+        ]
+        if not self.partitions:
+            raise ValueError("集群模式需要在cluster.partitions中配置搜索节点")
+
+        self.timeout = cluster_config.get('timeout', 2.0)
+        self.hedge_delay = cluster_config.get('hedge_delay', 0.05)
+        self.retry_after = cluster_config.get('retry_after', 10.0)
+        self.max_results = cluster_config.get('max_results', 50)
+        self.fuzzy = search_config.get('fuzzy_enabled', False)
+        self.fuzzy_max_expansions = search_config.get('fuzzy_max_expansions', 5)
+
+        self.tokenizer = Tokenizer()
+        self.generation = 0
+
+        # 副本健康状态：地址 -> 摘除截止时间
+        self._down_until: Dict[str, float] = {}
+        self._health_lock = threading.Lock()
+
+        # 分区级扇出与单个节点请求使用不同线程池，避免互相等待造成死锁
+        replica_count = sum(len(replicas) for replicas in self.partitions)
+        max_workers = cluster_config.get('max_workers', 4 * replica_count)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.fan_out_executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def warm(self):
+        """
+        协调器不持有索引，无需预先构建
+        """
+
+    def stop_shards(self):
+        """
+        协调器不启动分片进程
+        """
+
+    def _post(self, url: str, path: str, payload: Dict) -> Dict:
+        """
+        向单个节点发送请求
+        """
+        data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        req = urllib.request.Request(f"{url}{path}", data=data,
+                                     headers={'Content-Type': 'application/json'})
+        with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+            result = json.loads(resp.read().decode('utf-8'))
+        if not result.get('success'):
+            raise RuntimeError(result.get('message', 'node error'))
+        return result
+
+    def _ordered_replicas(self, replicas: List[str]) -> List[str]:
+        """
+        健康的副本排在前面，被摘除的副本排在最后作为兜底
+        """
+        now = time.monotonic()
+        with self._health_lock:
+            healthy = [url for url in replicas if self._down_until.get(url, 0) <= now]
+            down = [url for url in replicas if self._down_until.get(url, 0) > now]
+        return healthy + down
+
+    def _mark(self, url: str, ok: bool):
+        with self._health_lock:
+            if ok:
+                self._down_until.pop(url, None)
+            else:
+                self._down_until[url] = time.monotonic() + self.retry_after
+
+    def _call_partition(self, replicas: List[str], path: str, payload: Dict, expires: float = None) -> Dict:
+        """
+        向一个分区发送请求，带对冲和故障转移
+
+        先请求首选副本，若hedge_delay内未返回则同时请求下一个副本，
+        出错时立即换下一个副本，取最先成功的结果。
+        expires为查询截止时间（time.monotonic()），缺省为timeout秒后。
+
+        只有请求出错或超过节点超时（timeout）的副本才被摘除；查询截止时间
+        （可能由客户端设得很短）到期时仍未返回的副本不摘除，其请求结束后再按结果更新状态。
+        """
+        replicas = self._ordered_replicas(replicas)
+        deadline = expires if expires is not None else time.monotonic() + self.timeout
+        pending = {}
+        next_index = 0
+        last_error = None
+
+        while True:
+            if next_index < len(replicas) and (not pending or time.monotonic() >= hedge_at):
+                url = replicas[next_index]
+                pending[self.executor.submit(self._post, url, path, payload)] = (url, time.monotonic())
+                next_index += 1
+                hedge_at = time.monotonic() + self.hedge_delay
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            wait_time = min(remaining, self.hedge_delay) if next_index < len(replicas) else remaining
+            done, _ = wait(list(pending), timeout=wait_time, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                url, _ = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    self._mark(url, False)
+                    last_error = e
+                    continue
+                self._mark(url, True)
+                return result
+
+            if not pending and next_index >= len(replicas):
+                break
+
+        now = time.monotonic()
+        for future, (url, started) in pending.items():
+            if now - started >= self.timeout:
+                self._mark(url, False)
+            else:
+                future.add_done_callback(lambda f, url=url: self._mark(url, f.exception() is None))
+        raise TimeoutError(f"No replica answered {path} in time: {last_error or 'timeout'}")
+
+    def _fan_out(self, path: str, payload: Dict) -> List[Dict]:
+        """
+        并行请求所有分区，跳过整体不可用的分区
+
+        查询带截止时间时，剩余时间随请求下发给各节点，
+        有分区缺席或节点返回不完整结果时标记本次查询结果不完整
+        """
+        deadline = current_deadline()
+        expires = None
+        if deadline is not None:
+            expires = min(deadline.expires, time.monotonic() + self.timeout)
+            payload = dict(payload, timeout_ms=max(int(deadline.remaining() * 1000), 1))
+
+        futures = [self.fan_out_executor.submit(self._call_partition, replicas, path, payload, expires)
+                   for replicas in self.partitions]
+        results = []
+        for replicas, future in zip(self.partitions, futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                print(f"Warning: partition {replicas} unavailable: {e}")
+                if deadline is not None:
+                    deadline.partial = True
+                continue
+            if result.get('partial') and deadline is not None:
+                deadline.partial = True
+            results.append(result)
+        return results
+
+    def _score(self, query: str, fuzzy: bool = None, k: int = None, source: str = None,
+               boundary: Tuple[float, str] = None) -> List[Tuple[float, str, Dict]]:
+        """
+        在所有分区上执行查询
+
+        Returns:
+            (负分数, URL, 文档字典) 列表，按分数降序、URL升序排列
+        """
+        query_tokens = self.tokenizer.tokenize(query)
+        if not query_tokens:
+            return []
+
+        if fuzzy is None:
+            fuzzy = self.fuzzy
+
+        # 第一轮：汇总各分区的命中情况和统计量
+        replies = self._fan_out('/node/stats', {'tokens': query_tokens})
+        matched = set()
+        for reply in replies:
+            matched.update(reply['matched'])
+        stats_list = [reply['stats'] for reply in replies]
+
+        query_weights = {}
+        unmatched = [token for token in query_tokens if token not in matched]
+        if fuzzy and unmatched:
+            # 模糊扩展：合并各分区词典中的近似词，按全局文档频率选取
+            merged = {token: {} for token in unmatched}
+            for reply in self._fan_out('/node/expand', {'tokens': unmatched}):
+                for token, matches in reply['expansions'].items():
+                    for term, distance, doc_freq in matches:
+                        _, old_freq = merged[token].get(term, (distance, 0))
+                        merged[token][term] = (distance, old_freq + doc_freq)
+            expansions = {
+                token: select_expansions([(term, d, f) for term, (d, f) in terms.items()],
+                                         self.fuzzy_max_expansions)
+                for token, terms in merged.items()
+            }
+            query_tokens, query_weights = merge_expansions(query_tokens, expansions)
+            if query_weights:
+                replies = self._fan_out('/node/stats', {'tokens': query_tokens,
+                                                        'extra_terms': list(query_weights)})
+                stats_list = [reply['stats'] for reply in replies]
+
+        stats = Searcher._merge_stats(stats_list)
+        if not stats['doc_count']:
+            return []
+
+        # 第二轮：各分区用全局统计量打分，返回局部top-k
+        replies = self._fan_out('/node/score', {
+            'tokens': query_tokens,
+            'weights': query_weights,
+            'stats': stats,
+            'k': k,
+            'source': source or '',
+            'boundary': list(boundary) if boundary else None
+        })
+
+        results = []
+        for reply in replies:
+            for item in reply['results']:
+                results.append((-item['score'], item['doc']['url'], item['doc']))
+        results.sort(key=lambda x: (x[0], x[1]))
+        return results[:k] if k is not None else results
+
+    def search(self, query: str, max_results: int = None, fuzzy: bool = None) -> List[Tuple[Document, float]]:
+        """
+        搜索文档，接口同Searcher.search
+        """
+        if not query or not query.strip():
+            return []
+        max_results = max_results or self.max_results
+        return [(Document.from_dict(doc), -neg_score)
+                for neg_score, _, doc in self._score(query, fuzzy, k=max_results)]
+
+    def search_many(self, queries: List[str], max_results: int = None,
+                    fuzzy: bool = None) -> Iterator[Tuple[str, List[Tuple[Document, float]]]]:
+        """
+        批量搜索，接口同Searcher.search_many；相同查询只执行一次
+        """
+        cache = {}
+        for query in queries:
+            if query not in cache:
+                cache[query] = self.search(query, max_results, fuzzy)
+            yield query, cache[query]
+
+    def iter_search(self, query: str, max_results: int = None, fuzzy: bool = None,
+                    source: str = None) -> Iterator[Tuple[Document, float]]:
+        """
+        逐个产出搜索结果，接口同Searcher.iter_search
+
+        各分区仍需返回完整的局部top-k，协调器归并后逐个产出
+        """
+        if not query or not query.strip():
+            return
+        max_results = max_results or self.max_results
+        for neg_score, _, doc in self._score(query, fuzzy, k=max_results, source=source):
+            yield Document.from_dict(doc), -neg_score
+
+    def search_by_source(self, query: str, source: str, max_results: int = None,
+                         fuzzy: bool = None) -> List[Tuple[Document, float]]:
+        """
+        按来源搜索，来源过滤下推到各分区执行
+        """
+        if not query or not query.strip():
+            return []
+        max_results = max_results or self.max_results
+        return [(Document.from_dict(doc), -neg_score)
+                for neg_score, _, doc in self._score(query, fuzzy, k=max_results, source=source)]
+
+    def search_page(self, query: str, page_size: int = None, cursor: str = None,
+                    source: str = None, fuzzy: bool = None) -> Tuple[List[Tuple[Document, float]], Optional[str]]:
+        """
+        分页搜索，接口同Searcher.search_page
+
+        集群模式下游标记录(分数, URL)边界，各分区只返回边界之后的前page_size个结果
+        """
+        if not query or not query.strip():
+            return [], None
+        page_size = page_size or self.max_results
+
+        boundary = None
+        if cursor:
+            try:
+                payload = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+                boundary = (float(payload['s']), str(payload['u']))
+            except Exception:
+                raise ValueError("无效的分页游标")
+
+        # 多取一个结果用于判断是否还有下一页
+        scored = self._score(query, fuzzy, k=page_size + 1, source=source, boundary=boundary)
+        page = scored[:page_size]
+        results = [(Document.from_dict(doc), -neg_score) for neg_score, _, doc in page]
+        if len(scored) <= page_size:
+            return results, None
+
+        last = page[-1]
+        payload = json.dumps({'s': last[0], 'u': last[1]}, ensure_ascii=False)
+        return results, base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+
+    def suggest(self, prefix: str, limit: int = None) -> List[str]:
+        """
+        自动补全：按各分区返回的名次交错合并
+        """
+        replies = self._fan_out('/node/suggest', {'q': prefix, 'limit': limit})
+        merged = []
+        columns = [reply['suggestions'] for reply in replies]
+        for rank in range(max((len(c) for c in columns), default=0)):
+            for column in columns:
+                if rank < len(column) and column[rank] not in merged:
+                    merged.append(column[rank])
+        return merged[:limit] if limit else merged
+
+    def health(self) -> List[Dict]:
+        """
+        查询所有副本的健康状态
+        """
+        status = []
+        for index, replicas in enumerate(self.partitions):
+            for url in replicas:
+                try:
+                    with urllib.request.urlopen(f"{url}/node/health", timeout=self.timeout) as resp:
+                        info = json.loads(resp.read().decode('utf-8'))
+                    status.append({'partition': index, 'url': url, 'up': True, **info})
+                except Exception as e:
+                    status.append({'partition': index, 'url': url, 'up': False, 'error': str(e)})
+        return status
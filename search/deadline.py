@@ -0,0 +1,79 @@
+"""
+查询截止时间
+"""
+import time
+import threading
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+_local = threading.local()
+
+
+class Deadline:
+    """
+    查询截止时间
+
+    查询执行过程中定期检查，到期后停止查找候选和打分，
+    返回已算出的最好结果，并将partial置为True表示结果不完整
+    """
+
+    def __init__(self, timeout: float):
+        """
+        Args:
+            timeout: 从现在起允许的秒数
+        """
+        self.expires = time.monotonic() + timeout
+        self.partial = False
+
+    @classmethod
+    def at(cls, expires: float) -> 'Deadline':
+        """
+        按time.monotonic()的绝对时间创建，用于跨进程传递
+        """
+        deadline = cls(0)
+        deadline.expires = expires
+        return deadline
+
+    def reset(self, timeout: float):
+        """
+        重新开始计时，用于批量查询中的下一个查询
+        """
+        self.expires = time.monotonic() + timeout
+        self.partial = False
+
+    def remaining(self) -> float:
+        return self.expires - time.monotonic()
+
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires
+
+
+def current_deadline() -> Optional[Deadline]:
+    """
+    获取当前线程的查询截止时间，没有时返回None
+    """
+    return getattr(_local, 'deadline', None)
+
+
+@contextmanager
+def deadline_scope(deadline: Optional[Deadline]) -> Iterator[Optional[Deadline]]:
+    """
+    在with块内执行的查询受deadline约束；deadline为None时不限时
+    """
+    previous = current_deadline()
+    _local.deadline = deadline
+    try:
+        yield deadline
+    finally:
+        _local.deadline = previous
+
+
+def deadline_exceeded() -> bool:
+    """
+    当前查询是否已超过截止时间；超过时标记结果不完整
+    """
+    deadline = current_deadline()
+    if deadline is not None and deadline.expired():
+        deadline.partial = True
+        return True
+    return False
@@ -0,0 +1,137 @@
+"""
+模糊匹配：编辑距离与BK树
+"""
+from typing import Dict, Iterable, List, Tuple
+
+
+def edit_distance(a: str, b: str) -> int:
+    """
+    计算两个字符串的Levenshtein编辑距离
+    """
+    if a == b:
+        return 0
+    if len(a) < len(b):
+        a, b = b, a
+    if not b:
+        return len(a)
+
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(
+                previous[j] + 1,                # 删除
+                current[j - 1] + 1,             # 插入
+                previous[j - 1] + (ca != cb)    # 替换
+            ))
+        previous = current
+    return previous[-1]
+
+
+class BKTree:
+    """
+    BK树：按编辑距离组织词典，查询距离k以内的词时
+    利用三角不等式剪枝，只访问距离在[d-k, d+k]范围内的子树
+    """
+
+    def __init__(self, terms: Iterable[str] = ()):
+        """
+        初始化BK树
+
+        Args:
+            terms: 初始词表
+        """
+        # 节点结构：[词, {距离: 子节点}]
+        self.root = None
+        self.size = 0
+        for term in terms:
+            self.add(term)
+
+    def add(self, term: str):
+        """
+        插入一个词
+        """
+        if self.root is None:
+            self.root = [term, {}]
+            self.size = 1
+            return
+
+        node = self.root
+        while True:
+            distance = edit_distance(term, node[0])
+            if distance == 0:
+                return
+            child = node[1].get(distance)
+            if child is None:
+                node[1][distance] = [term, {}]
+                self.size += 1
+                return
+            node = child
+
+    def search(self, term: str, max_distance: int) -> List[Tuple[str, int]]:
+        """
+        查找与term编辑距离不超过max_distance的词
+
+        Returns:
+            (词, 距离) 列表，按距离升序排列
+        """
+        if self.root is None:
+            return []
+
+        results = []
+        stack = [self.root]
+        while stack:
+            node_term, children = stack.pop()
+            distance = edit_distance(term, node_term)
+            if distance <= max_distance:
+                results.append((node_term, distance))
+            for child_distance in range(distance - max_distance, distance + max_distance + 1):
+                child = children.get(child_distance)
+                if child is not None:
+                    stack.append(child)
+
+        results.sort(key=lambda x: x[1])
+        return results
+
+    def __len__(self) -> int:
+        return self.size
+
+
+def select_expansions(matches: List[Tuple[str, int, int]], max_expansions: int) -> Dict[str, float]:
+    """
+    从近似词中选出扩展词
+
+    Args:
+        matches: (词, 编辑距离, 文档频率) 列表
+        max_expansions: 扩展词数量上限
+
+    Returns:
+        扩展词 -> 权重，距离越大权重越低
+    """
+    # 距离相同时优先文档频率高的词
+    ranked = sorted(matches, key=lambda x: (x[1], -x[2], x[0]))
+    return {term: 1.0 / (1 + distance) for term, distance, _ in ranked[:max_expansions]}
+
+
+def merge_expansions(query_tokens: List[str],
+                     expansions: Dict[str, Dict[str, float]]) -> Tuple[List[str], Dict[str, float]]:
+    """
+    将各查询词的扩展词并入查询
+
+    Args:
+        query_tokens: 原始查询词
+        expansions: 查询词 -> {扩展词: 权重}
+
+    Returns:
+        (扩展后的查询词列表, 扩展词 -> 权重)
+    """
+    expanded = list(query_tokens)
+    query_weights = {}
+    for token in query_tokens:
+        for term, weight in expansions.get(token, {}).items():
+            if term in query_tokens:
+                continue
+            if term not in query_weights:
+                expanded.append(term)
+            query_weights[term] = max(query_weights.get(term, 0.0), weight)
+    return expanded, query_weights
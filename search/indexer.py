@@ -44,14 +44,13 @@ class Indexer:
         Args:
             limit: 限制处理的文档数量
         """
-        print("Loading documents from storage...")
-        documents = self.hbase_client.get_all_documents(limit=limit)
-        print(f"Loaded {len(documents)} documents")
-        
-        print("Building inverted index...")
-        for idx, doc in enumerate(documents):
+        # 边读取边建索引，不在内存中保留完整的文档列表副本
+        print("Building inverted index from storage...")
+        count = 0
+        for idx, doc in enumerate(self.hbase_client.iter_documents(limit=limit)):
+            count = idx + 1
             if idx % 100 == 0:
-                print(f"Processing document {idx + 1}/{len(documents)}")
+                print(f"Processing document {idx + 1}")
             
             # 生成文档ID
             doc_id = self._generate_doc_id(doc.url)
@@ -73,6 +72,7 @@ class Indexer:
             for token, freq in token_freq.items():
                 self.inverted_index[token][doc_id] = freq
         
+        print(f"Loaded {count} documents")
         print(f"Index built with {len(self.inverted_index)} unique terms")
         
         # 保存索引到HBase
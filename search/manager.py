@@ -0,0 +1,318 @@
+"""
+索引热更新：后台加载新一代索引并原子切换
+"""
+import os
+import sys
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+from pathlib import Path
+from typing import List, Tuple, Optional, Iterator
+import yaml
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from storage.hbase_client import HBaseClient
+from storage.data_model import Document
+from search.searcher import Searcher
+
+
+def _resolve_path(path: str) -> Path:
+    path = Path(path)
+    if not path.is_absolute():
+        path = Path(__file__).parent.parent / path
+    return path
+
+
+def publish_generation(path: str) -> int:
+    """
+    发布新一代索引：写入代数标记文件，正在运行的搜索服务检测到后自动重新加载
+
+    Args:
+        path: 标记文件路径
+
+    Returns:
+        新的代数（毫秒时间戳）
+    """
+    marker = _resolve_path(path)
+    marker.parent.mkdir(parents=True, exist_ok=True)
+    generation = int(time.time() * 1000)
+    # 先写临时文件再改名，读取方不会读到写了一半的内容
+    tmp = marker.with_name(marker.name + '.tmp')
+    tmp.write_text(str(generation), encoding='utf-8')
+    os.replace(tmp, marker)
+    return generation
+
+
+def read_generation(path: str) -> Optional[int]:
+    """
+    读取代数标记文件，不存在或无法解析时返回None
+    """
+    try:
+        return int(_resolve_path(path).read_text(encoding='utf-8').strip())
+    except (OSError, ValueError):
+        return None
+
+
+class _Generation:
+    """
+    一代索引及其正在使用的查询数
+    """
+
+    def __init__(self, searcher: Searcher, marker: Optional[int]):
+        self.searcher = searcher
+        self.marker = marker
+        self.refs = 0
+        self.retired = False
+
+
+class SearcherManager:
+    """
+    搜索引擎管理器
+
+    持有当前一代的Searcher。每个查询先acquire当前一代、结束后release；
+    后台线程定期检查代数标记文件，发现新一代时在后台加载并预热
+    （构建分词、倒排索引、补全和模糊索引，重放最近的查询），
+    然后原子地替换当前引用。正在执行的查询继续使用旧一代，
+    旧一代在最后一个查询release后才释放。
+    多进程服务时由主进程调用disable_watcher并自行定期reload，工作进程不各自加载。
+    对外提供与Searcher相同的搜索接口。
+    """
+
+    def __init__(self, hbase_client: HBaseClient = None):
+        """
+        初始化管理器并加载第一代索引
+
+        Args:
+            hbase_client: HBase客户端，各代索引共用
+        """
+        config_path = Path(__file__).parent.parent / 'config' / 'config.yaml'
+        with open(config_path, 'r', encoding='utf-8') as f:
+            config = yaml.safe_load(f)
+
+        search_config = config.get('search', {})
+        self.generation_file = search_config.get('generation_file', './data/index_generation')
+        self.reload_interval = search_config.get('reload_interval', 30)
+        self.recent_queries = deque(maxlen=search_config.get('reload_warm_queries', 100))
+
+        self.hbase_client = hbase_client or HBaseClient()
+
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        # 调用过start_shards/stop_shards后，新一代索引沿用指定的分片数而不是配置
+        self._num_shards: Optional[int] = None
+        marker = read_generation(self.generation_file)
+        searcher = Searcher(self.hbase_client)
+        if marker is not None:
+            searcher.generation = marker
+        self._current = _Generation(searcher, marker)
+
+        # 监视线程在首次使用时启动
+        self._watching = bool(self.reload_interval)
+        self._watcher_pid = None
+
+    @property
+    def generation(self) -> int:
+        return self._current.searcher.generation
+
+    def acquire(self) -> _Generation:
+        """
+        获取当前一代索引，用完后必须调用release
+        """
+        self._ensure_watcher()
+        with self._lock:
+            current = self._current
+            current.refs += 1
+            return current
+
+    def release(self, generation: _Generation):
+        """
+        释放acquire得到的一代索引；已被替换且无人使用时关闭
+        """
+        with self._lock:
+            generation.refs -= 1
+            drained = generation.retired and generation.refs == 0
+        if drained:
+            self._close(generation)
+
+    @contextmanager
+    def searcher(self) -> Iterator[Searcher]:
+        """
+        在with块内使用当前一代的Searcher
+        """
+        generation = self.acquire()
+        try:
+            yield generation.searcher
+        finally:
+            self.release(generation)
+
+    def reload(self, force: bool = False) -> bool:
+        """
+        检查并加载新一代索引
+
+        Args:
+            force: 不检查标记文件，强制重新加载
+
+        Returns:
+            是否切换到了新一代
+        """
+        with self._reload_lock:
+            marker = read_generation(self.generation_file)
+            if not force and (marker is None or marker == self._current.marker):
+                return False
+
+            print(f"Loading new index generation {marker}...")
+            start = time.time()
+            old = self._current.searcher
+            searcher = Searcher(self.hbase_client, num_shards=self._num_shards)
+
+            # 加载失败（如HBase暂时不可用）时保留当前一代，标记不更新，下次检查时重试
+            if searcher.load_error is not None or (not searcher.documents and old.documents and not force):
+                print(f"Warning: index generation {marker} failed to load "
+                      f"({searcher.load_error or 'no documents'}), keeping generation {old.generation}")
+                self._close(_Generation(searcher, marker))
+                return False
+
+            # 代数取自共享的标记文件，游标和ETag在重启和多个进程间通用；
+            # 没有标记（强制重新加载）时在当前代数上加一
+            if marker is not None and marker > old.generation:
+                searcher.generation = marker
+            else:
+                searcher.generation = old.generation + 1
+
+            # 沿用已累计的查询频率，补全权重不因重新加载而丢失
+            searcher.query_term_counts = old.query_terms_snapshot()
+            searcher.warm()
+            # 重放最近的查询（不计入查询指标和查询频率），让文本段页面和分词缓存提前就绪
+            searcher.warm_queries(list(self.recent_queries))
+
+            with self._lock:
+                previous = self._current
+                self._current = _Generation(searcher, marker)
+                previous.retired = True
+                drained = previous.refs == 0
+            if drained:
+                self._close(previous)
+
+            print(f"Switched to index generation {searcher.generation} "
+                  f"({len(searcher.documents)} documents, {time.time() - start:.1f}s)")
+            return True
+
+    def _close(self, generation: _Generation):
+        try:
+            generation.searcher.close()
+        except Exception as e:
+            print(f"Warning: failed to close index generation: {e}")
+
+    def disable_watcher(self):
+        """
+        不再启动后台监视线程，已启动的线程在下次检查时退出
+
+        由调用方自行定期调用reload，如多进程服务的主进程：
+        只在主进程加载一次新一代，再重新fork工作进程共享这份索引
+        """
+        self._watching = False
+
+    def _ensure_watcher(self):
+        if not self._watching or self._watcher_pid == os.getpid():
+            return
+        with self._lock:
+            if self._watcher_pid == os.getpid():
+                return
+            self._watcher_pid = os.getpid()
+        threading.Thread(target=self._watch, daemon=True).start()
+
+    def _watch(self):
+        while True:
+            time.sleep(self.reload_interval)
+            if not self._watching:
+                return
+            try:
+                self.reload()
+            except Exception as e:
+                print(f"Error reloading index: {e}")
+
+    def _remember(self, query: str):
+        if query and query.strip():
+            self.recent_queries.append(query)
+
+    def warm(self):
+        """
+        预先构建当前一代的索引结构
+        """
+        self._current.searcher.warm()
+
+    def stop_shards(self):
+        self._num_shards = 0
+        self._current.searcher.stop_shards()
+
+    def start_shards(self, num_shards: int):
+        self._num_shards = num_shards
+        self._current.searcher.start_shards(num_shards)
+
+    @property
+    def num_shards(self) -> int:
+        return self._current.searcher.num_shards
+
+    @property
+    def shard_pool(self):
+        return self._current.searcher.shard_pool
+
+    def search(self, query: str, max_results: int = None, fuzzy: bool = None) -> List[Tuple[Document, float]]:
+        """
+        搜索文档，接口同Searcher.search
+        """
+        self._remember(query)
+        with self.searcher() as searcher:
+            return searcher.search(query, max_results, fuzzy)
+
+    def search_many(self, queries: List[str], max_results: int = None,
+                    fuzzy: bool = None) -> Iterator[Tuple[str, List[Tuple[Document, float]]]]:
+        """
+        批量搜索，接口同Searcher.search_many；整批查询使用同一代索引
+        """
+        with self.searcher() as searcher:
+            yield from searcher.search_many(queries, max_results, fuzzy)
+
+    def iter_search(self, query: str, max_results: int = None, fuzzy: bool = None,
+                    source: str = None) -> Iterator[Tuple[Document, float]]:
+        """
+        逐个产出搜索结果，接口同Searcher.iter_search；产出期间一直使用同一代索引
+        """
+        self._remember(query)
+        with self.searcher() as searcher:
+            yield from searcher.iter_search(query, max_results, fuzzy, source)
+
+    def search_by_source(self, query: str, source: str, max_results: int = None,
+                         fuzzy: bool = None) -> List[Tuple[Document, float]]:
+        """
+        按来源搜索，接口同Searcher.search_by_source
+        """
+        self._remember(query)
+        with self.searcher() as searcher:
+            return searcher.search_by_source(query, source, max_results, fuzzy)
+
+    def search_page(self, query: str, page_size: int = None, cursor: str = None,
+                    source: str = None, fuzzy: bool = None) -> Tuple[List[Tuple[Document, float]], Optional[str]]:
+        """
+        分页搜索，接口同Searcher.search_page；切换代数后旧游标失效
+        """
+        if not cursor:
+            self._remember(query)
+        with self.searcher() as searcher:
+            return searcher.search_page(query, page_size, cursor, source, fuzzy)
+
+    def sources(self) -> List[str]:
+        """
+        当前一代索引中的来源网站列表
+        """
+        with self.searcher() as searcher:
+            return searcher.sources()
+
+    def suggest(self, prefix: str, limit: int = None) -> List[str]:
+        """
+        自动补全，接口同Searcher.suggest
+        """
+        with self.searcher() as searcher:
+            return searcher.suggest(prefix, limit)
@@ -0,0 +1,418 @@
+"""
+查询指标：分阶段耗时直方图与计数器，以Prometheus文本格式导出
+"""
+import os
+import json
+import time
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from search.profile import current_profile
+
+# 线程局部状态：paused()期间当前线程不记录指标
+_local = threading.local()
+
+
+# 耗时桶上界（秒），覆盖从亚毫秒级的单阶段到秒级的慢查询
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+class _CounterChild:
+    """
+    单个计数器（一组标签值）
+    """
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1):
+        if getattr(_local, 'paused', False):
+            return
+        with self._lock:
+            self.value += amount
+
+    def samples(self, name: str, labels: str) -> List[str]:
+        return [f"{name}{labels} {_format_value(self.value)}"]
+
+    def state(self):
+        return self.value
+
+    def merge(self, state):
+        with self._lock:
+            self.value += state
+
+
+class _HistogramChild:
+    """
+    单个直方图（一组标签值）
+
+    observe只做一次二分查找和几次加法；各桶计数不累加存放，导出时再求前缀和
+    """
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        if getattr(_local, 'paused', False):
+            return
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def samples(self, name: str, labels: str) -> List[str]:
+        with self._lock:
+            counts = list(self.counts)
+            total = self.sum
+
+        inner = labels[1:-1] + ',' if labels else ''
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{inner}le="{_format_value(bound)}"}} {cumulative}')
+        lines.append(f"{name}_sum{labels} {repr(total)}")
+        lines.append(f"{name}_count{labels} {cumulative}")
+        return lines
+
+    def state(self):
+        with self._lock:
+            return {'counts': list(self.counts), 'sum': self.sum}
+
+    def merge(self, state):
+        with self._lock:
+            for i, count in enumerate(state['counts'][:len(self.counts)]):
+                self.counts[i] += count
+            self.sum += state['sum']
+
+
+class _Metric:
+    """
+    指标，可带一个标签维度
+    """
+
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, label: str = None):
+        self.name = name
+        self.documentation = documentation
+        self.label = label
+        self._children: Dict[str, object] = {}
+        self._lock = threading.Lock()
+        if label is None:
+            self._children[''] = self._new_child()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, value: str):
+        """
+        获取标签值对应的子指标
+        """
+        child = self._children.get(value)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(value, self._new_child())
+        return child
+
+    def empty(self) -> '_Metric':
+        """
+        同名、同标签维度的空指标，用于汇总多个进程的指标
+        """
+        metric = object.__new__(type(self))
+        metric.__dict__.update(self.__dict__)
+        metric._children = {}
+        metric._lock = threading.Lock()
+        if self.label is None:
+            metric._children[''] = metric._new_child()
+        return metric
+
+    def state(self) -> Dict[str, object]:
+        return {value: child.state() for value, child in list(self._children.items())}
+
+    def merge(self, state: Dict[str, object]):
+        for value, child_state in state.items():
+            self.labels(value).merge(child_state)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for value, child in sorted(self._children.items()):
+            labels = f'{{{self.label}="{_escape(value)}"}}' if self.label else ''
+            lines.extend(child.samples(self.name, labels))
+        return lines
+
+
+class Counter(_Metric):
+    """
+    单调递增计数器
+    """
+
+    kind = 'counter'
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1):
+        self._children[''].inc(amount)
+
+
+class Histogram(_Metric):
+    """
+    直方图
+    """
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, label: str = None,
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, label)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self._children[''].observe(value)
+
+
+class Registry:
+    """
+    指标注册表
+    """
+
+    def __init__(self):
+        self.metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """
+        以Prometheus文本格式（0.0.4）导出所有指标
+        """
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+    def state(self) -> Dict[str, Dict[str, object]]:
+        """
+        所有指标的当前值，可JSON序列化
+        """
+        return {metric.name: metric.state() for metric in self.metrics}
+
+    def merged(self, states: List[Dict[str, Dict[str, object]]]) -> 'Registry':
+        """
+        将多份state()的结果相加，返回新的注册表
+        """
+        registry = Registry()
+        for metric in self.metrics:
+            total = registry.register(metric.empty())
+            for state in states:
+                total.merge(state.get(metric.name, {}))
+        return registry
+
+
+class MultiprocessCollector:
+    """
+    多进程服务时汇总各工作进程的指标
+
+    工作进程共用同一个监听端口，每次抓取落到哪个进程不确定，只导出本进程的指标会使计数器时大时小。
+    每个工作进程定期把自己的指标写入目录下的<pid>.json，导出时先写入本进程的最新值，
+    再把目录中所有文件相加。已退出进程的文件合并进retired.json后删除，
+    进程退出或被替换后它累计的计数仍然保留，汇总值不会回退。
+    """
+
+    def __init__(self, registry: Registry, directory: str, interval: float = 5):
+        """
+        Args:
+            registry: 本进程的指标注册表
+            directory: 存放各进程指标文件的目录
+            interval: 工作进程写入指标文件的间隔（秒）
+        """
+        self.registry = registry
+        self.directory = Path(directory)
+        self.interval = interval
+        self.active = False
+
+    def start(self):
+        """
+        在工作进程fork后调用：开始定期写入本进程的指标
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with self._locked():
+            # 本进程刚启动，同名文件只可能来自已退出且pid被复用的进程
+            self._retire(self._path(os.getpid()))
+        self.active = True
+        threading.Thread(target=self._dump_loop, daemon=True).start()
+
+    def render(self) -> str:
+        """
+        导出所有工作进程汇总后的指标
+        """
+        with self._locked():
+            self._dump()
+            states = []
+            for path in sorted(self.directory.glob('*.json')):
+                if not path.stem.isdigit():
+                    continue
+                if not _pid_alive(int(path.stem)):
+                    self._retire(path)
+                    continue
+                state = self._read(path)
+                if state is not None:
+                    states.append(state)
+            retired = self._read(self.directory / 'retired.json')
+            if retired is not None:
+                states.append(retired)
+        return self.registry.merged(states).render()
+
+    def _path(self, pid: int) -> Path:
+        return self.directory / f'{pid}.json'
+
+    def _dump_loop(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self._dump()
+            except OSError as e:
+                print(f"Warning: failed to write metrics: {e}")
+
+    def _dump(self):
+        # 先写临时文件再改名，读取方不会读到写了一半的内容
+        path = self._path(os.getpid())
+        tmp = path.with_name(f'{path.name}.{threading.get_ident()}.tmp')
+        tmp.write_text(json.dumps(self.registry.state()), encoding='utf-8')
+        os.replace(tmp, path)
+
+    def _retire(self, path: Path):
+        """
+        把已退出进程的指标合并进retired.json并删除其文件；调用方持有目录锁
+        """
+        state = self._read(path)
+        if state is None:
+            return
+        retired_path = self.directory / 'retired.json'
+        retired = self._read(retired_path)
+        merged = self.registry.merged([retired or {}, state]).state()
+        tmp = retired_path.with_name('retired.json.tmp')
+        tmp.write_text(json.dumps(merged), encoding='utf-8')
+        os.replace(tmp, retired_path)
+        path.unlink()
+
+    @staticmethod
+    def _read(path: Path):
+        try:
+            return json.loads(path.read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            return None
+
+    @contextmanager
+    def _locked(self):
+        # 合并和导出互斥，避免同一份计数在合并过程中被读到两次
+        with open(self.directory / '.lock', 'a') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    'search_stage_seconds', 'Time spent in each query stage', 'stage'))
+QUERIES = REGISTRY.register(Counter(
+    'search_queries_total', 'Queries executed'))
+CANDIDATES_SCORED = REGISTRY.register(Counter(
+    'search_candidates_scored_total', 'Candidate documents scored'))
+POSTINGS_DECODED = REGISTRY.register(Counter(
+    'search_postings_decoded_total', 'Posting entries read from the inverted index'))
+CACHE_HITS = REGISTRY.register(Counter(
+    'search_cache_hits_total', 'Cache hits', 'cache'))
+CACHE_MISSES = REGISTRY.register(Counter(
+    'search_cache_misses_total', 'Cache misses', 'cache'))
+PARTIAL = REGISTRY.register(Counter(
+    'search_partial_total', 'Queries cut short by their deadline'))
+SHED = REGISTRY.register(Counter(
+    'search_shed_total', 'Requests rejected by admission control'))
+
+# 常用阶段的子指标预先取出，热路径上不再查字典
+_stage_children: Dict[str, _HistogramChild] = {}
+
+
+@contextmanager
+def paused():
+    """
+    在with块内不记录当前线程的指标，用于预热等不属于真实查询的操作
+    """
+    previous = getattr(_local, 'paused', False)
+    _local.paused = True
+    try:
+        yield
+    finally:
+        _local.paused = previous
+
+
+def record_stage(stage: str, start: float) -> float:
+    """
+    记录一个阶段的耗时
+
+    Args:
+        stage: 阶段名
+        start: 阶段开始时的time.perf_counter()
+
+    Returns:
+        当前时间，可直接作为下一阶段的开始时间
+    """
+    now = time.perf_counter()
+    if getattr(_local, 'paused', False):
+        return now
+    child = _stage_children.get(stage)
+    if child is None:
+        child = _stage_children.setdefault(stage, STAGE_SECONDS.labels(stage))
+    child.observe(now - start)
+
+    # 开启了剖析时同时记入本次请求的剖析
+    profile = current_profile()
+    if profile is not None:
+        profile.add_stage(stage, now - start)
+    return now
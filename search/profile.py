@@ -0,0 +1,151 @@
+"""
+查询剖析与慢查询日志
+"""
+import json
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+from typing import Dict, Iterator, Optional
+
+_local = threading.local()
+
+
+class QueryProfile:
+    """
+    单次请求的查询剖析
+
+    记录各阶段耗时、查询词、每个词的倒排列表长度和子串匹配命中数、
+    候选文档数、取回文档数等，用于定位慢查询的原因
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self.counts: Dict[str, int] = {}
+        self.terms: Dict[str, Dict[str, float]] = {}
+        self.tokens = []
+
+    def add_stage(self, stage: str, seconds: float):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def count(self, name: str, amount: int = 1):
+        self.counts[name] = self.counts.get(name, 0) + amount
+
+    def term(self, term: str, name: str, amount: float):
+        stats = self.terms.setdefault(term, {})
+        stats[name] = stats.get(name, 0) + amount
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.start
+
+    def to_dict(self) -> Dict:
+        """
+        转换为可序列化的字典，耗时单位为毫秒
+        """
+        return {
+            'total_ms': round(self.elapsed * 1000, 3),
+            'stages_ms': {stage: round(seconds * 1000, 3) for stage, seconds in self.stages.items()},
+            'tokens': self.tokens,
+            'terms': {term: {self._format_name(name): self._format_value(name, value)
+                             for name, value in stats.items()}
+                      for term, stats in self.terms.items()},
+            'counts': self.counts
+        }
+
+    @staticmethod
+    def _format_name(name: str) -> str:
+        return name[:-len('_seconds')] + '_ms' if name.endswith('_seconds') else name
+
+    @staticmethod
+    def _format_value(name: str, value: float) -> float:
+        return round(value * 1000, 3) if name.endswith('_seconds') else value
+
+
+def current_profile() -> Optional[QueryProfile]:
+    """
+    获取当前线程正在记录的剖析，没有时返回None
+    """
+    return getattr(_local, 'profile', None)
+
+
+@contextmanager
+def profiling(profile: Optional[QueryProfile]) -> Iterator[Optional[QueryProfile]]:
+    """
+    在with块内把查询各阶段的耗时和计数记录到profile；profile为None时不记录
+    """
+    previous = current_profile()
+    _local.profile = profile
+    try:
+        yield profile
+    finally:
+        _local.profile = previous
+
+
+class SlowQueryLog:
+    """
+    慢查询日志
+
+    耗时超过阈值的查询连同其剖析以JSON行写入日志文件，文件按大小轮转
+    """
+
+    def __init__(self, path: str, threshold_ms: float, max_bytes: int = 10 * 1024 * 1024, backup_count: int = 5):
+        """
+        Args:
+            path: 日志文件路径
+            threshold_ms: 慢查询阈值（毫秒）
+            max_bytes: 单个日志文件大小上限
+            backup_count: 保留的轮转文件数
+        """
+        log_path = Path(path)
+        if not log_path.is_absolute():
+            log_path = Path(__file__).parent.parent / log_path
+        log_path.parent.mkdir(parents=True, exist_ok=True)
+
+        self.path = log_path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.threshold = threshold_ms / 1000.0
+        self.logger = logging.getLogger(f'slow_query.{log_path}')
+        self.logger.setLevel(logging.INFO)
+        self.logger.propagate = False
+        if not self.logger.handlers:
+            self._open(log_path)
+
+    def _open(self, log_path: Path):
+        handler = RotatingFileHandler(log_path, maxBytes=self.max_bytes, backupCount=self.backup_count,
+                                      encoding='utf-8')
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        self.logger.addHandler(handler)
+
+    def reopen(self, suffix: str):
+        """
+        改为写入以suffix区分的日志文件（如slow_query.worker0.log）
+
+        RotatingFileHandler不支持多个进程写入并轮转同一个文件，
+        多进程服务时每个工作进程fork后各自调用
+        """
+        for handler in list(self.logger.handlers):
+            self.logger.removeHandler(handler)
+            handler.close()
+        self._open(self.path.with_name(f'{self.path.stem}.{suffix}{self.path.suffix}'))
+
+    def maybe_log(self, profile: QueryProfile, **fields) -> bool:
+        """
+        查询耗时超过阈值时写入日志
+
+        Args:
+            profile: 查询剖析
+            fields: 附加字段（查询字符串、来源过滤等）
+
+        Returns:
+            是否写入了日志
+        """
+        if profile.elapsed < self.threshold:
+            return False
+        record = {'time': time.strftime('%Y-%m-%dT%H:%M:%S'), **fields, 'profile': profile.to_dict()}
+        self.logger.info(json.dumps(record, ensure_ascii=False))
+        return True
@@ -38,13 +38,15 @@ class TFIDF:
         for token, freq in doc_freq.items():
             self.idf_cache[token] = math.log(self.doc_count / (freq + 1))
     
-    def calculate_tfidf(self, doc_tokens: List[str], query_tokens: List[str]) -> float:
+    def calculate_tfidf(self, doc_tokens: List[str], query_tokens: List[str],
+                        query_weights: Dict[str, float] = None) -> float:
         """
         计算文档与查询的TF-IDF相似度
         
         Args:
             doc_tokens: 文档的分词结果
             query_tokens: 查询的分词结果
+            query_weights: 查询词权重（如模糊扩展词），缺省为1
             
         Returns:
             TF-IDF分数
@@ -53,20 +55,54 @@ class TFIDF:
             return 0.0
         
         # 计算文档中每个词的TF
-        doc_token_freq = Counter(doc_tokens)
-        doc_length = len(doc_tokens)
+        return self.calculate_tfidf_from_freqs(Counter(doc_tokens), len(doc_tokens), query_tokens, query_weights)
+    
+    def calculate_tfidf_from_freqs(self, term_freqs: Dict[str, int], doc_length: int, query_tokens: List[str],
+                                   query_weights: Dict[str, float] = None) -> float:
+        """
+        根据文档词频计算TF-IDF分数（词频可直接取自倒排索引）
+        
+        Args:
+            term_freqs: 查询词在文档中的词频
+            doc_length: 文档长度（词数）
+            query_tokens: 查询的分词结果
+            query_weights: 查询词权重，缺省为1
+            
+        Returns:
+            TF-IDF分数
+        """
+        if not doc_length or not query_tokens:
+            return 0.0
         
         score = 0.0
         for query_token in query_tokens:
-            if query_token in doc_token_freq:
+            if term_freqs.get(query_token):
                 # TF
-                tf = doc_token_freq[query_token] / doc_length
+                tf = term_freqs[query_token] / doc_length
                 # IDF
                 idf = self.idf_cache.get(query_token, 0)
                 # TF-IDF
-                score += tf * idf
+                weight = query_weights.get(query_token, 1.0) if query_weights else 1.0
+                score += weight * tf * idf
         
         return score
+    
+    @classmethod
+    def from_stats(cls, doc_count: int, doc_freq: Dict[str, int]) -> 'TFIDF':
+        """
+        由汇总的统计量直接构造（用于分片打分时共享全局统计）
+        
+        Args:
+            doc_count: 候选文档总数
+            doc_freq: 查询词 -> 包含该词的候选文档数
+        """
+        ranker = cls.__new__(cls)
+        ranker.documents = []
+        ranker.doc_count = doc_count
+        ranker.idf_cache = {}
+        for token, freq in doc_freq.items():
+            ranker.idf_cache[token] = math.log(doc_count / (freq + 1))
+        return ranker
 
 
 class BM25:
@@ -109,7 +145,8 @@ class BM25:
             # BM25的IDF公式
             self.idf_cache[token] = math.log((self.doc_count - freq + 0.5) / (freq + 0.5) + 1.0)
     
-    def calculate_bm25(self, doc_tokens: List[str], query_tokens: List[str], doc_id: int = None) -> float:
+    def calculate_bm25(self, doc_tokens: List[str], query_tokens: List[str], doc_id: int = None,
+                       query_weights: Dict[str, float] = None) -> float:
         """
         计算BM25分数
         
@@ -117,6 +154,7 @@ class BM25:
             doc_tokens: 文档的分词结果
             query_tokens: 查询的分词结果
             doc_id: 文档ID（用于获取文档长度）
+            query_weights: 查询词权重（如模糊扩展词），缺省为1
             
         Returns:
             BM25分数
@@ -124,22 +162,63 @@ class BM25:
         if not doc_tokens or not query_tokens:
             return 0.0
         
-        doc_length = len(doc_tokens)
-        doc_token_freq = Counter(doc_tokens)
+        return self.calculate_bm25_from_freqs(Counter(doc_tokens), len(doc_tokens), query_tokens, query_weights)
+    
+    def calculate_bm25_from_freqs(self, term_freqs: Dict[str, int], doc_length: int, query_tokens: List[str],
+                                  query_weights: Dict[str, float] = None) -> float:
+        """
+        根据文档词频计算BM25分数（词频可直接取自倒排索引）
+        
+        Args:
+            term_freqs: 查询词在文档中的词频
+            doc_length: 文档长度（词数）
+            query_tokens: 查询的分词结果
+            query_weights: 查询词权重，缺省为1
+            
+        Returns:
+            BM25分数
+        """
+        if not doc_length or not query_tokens:
+            return 0.0
         
         score = 0.0
         for query_token in query_tokens:
-            if query_token in doc_token_freq:
+            if term_freqs.get(query_token):
                 # 词频
-                tf = doc_token_freq[query_token]
+                tf = term_freqs[query_token]
                 
                 # BM25公式
                 numerator = self.idf_cache.get(query_token, 0) * tf * (self.k1 + 1)
                 denominator = tf + self.k1 * (1 - self.b + self.b * (doc_length / max(self.avg_doc_length, 1)))
                 
-                score += numerator / max(denominator, 1)
+                weight = query_weights.get(query_token, 1.0) if query_weights else 1.0
+                score += weight * numerator / max(denominator, 1)
         
         return score
+    
+    @classmethod
+    def from_stats(cls, doc_count: int, avg_doc_length: float, doc_freq: Dict[str, int],
+                   k1: float = 1.5, b: float = 0.75) -> 'BM25':
+        """
+        由汇总的统计量直接构造（用于分片打分时共享全局统计）
+        
+        Args:
+            doc_count: 候选文档总数
+            avg_doc_length: 候选文档平均长度
+            doc_freq: 查询词 -> 包含该词的候选文档数
+            k1: 词频饱和度参数
+            b: 长度归一化参数
+        """
+        ranker = cls.__new__(cls)
+        ranker.documents = []
+        ranker.doc_count = doc_count
+        ranker.k1 = k1
+        ranker.b = b
+        ranker.avg_doc_length = avg_doc_length
+        ranker.idf_cache = {}
+        for token, freq in doc_freq.items():
+            ranker.idf_cache[token] = math.log((doc_count - freq + 0.5) / (freq + 0.5) + 1.0)
+        return ranker
 
 
 def calculate_title_weight(title_tokens: List[str], query_tokens: List[str]) -> float:
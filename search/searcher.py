@@ -2,8 +2,15 @@
 搜索引擎
 """
 import sys
+import json
+import time
+import heapq
+import base64
+import threading
+from array import array
+from collections import OrderedDict, Counter
 from pathlib import Path
-from typing import List, Dict, Tuple
+from typing import List, Dict, Tuple, Optional, Set, Iterator, Iterable
 import yaml
 
 sys.path.insert(0, str(Path(__file__).parent.parent))
@@ -12,6 +19,12 @@ from storage.hbase_client import HBaseClient
 from storage.data_model import Document
 from search.tokenizer import Tokenizer
 from search.ranking import TFIDF, BM25, calculate_title_weight
+from search.suggest import Suggester
+from search.fuzzy import BKTree, select_expansions, merge_expansions
+from search.segment import TextSegment
+from search.metrics import record_stage, paused as metrics_paused, QUERIES, CANDIDATES_SCORED, POSTINGS_DECODED, CACHE_HITS, CACHE_MISSES
+from search.profile import current_profile
+from search.deadline import deadline_exceeded, current_deadline
 
 
 class Searcher:
@@ -19,15 +32,19 @@ class Searcher:
     搜索引擎
     """
     
-    def __init__(self, hbase_client: HBaseClient = None):
+    def __init__(self, hbase_client: HBaseClient = None, partition: Tuple[int, int] = None,
+                 num_shards: int = None):
         """
         初始化搜索引擎
         
         Args:
             hbase_client: HBase客户端
+            partition: (分区编号, 分区总数)，集群模式下只加载属于本分区的文档
+            num_shards: 分片工作进程数，默认取配置中的shards
         """
         self.hbase_client = hbase_client or HBaseClient()
         self.tokenizer = Tokenizer()
+        self.partition = partition
         
         # 加载配置
         config_path = Path(__file__).parent.parent / 'config' / 'config.yaml'
@@ -36,14 +53,66 @@ class Searcher:
         
         search_config = config.get('search', {})
         self.ranking_algorithm = search_config.get('ranking_algorithm', 'bm25')
+        self.bm25_k1 = search_config.get('bm25_k1', 1.5)
+        self.bm25_b = search_config.get('bm25_b', 0.75)
         self.max_results = search_config.get('max_results', 50)
+        self.page_cache_size = search_config.get('page_cache_size', 256)
+        self.page_cache_pages = search_config.get('page_cache_pages', 5)
+        self.page_cache_max_candidates = search_config.get('page_cache_max_candidates', 100000)
+        self.suggest_query_weight = search_config.get('suggest_query_weight', 5.0)
+        self.suggest_query_log_path = search_config.get('suggest_query_log_path')
+        self.suggest_query_terms_max = search_config.get('suggest_query_terms_max', 10000)
+        self.fuzzy = search_config.get('fuzzy_enabled', False)
+        self.fuzzy_max_distance = search_config.get('fuzzy_max_distance', 2)
+        self.fuzzy_max_expansions = search_config.get('fuzzy_max_expansions', 5)
         
         # 加载索引数据
         self.documents: Dict[str, Document] = {}
-        self.doc_tokens: Dict[str, List[str]] = {}
+        self.title_tokens: Dict[str, List[str]] = {}
         self.inverted_index: Dict[str, Dict[str, int]] = {}
         
+        # 文档长度（词数）按序号存放；标题和正文拼接为只读文本段用于子串匹配
+        self.doc_lengths = array('I')
+        self.segment: Optional[TextSegment] = None
+        self.segment_dir = search_config.get('segment_dir')
+        self._tokens_built = False
+        # 构建分词、倒排索引和模糊索引时持有；构建分词时会在持有锁的情况下构建模糊索引
+        self._build_lock = threading.RLock()
+        
+        # 文档序号：序号 -> 文档ID，用于分页游标和排序时的稳定次序
+        self.doc_ids: List[str] = []
+        self.doc_ordinals: Dict[str, int] = {}
+        
+        # 分页缓存：(代数, 查询, 来源, 模糊, 分数, 序号) -> (剩余候选堆, 是否完整)，
+        # 每个堆最多保留若干页的候选，所有堆的候选总数有上限
+        self._page_cache: OrderedDict = OrderedDict()
+        self._page_cache_candidates = 0
+        self._page_cache_lock = threading.Lock()
+        
+        # 自动补全：按文档频率和查询频率加权
+        self.suggester = Suggester(top_n=search_config.get('suggest_top_n', 10))
+        self.query_term_counts: Counter = Counter()
+        self._query_terms_lock = threading.Lock()
+        
+        # 模糊匹配：基于词典构建的BK树
+        self.fuzzy_index: Optional[BKTree] = None
+        
+        # 来源网站列表，首次使用时计算
+        self._sources: Optional[List[str]] = None
+        
+        # 多次重试后仍加载失败时记录最后的错误，此时索引为空
+        self.load_error: Optional[Exception] = None
         self._load_index()
+        self._assign_ordinals()
+        # 索引代数，索引内容变化后旧的分页游标随之失效
+        self.generation = int(time.time() * 1000)
+        
+        # 分片并行：按文档序号区间划分给多个工作进程
+        self.num_shards = search_config.get('shards', 0) if num_shards is None else num_shards
+        self.shard_channels = search_config.get('shard_channels', 2)
+        self.shard_pool = None
+        if self.num_shards > 1:
+            self.start_shards(self.num_shards)
     
     def _load_index(self):
         """
@@ -51,61 +120,30 @@ class Searcher:
         """
         print("Loading index from storage...")
         
-        # 加载所有文档，带重试机制
-        import time
+        # 逐个读取文档加入索引；扫描中断时HBaseClient从断点继续，
+        # 多次失败后整体重试
         max_retries = 5
-        expected_min_docs = 20000  # 期望至少加载这么多文档
         
         for attempt in range(max_retries):
             try:
-                # 确保连接正常
                 if not self.hbase_client.use_hbase:
-                    print("HBase not available, using empty index")
-                    return
-                
-                if not self.hbase_client.connection:
-                    print("Reconnecting to HBase...")
-                    self.hbase_client.close()
-                    self.hbase_client = HBaseClient()
-                    time.sleep(2)
-                
-                print(f"Loading documents (attempt {attempt + 1}/{max_retries})...")
-                # 确保连接稳定
-                if not self.hbase_client.connection:
-                    print("Connection lost, reconnecting...")
-                    self.hbase_client._init_connection()
-                    time.sleep(1)
-                
-                all_docs = self.hbase_client.get_all_documents(limit=None)
-                print(f"get_all_documents returned {len(all_docs)} documents")
-                
-                if len(all_docs) < expected_min_docs:
-                    print(f"Warning: Only loaded {len(all_docs)} documents (expected at least {expected_min_docs}), retrying...")
-                    if attempt < max_retries - 1:
-                        time.sleep(3)
-                        # 重新初始化连接
-                        self.hbase_client.close()
-                        self.hbase_client = HBaseClient()
-                        continue
-                    else:
-                        print(f"Proceeding with {len(all_docs)} documents (less than expected)")
+                    print("HBase not available, loading documents from local storage")
+                else:
+                    print(f"Loading documents (attempt {attempt + 1}/{max_retries})...")
                 
-                # 成功加载，处理文档
-                print(f"Processing {len(all_docs)} documents into index...")
+                self.documents = {}
                 processed_count = 0
                 skipped_count = 0
-                for doc in all_docs:
+                for doc in self.hbase_client.iter_documents():
                     try:
-                        doc_id = self._generate_doc_id(doc.url)
-                        self.documents[doc_id] = doc
+                        self._add_document(doc)
                         processed_count += 1
                     except Exception as e:
                         print(f"Warning: Failed to process document {doc.url}: {e}")
                         skipped_count += 1
                         continue
-
-                print(f"Document processing complete: {processed_count} processed, {skipped_count} skipped")
                 
+                print(f"Document processing complete: {processed_count} processed, {skipped_count} skipped")
                 print(f"Successfully loaded {len(self.documents)} documents into search index")
                 break  # 成功则退出
             except Exception as e:
@@ -114,14 +152,10 @@ class Searcher:
                 traceback.print_exc()
                 if attempt < max_retries - 1:
                     time.sleep(3)
-                    try:
-                        self.hbase_client.close()
-                    except:
-                        pass
-                    self.hbase_client = HBaseClient()
                 else:
                     print("Failed to load documents after all retries")
                     self.documents = {}  # 初始化为空，避免后续错误
+                    self.load_error = e
     
     def _generate_doc_id(self, url: str) -> str:
         """
@@ -130,27 +164,252 @@ class Searcher:
         import hashlib
         return hashlib.md5(url.encode()).hexdigest()
     
+    def _add_document(self, doc: Document):
+        """
+        将文档加入索引（集群模式下跳过不属于本分区的文档）
+        """
+        doc_id = self._generate_doc_id(doc.url)
+        if self.partition:
+            index, count = self.partition
+            if int(doc_id[:8], 16) % count != index:
+                return
+        self.documents[doc_id] = doc
+    
+    def start_shards(self, num_shards: int):
+        """
+        启动分片工作进程
+        
+        需在索引构建完成后调用：工作进程fork自当前进程，
+        与主进程共享同一份内存中的索引（写时复制）
+        """
+        from search.shards import ShardPool
+        
+        self.warm()
+        self.shard_pool = ShardPool(self, num_shards, self.shard_channels)
+        print(f"Started {num_shards} search shards x {self.shard_channels} groups")
+    
+    def stop_shards(self):
+        """
+        停止分片工作进程
+        """
+        if self.shard_pool is not None:
+            self.shard_pool.close()
+            self.shard_pool = None
+    
+    def close(self):
+        """
+        释放索引占用的资源（分片进程、文本段映射）
+        
+        关闭后不能再用于查询
+        """
+        self.stop_shards()
+        if self.segment is not None:
+            self.segment.close()
+    
+    def _assign_ordinals(self):
+        """
+        为已加载的文档分配序号
+        """
+        self.doc_ids = list(self.documents.keys())
+        self.doc_ordinals = {doc_id: i for i, doc_id in enumerate(self.doc_ids)}
+    
     def _build_doc_tokens(self):
         """
-        构建文档分词结果（如果还没有）
+        构建文档分词结果、倒排索引和文本段（如果还没有）
+        
+        文档的完整分词结果只在构建倒排索引时使用，不再常驻内存；
+        词用sys.intern去重，所有文档共享同一份词对象
         """
-        if not self.doc_tokens:
+        if self._tokens_built:
+            return
+        
+        with self._build_lock:
+            if self._tokens_built:
+                return
+            
             print("Building document tokens...")
-            # 使用 list() 创建副本，避免在遍历时修改字典
-            doc_items = list(self.documents.items())
-            for doc_id, doc in doc_items:
-                title_tokens = self.tokenizer.tokenize_title(doc.title)
-                content_tokens = self.tokenizer.tokenize_content(doc.content)
-                self.doc_tokens[doc_id] = title_tokens + content_tokens
+            doc_lengths = array('I')
+            
+            def texts():
+                # 分词与写入文本段在同一遍中完成，压缩保存的正文每个文档只解压一次
+                for doc_id in self.doc_ids:
+                    doc = self.documents[doc_id]
+                    content = doc.content
+                    title_tokens = [sys.intern(t) for t in self.tokenizer.tokenize_title(doc.title)]
+                    content_tokens = [sys.intern(t) for t in self.tokenizer.tokenize_content(content)]
+                    self.title_tokens[doc_id] = title_tokens
+                    doc_lengths.append(len(title_tokens) + len(content_tokens))
+                    
+                    # 构建倒排索引：词 -> {文档ID: 词频}
+                    for token, freq in Counter(title_tokens + content_tokens).items():
+                        self.inverted_index.setdefault(token, {})[doc_id] = freq
+                    yield doc.title, content
+            
+            segment_dir = self.segment_dir
+            if segment_dir and not Path(segment_dir).is_absolute():
+                segment_dir = str(Path(__file__).parent.parent / segment_dir)
+            self.segment = TextSegment.build(texts(), segment_dir)
+            self.doc_lengths = doc_lengths
             print("Document tokens built")
+            
+            self.build_suggester()
+            if self.fuzzy:
+                self.build_fuzzy_index()
+            self._tokens_built = True
+    
+    def warm(self):
+        """
+        预先构建查询所需的全部索引结构
+        
+        多进程服务时在fork工作进程之前调用，使索引只构建一次并由各进程共享
+        """
+        self._build_doc_tokens()
+        if self.fuzzy:
+            self.build_fuzzy_index()
+    
+    def warm_queries(self, queries: Iterable[str]):
+        """
+        重放查询，让文本段页面和分词缓存提前就绪；不计入查询指标
+        """
+        self._build_doc_tokens()
+        with metrics_paused():
+            for query in queries:
+                try:
+                    self._score_query(query, self.fuzzy, self.max_results)
+                except Exception as e:
+                    print(f"Warning: failed to warm query {query!r}: {e}")
+    
+    def build_suggester(self):
+        """
+        根据词典和查询日志构建自动补全索引
+        """
+        if self.suggest_query_log_path and not self.query_term_counts:
+            self._load_query_log(self.suggest_query_log_path)
+        
+        term_weights = {}
+        for term, postings in self.inverted_index.items():
+            term_weights[term] = len(postings) + self.suggest_query_weight * self.query_term_counts.get(term, 0)
+        self.suggester.build(term_weights)
+        print(f"Suggester built with {len(self.suggester)} terms")
+    
+    def build_fuzzy_index(self):
+        """
+        根据词典构建模糊匹配用的BK树（如果还没有）
+        
+        多个查询线程同时首次用到模糊匹配时只构建一次
+        """
+        if self.fuzzy_index is not None:
+            return
+        with self._build_lock:
+            if self.fuzzy_index is not None:
+                return
+            print("Building fuzzy term index...")
+            self.fuzzy_index = BKTree(self.inverted_index.keys())
+            print(f"Fuzzy term index built with {len(self.fuzzy_index)} terms")
+    
+    def _fuzzy_candidates(self, token: str) -> List[Tuple[str, int, int]]:
+        """
+        查找词典中与查询词编辑距离相近的词
+        
+        Returns:
+            (词, 编辑距离, 文档频率) 列表
+        """
+        # 允许的编辑次数随词长增加：两个字以内的词（如中文双字词）改一个字就成了无关的词，不做扩展；
+        # 三到四个字符只允许一次编辑
+        if len(token) <= 2:
+            return []
+        max_distance = self.fuzzy_max_distance if len(token) > 4 else 1
+        
+        self.build_fuzzy_index()
+        return [(term, distance, len(self.inverted_index.get(term, {})))
+                for term, distance in self.fuzzy_index.search(token, max_distance)]
+    
+    def _expand_fuzzy(self, token: str) -> Dict[str, float]:
+        """
+        将未命中的查询词扩展为词典中编辑距离相近的词
+        
+        Returns:
+            扩展词 -> 权重，距离越大权重越低，数量不超过fuzzy_max_expansions
+        """
+        return select_expansions(self._fuzzy_candidates(token), self.fuzzy_max_expansions)
+    
+    def _load_query_log(self, path: str):
+        """
+        从查询日志（每行一个查询）加载历史查询频率
+        """
+        log_path = Path(path)
+        if not log_path.is_absolute():
+            log_path = Path(__file__).parent.parent / log_path
+        if not log_path.exists():
+            return
+        
+        with open(log_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                self.record_query(line.strip())
+    
+    def record_query(self, query: str):
+        """
+        记录查询，用于自动补全的查询频率权重
+        """
+        if query:
+            self._count_query_terms(self.tokenizer.tokenize(query))
     
-    def search(self, query: str, max_results: int = None) -> List[Tuple[Document, float]]:
+    def _count_query_terms(self, tokens: List[str]):
+        """
+        累计查询词的频率
+        
+        词数超过suggest_query_terms_max时所有计数减半并丢弃减为0的词：
+        常用的查询词保留，只出现过一两次的词（包括随意输入的内容）被淘汰，内存占用有上限
+        """
+        with self._query_terms_lock:
+            counts = self.query_term_counts
+            counts.update(tokens)
+            while len(counts) > self.suggest_query_terms_max:
+                counts = Counter({term: count // 2 for term, count in counts.items() if count > 1})
+            self.query_term_counts = counts
+    
+    def query_terms_snapshot(self) -> Counter:
+        """
+        当前查询频率的副本，重新加载索引时由新一代沿用
+        """
+        with self._query_terms_lock:
+            return self.query_term_counts.copy()
+    
+    def suggest(self, prefix: str, limit: int = None) -> List[str]:
+        """
+        前缀自动补全
+        
+        Args:
+            prefix: 输入前缀
+            limit: 返回数量
+            
+        Returns:
+            补全词列表
+        """
+        self._build_doc_tokens()
+        # 只补全最后一个词，前面已输入的部分原样保留
+        head, _, last = prefix.rpartition(' ')
+        completions = self.suggester.suggest(last, limit)
+        if head.strip():
+            return [f"{head} {term}" for term in completions]
+        return completions
+    
+    def sources(self) -> List[str]:
+        """
+        获取索引中所有来源网站，按字母序排列
+        """
+        if self._sources is None:
+            self._sources = sorted(set(doc.source for doc in self.documents.values() if doc.source))
+        return self._sources
+    
+    def search(self, query: str, max_results: int = None, fuzzy: bool = None) -> List[Tuple[Document, float]]:
         """
         搜索文档
         
         Args:
             query: 查询字符串
             max_results: 最大结果数量
+            fuzzy: 是否对未命中的查询词做模糊扩展，缺省使用配置
             
         Returns:
             (文档, 分数) 列表，按分数降序排列
@@ -160,95 +419,457 @@ class Searcher:
         
         max_results = max_results or self.max_results
         
+        # 只取前max_results个结果，无需对全部候选排序
+        top = self._score_query(query, fuzzy, k=max_results, record=True)
+        
+        start = time.perf_counter()
+        results = [(self.documents[self.doc_ids[ordinal]], -neg_score) for neg_score, ordinal in top]
+        record_stage('hydrate', start)
+        self._profile_hydrated(len(results))
+        return results
+    
+    def iter_search(self, query: str, max_results: int = None, fuzzy: bool = None,
+                    source: str = None) -> Iterator[Tuple[Document, float]]:
+        """
+        按分数降序逐个产出搜索结果
+        
+        候选打分后只建堆，不排序也不预先取出文档，每产出一个结果才弹出一个堆顶，
+        首个结果的延迟和调用方的内存占用与结果数量无关。
+        
+        Args:
+            query: 查询字符串
+            max_results: 最大结果数量，为None时产出全部结果
+            fuzzy: 是否启用模糊扩展，缺省使用配置
+            source: 来源网站过滤
+            
+        Yields:
+            (文档, 分数)
+        """
+        if not query or not query.strip():
+            return
+        
+        heap = self._score_query(query, fuzzy, record=True)
+        heapq.heapify(heap)
+        
+        count = 0
+        while heap and (max_results is None or count < max_results):
+            neg_score, ordinal = heapq.heappop(heap)
+            doc = self.documents[self.doc_ids[ordinal]]
+            if source and source not in doc.source:
+                continue
+            count += 1
+            yield doc, -neg_score
+    
+    def search_many(self, queries: List[str], max_results: int = None,
+                    fuzzy: bool = None) -> Iterator[Tuple[str, List[Tuple[Document, float]]]]:
+        """
+        批量搜索
+        
+        同一批查询只分词一次，相同的查询词只查找一次命中文档（倒排列表和复合词匹配），
+        再对每个查询分别打分。结果按查询逐个产出，调用方可边算边返回。
+        
+        Args:
+            queries: 查询字符串列表
+            max_results: 每个查询的最大结果数量
+            fuzzy: 是否启用模糊扩展，缺省使用配置
+            
+        Yields:
+            (查询字符串, (文档, 分数) 列表)，顺序与queries一致
+        """
+        max_results = max_results or self.max_results
+        if fuzzy is None:
+            fuzzy = self.fuzzy
+        
+        self._build_doc_tokens()
+        
+        # 相同查询只分词一次
+        start = time.perf_counter()
+        query_tokens_map = {}
+        for query in queries:
+            if query and query.strip() and query not in query_tokens_map:
+                query_tokens_map[query] = self.tokenizer.tokenize(query)
+        record_stage('tokenize', start)
+        
+        term_cache: Dict[str, Set[int]] = {}
+        for query in queries:
+            query_tokens = query_tokens_map.get(query)
+            if not query_tokens:
+                yield query, []
+                continue
+            
+            QUERIES.inc()
+            if self.shard_pool is not None:
+                top = self.shard_pool.score(query_tokens, fuzzy, max_results)
+            else:
+                start = time.perf_counter()
+                candidates, matched = self._match_candidates(query_tokens, term_cache=term_cache)
+                query_tokens, query_weights = self._expand_query(query_tokens, matched, fuzzy)
+                if query_weights:
+                    candidates = candidates | self._posting_candidates(query_weights.keys())
+                record_stage('candidates', start)
+                if not candidates:
+                    yield query, []
+                    continue
+                stats = self._collect_stats(candidates, query_tokens)
+                top = self._rank_candidates(candidates, query_tokens, query_weights, stats, max_results)
+            
+            start = time.perf_counter()
+            results = [(self.documents[self.doc_ids[ordinal]], -neg_score) for neg_score, ordinal in top]
+            record_stage('hydrate', start)
+            self._profile_hydrated(len(results))
+            yield query, results
+    
+    def search_page(self, query: str, page_size: int = None, cursor: str = None,
+                    source: str = None, fuzzy: bool = None) -> Tuple[List[Tuple[Document, float]], Optional[str]]:
+        """
+        分页搜索
+        
+        游标记录上一页最后一个结果的(分数, 文档序号)边界和索引代数，
+        下一页从该边界继续取top-k。上一页剩余候选中排在前面的page_cache_pages页会被缓存，
+        命中缓存时无需重新打分；翻过缓存的页数后重新打分，再缓存之后的几页。
+        
+        Args:
+            query: 查询字符串
+            page_size: 每页结果数量
+            cursor: 上一页返回的游标，为空表示第一页
+            source: 来源网站过滤
+            fuzzy: 是否启用模糊扩展，缺省使用配置
+            
+        Returns:
+            ((文档, 分数) 列表, 下一页游标)，没有更多结果时游标为None
+        """
+        if not query or not query.strip():
+            return [], None
+        
+        page_size = page_size or self.max_results
+        source = source or ''
+        fuzzy = self.fuzzy if fuzzy is None else fuzzy
+        
+        boundary = None
+        if cursor:
+            generation, boundary = self._decode_cursor(cursor)
+            if generation != self.generation:
+                raise ValueError("分页游标已过期，索引已更新，请重新搜索")
+        
+        heap = None
+        complete = True
+        if boundary is not None:
+            with self._page_cache_lock:
+                entry = self._page_cache.pop((self.generation, query, source, fuzzy) + boundary, None)
+                if entry is not None:
+                    self._page_cache_candidates -= len(entry[0])
+            # 截断过的堆至少要能填满这一页并判断后面是否还有结果
+            if entry is not None and (entry[1] or len(entry[0]) > page_size):
+                heap, complete = entry
+            (CACHE_MISSES if heap is None else CACHE_HITS).labels('page').inc()
+        
+        if heap is None:
+            # 只有第一页计入查询频率
+            heap = self._score_query(query, fuzzy, record=not cursor)
+            start = time.perf_counter()
+            if source:
+                heap = [item for item in heap
+                        if source in self.documents[self.doc_ids[item[1]]].source]
+            if boundary is not None:
+                # 只保留排在边界之后的候选
+                heap = [item for item in heap if item > boundary]
+            heapq.heapify(heap)
+        else:
+            start = time.perf_counter()
+        
+        page = []
+        while heap and len(page) < page_size:
+            page.append(heapq.heappop(heap))
+        start = record_stage('topk', start)
+        
+        results = [(self.documents[self.doc_ids[ordinal]], -neg_score) for neg_score, ordinal in page]
+        record_stage('hydrate', start)
+        self._profile_hydrated(len(results))
+        if not heap or not page:
+            return results, None
+        
+        last = page[-1]
+        deadline = current_deadline()
+        if deadline is not None and deadline.partial:
+            # 不完整的候选堆不缓存，下一页重新计算
+            return results, self._encode_cursor(self.generation, last)
+        
+        # 只缓存之后几页的候选，深翻页时不为每个游标保留整个候选集
+        limit = self.page_cache_pages * page_size
+        if len(heap) > limit:
+            heap, complete = heapq.nsmallest(limit, heap), False
+        if len(heap) <= self.page_cache_max_candidates:
+            with self._page_cache_lock:
+                self._page_cache[(self.generation, query, source, fuzzy) + last] = (heap, complete)
+                self._page_cache_candidates += len(heap)
+                while (len(self._page_cache) > self.page_cache_size
+                       or self._page_cache_candidates > self.page_cache_max_candidates):
+                    _, (evicted, _) = self._page_cache.popitem(last=False)
+                    self._page_cache_candidates -= len(evicted)
+        
+        return results, self._encode_cursor(self.generation, last)
+    
+    @staticmethod
+    def _profile_hydrated(count: int):
+        profile = current_profile()
+        if profile is not None:
+            profile.count('hydrated', count)
+    
+    def _encode_cursor(self, generation: int, boundary: Tuple[float, int]) -> str:
+        """
+        生成不透明的分页游标
+        """
+        payload = json.dumps({'g': generation, 's': boundary[0], 'o': boundary[1]})
+        return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+    
+    def _decode_cursor(self, cursor: str) -> Tuple[int, Tuple[float, int]]:
+        """
+        解析分页游标
+        """
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+            return int(payload['g']), (float(payload['s']), int(payload['o']))
+        except Exception:
+            raise ValueError("无效的分页游标")
+    
+    def _score_query(self, query: str, fuzzy: bool = None, k: int = None,
+                     record: bool = False) -> List[Tuple[float, int]]:
+        """
+        对查询的候选文档打分
+        
+        Args:
+            query: 查询字符串
+            fuzzy: 是否对未命中的查询词做模糊扩展，缺省使用配置
+            k: 只返回前k个结果，缺省返回全部候选
+            record: 将查询词计入自动补全的查询频率（沿用这里的分词结果，不再单独分词）
+            
+        Returns:
+            (负分数, 文档序号) 列表，元组自然序即结果排序；给定k时已排好序
+        """
+        # 构建文档分词结果
+        self._build_doc_tokens()
+        
         # 分词
+        start = time.perf_counter()
         query_tokens = self.tokenizer.tokenize(query)
+        start = record_stage('tokenize', start)
         if not query_tokens:
             return []
+        if record:
+            self._count_query_terms(query_tokens)
         
-        # 构建文档分词结果
-        self._build_doc_tokens()
+        QUERIES.inc()
+        profile = current_profile()
+        if profile is not None:
+            profile.tokens = list(query_tokens)
+        if fuzzy is None:
+            fuzzy = self.fuzzy
+        
+        # 分片模式：由各分片进程并行打分后归并
+        if self.shard_pool is not None:
+            return self.shard_pool.score(query_tokens, fuzzy, k)
+        return self._score_local(query_tokens, fuzzy, k)
+    
+    def _score_local(self, query_tokens: List[str], fuzzy: bool, k: int = None) -> List[Tuple[float, int]]:
+        """
+        在本进程内对已分词的查询打分（不使用分片），返回值同_score_query
+        """
+        start = time.perf_counter()
+        profile = current_profile()
         
         # 找到包含查询词的文档
-        candidate_docs = set()
-        for token in query_tokens:
-            found = False
-            # 从倒排索引查找（如果已加载）
-            if token in self.inverted_index:
-                candidate_docs.update(self.inverted_index[token].keys())
-                found = True
-
-            # 即使有倒排索引，也要检查复合词匹配
-            # 遍历所有文档，检查是否包含查询词（作为子串）
-            # 使用 list() 创建副本，避免在遍历时修改字典
-            doc_tokens_items = list(self.doc_tokens.items())
-            for doc_id, tokens in doc_tokens_items:
-                doc = self.documents.get(doc_id)
-                if not doc:
-                    continue
-                # 检查标题和内容是否包含查询词
-                if (token in doc.title or token in doc.content or
-                    any(token in doc_token for doc_token in tokens)):
-                    candidate_docs.add(doc_id)
+        candidates, matched = self._match_candidates(query_tokens)
+        query_tokens, query_weights = self._expand_query(query_tokens, matched, fuzzy)
+        if query_weights:
+            candidates |= self._posting_candidates(query_weights.keys())
+        record_stage('candidates', start)
+        if profile is not None:
+            profile.count('candidates', len(candidates))
+            if query_weights:
+                profile.count('expansions', len(query_weights))
         
-        if not candidate_docs:
+        if not candidates:
             return []
         
-        # 计算相关性分数
-        scores = []
+        stats = self._collect_stats(candidates, query_tokens)
+        return self._rank_candidates(candidates, query_tokens, query_weights, stats, k)
+    
+    def _ordinal_range(self, lo: int = 0, hi: int = None) -> Tuple[int, int]:
+        """
+        规范化文档序号区间[lo, hi)
+        """
+        return lo, len(self.doc_ids) if hi is None else hi
+    
+    def _match_candidates(self, query_tokens: List[str], lo: int = 0, hi: int = None,
+                          term_cache: Dict[str, Set[int]] = None) -> Tuple[Set[int], Set[str]]:
+        """
+        在文档序号区间[lo, hi)内查找包含查询词的文档
+        
+        Args:
+            query_tokens: 查询词
+            lo, hi: 文档序号区间
+            term_cache: 词 -> 命中文档集合的缓存，批量查询时在多个查询间共享
+        
+        Returns:
+            (候选文档序号集合, 命中了文档的查询词集合)
+        """
+        candidates = set()
+        matched = set()
+        for token in query_tokens:
+            # 超过截止时间后不再查找剩余的查询词，至少处理第一个词
+            if candidates and deadline_exceeded():
+                break
+            if term_cache is not None and token in term_cache:
+                token_candidates = term_cache[token]
+                CACHE_HITS.labels('term').inc()
+            else:
+                token_candidates = self._match_token(token, lo, hi)
+                if term_cache is not None:
+                    term_cache[token] = token_candidates
+                    CACHE_MISSES.labels('term').inc()
+            
+            if token_candidates:
+                candidates |= token_candidates
+                matched.add(token)
+        
+        return candidates, matched
+    
+    def _match_token(self, token: str, lo: int = 0, hi: int = None) -> Set[int]:
+        """
+        在文档序号区间[lo, hi)内查找包含单个查询词的文档
+        """
+        lo, hi = self._ordinal_range(lo, hi)
         
-        # 准备文档数据用于排序算法
-        doc_list = []
-        for doc_id in candidate_docs:
-            doc = self.documents[doc_id]
-            tokens = self.doc_tokens[doc_id]
-            doc_list.append({
-                'doc_id': doc_id,
-                'doc': doc,
-                'tokens': tokens
-            })
-        
-        # 使用TF-IDF或BM25计算分数
+        # 从倒排索引查找
+        candidates = self._posting_candidates([token], lo, hi)
+        
+        # 即使有倒排索引，也要检查复合词匹配：标题或内容包含查询词（作为子串）。
+        # 分词结果都是标题或内容的子串，无需再逐个检查文档的分词
+        profile = current_profile()
+        start = time.perf_counter() if profile is not None else 0.0
+        matches = self.segment.find(token, lo, hi)
+        if profile is not None:
+            profile.term(token, 'substring_matches', len(matches))
+            profile.term(token, 'substring_seconds', time.perf_counter() - start)
+        candidates |= matches
+        
+        return candidates
+    
+    def _posting_candidates(self, terms, lo: int = 0, hi: int = None) -> Set[int]:
+        """
+        取词的倒排列表中位于文档序号区间[lo, hi)内的文档
+        """
+        lo, hi = self._ordinal_range(lo, hi)
+        candidates = set()
+        decoded = 0
+        profile = current_profile()
+        for term in terms:
+            postings = self.inverted_index.get(term, {})
+            decoded += len(postings)
+            if profile is not None:
+                profile.term(term, 'postings', len(postings))
+            for doc_id in postings:
+                ordinal = self.doc_ordinals[doc_id]
+                if lo <= ordinal < hi:
+                    candidates.add(ordinal)
+        POSTINGS_DECODED.inc(decoded)
+        return candidates
+    
+    def _expand_query(self, query_tokens: List[str], matched: Set[str],
+                      fuzzy: bool) -> Tuple[List[str], Dict[str, float]]:
+        """
+        对未命中的查询词做模糊扩展
+        
+        Returns:
+            (扩展后的查询词列表, 扩展词 -> 权重)
+        """
+        query_weights = {}
+        if not fuzzy or deadline_exceeded():
+            return query_tokens, query_weights
+        
+        # 未命中的查询词扩展为词典中的近似词，只取倒排索引中的文档
+        expansions = {token: self._expand_fuzzy(token) for token in query_tokens if token not in matched}
+        return merge_expansions(query_tokens, expansions)
+    
+    def _collect_stats(self, candidates: Set[int], query_tokens: List[str]) -> Dict:
+        """
+        统计候选文档集合上的打分所需统计量，各分片的统计量可直接相加
+        
+        Returns:
+            {'doc_count': 候选文档数, 'total_length': 候选文档总词数,
+             'doc_freq': {查询词: 包含该词的候选文档数}}
+        """
+        doc_freq = {}
+        for token in set(query_tokens):
+            postings = self.inverted_index.get(token, {})
+            doc_freq[token] = sum(1 for doc_id in postings if self.doc_ordinals[doc_id] in candidates)
+        
+        return {
+            'doc_count': len(candidates),
+            'total_length': sum(self.doc_lengths[ordinal] for ordinal in candidates),
+            'doc_freq': doc_freq
+        }
+    
+    @staticmethod
+    def _merge_stats(stats_list: List[Dict]) -> Dict:
+        """
+        合并各分片的统计量
+        """
+        merged = {'doc_count': 0, 'total_length': 0, 'doc_freq': Counter()}
+        for stats in stats_list:
+            merged['doc_count'] += stats['doc_count']
+            merged['total_length'] += stats['total_length']
+            merged['doc_freq'].update(stats['doc_freq'])
+        merged['doc_freq'] = dict(merged['doc_freq'])
+        return merged
+    
+    def _rank_candidates(self, candidates: Set[int], query_tokens: List[str], query_weights: Dict[str, float],
+                         stats: Dict, k: int = None) -> List[Tuple[float, int]]:
+        """
+        用（全局）统计量对候选文档打分
+        
+        Returns:
+            (负分数, 文档序号) 列表；给定k时只返回排好序的前k个
+        """
+        # 使用TF-IDF或BM25计算分数，词频直接取自倒排索引
         if self.ranking_algorithm == 'bm25':
-            ranker = BM25(doc_list)
-            for item in doc_list:
-                doc_id = item['doc_id']
-                doc = item['doc']
-                tokens = item['tokens']
-                
-                # 计算BM25分数
-                score = ranker.calculate_bm25(tokens, query_tokens)
-                
-                # 标题权重
-                title_tokens = self.tokenizer.tokenize_title(doc.title)
-                title_weight = calculate_title_weight(title_tokens, query_tokens)
-                score *= title_weight
-                
-                scores.append((doc, score))
+            avg_doc_length = stats['total_length'] / max(stats['doc_count'], 1)
+            ranker = BM25.from_stats(stats['doc_count'], avg_doc_length, stats['doc_freq'],
+                                     k1=self.bm25_k1, b=self.bm25_b)
+            score_freqs = ranker.calculate_bm25_from_freqs
         else:
-            # 使用TF-IDF
-            ranker = TFIDF(doc_list)
-            for item in doc_list:
-                doc_id = item['doc_id']
-                doc = item['doc']
-                tokens = item['tokens']
-                
-                # 计算TF-IDF分数
-                score = ranker.calculate_tfidf(tokens, query_tokens)
-                
-                # 标题权重
-                title_tokens = self.tokenizer.tokenize_title(doc.title)
-                title_weight = calculate_title_weight(title_tokens, query_tokens)
-                score *= title_weight
-                
-                scores.append((doc, score))
+            ranker = TFIDF.from_stats(stats['doc_count'], stats['doc_freq'])
+            score_freqs = ranker.calculate_tfidf_from_freqs
         
-        # 按分数排序
-        scores.sort(key=lambda x: x[1], reverse=True)
+        start = time.perf_counter()
+        postings = {token: self.inverted_index.get(token, {}) for token in set(query_tokens)}
+        scores = []
+        for i, ordinal in enumerate(candidates):
+            # 每打分256个候选检查一次截止时间，到期后用已打分的候选返回结果
+            if not i & 255 and i and deadline_exceeded():
+                break
+            doc_id = self.doc_ids[ordinal]
+            term_freqs = {token: p[doc_id] for token, p in postings.items() if doc_id in p}
+            score = score_freqs(term_freqs, self.doc_lengths[ordinal], query_tokens, query_weights)
+            
+            # 标题权重
+            title_weight = calculate_title_weight(self.title_tokens[doc_id], query_tokens)
+            score *= title_weight
+            
+            scores.append((-score, ordinal))
+        start = record_stage('scoring', start)
+        CANDIDATES_SCORED.inc(len(scores))
+        profile = current_profile()
+        if profile is not None:
+            profile.count('scored', len(scores))
         
-        # 返回前max_results个结果
-        return scores[:max_results]
+        if k is not None:
+            scores = heapq.nsmallest(k, scores)
+            record_stage('topk', start)
+        return scores
     
-    def search_by_source(self, query: str, source: str, max_results: int = None) -> List[Tuple[Document, float]]:
+    def search_by_source(self, query: str, source: str, max_results: int = None,
+                         fuzzy: bool = None) -> List[Tuple[Document, float]]:
         """
         按来源搜索
         
@@ -256,11 +877,12 @@ class Searcher:
             query: 查询字符串
             source: 来源网站
             max_results: 最大结果数量
+            fuzzy: 是否启用模糊扩展，缺省使用配置
             
         Returns:
             (文档, 分数) 列表
         """
-        results = self.search(query, max_results=None)
+        results = self.search(query, max_results=None, fuzzy=fuzzy)
         filtered = [(doc, score) for doc, score in results if source in doc.source]
         max_results = max_results or self.max_results
         return filtered[:max_results]
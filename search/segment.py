@@ -0,0 +1,124 @@
+"""
+只读文本段：所有文档的标题和正文按文档序号顺序拼接存放，用于子串匹配
+"""
+import os
+import mmap
+import tempfile
+from array import array
+from bisect import bisect_right
+from typing import Iterable, Set, Tuple
+
+
+class TextSegment:
+    """
+    只读文本段
+
+    每篇文档按 标题\\0正文\\0 的形式以UTF-8编码顺序写入一个文件并以mmap只读映射，
+    offsets记录每篇文档的起始位置。查询词的子串匹配在整个段上用find完成，
+    不再逐篇访问Python对象；多个工作进程共享同一份页缓存，不产生写时复制。
+    查询词不含\\0，因此匹配不会跨越标题与正文或相邻文档的边界。
+    """
+
+    SEPARATOR = b'\x00'
+
+    def __init__(self, data, offsets: array):
+        """
+        Args:
+            data: 段内容（mmap或bytes）
+            offsets: 文档起始位置，长度为文档数+1
+        """
+        self.data = data
+        self.offsets = offsets
+
+    @classmethod
+    def build(cls, texts: Iterable[Tuple[str, str]], directory: str = None) -> 'TextSegment':
+        """
+        构建文本段
+
+        Args:
+            texts: 按文档序号排列的(标题, 正文)
+            directory: 段文件目录；为空时保存在内存中
+
+        Returns:
+            文本段
+        """
+        offsets = array('Q', [0])
+
+        if directory is None:
+            chunks = []
+            position = 0
+            for title, content in texts:
+                record = cls._encode_record(title, content)
+                chunks.append(record)
+                position += len(record)
+                offsets.append(position)
+            return cls(b''.join(chunks), offsets)
+
+        os.makedirs(directory, exist_ok=True)
+        fd, path = tempfile.mkstemp(prefix='corpus-', suffix='.seg', dir=directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                position = 0
+                for title, content in texts:
+                    record = cls._encode_record(title, content)
+                    f.write(record)
+                    position += len(record)
+                    offsets.append(position)
+
+            if position == 0:
+                return cls(b'', offsets)
+
+            with open(path, 'rb') as f:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        finally:
+            # 映射建立后即可删除文件，映射在所有进程关闭前一直有效
+            os.unlink(path)
+
+        return cls(data, offsets)
+
+    @classmethod
+    def _encode_record(cls, title: str, content: str) -> bytes:
+        return (title or '').encode('utf-8', 'surrogatepass') + cls.SEPARATOR + \
+            (content or '').encode('utf-8', 'surrogatepass') + cls.SEPARATOR
+
+    def find(self, token: str, lo: int = 0, hi: int = None) -> Set[int]:
+        """
+        查找标题或正文中包含token的文档
+
+        Args:
+            token: 查询词
+            lo, hi: 文档序号区间[lo, hi)
+
+        Returns:
+            文档序号集合
+        """
+        if hi is None:
+            hi = len(self.offsets) - 1
+        if not token or '\x00' in token or lo >= hi:
+            return set()
+
+        needle = token.encode('utf-8', 'surrogatepass')
+        end = self.offsets[hi]
+        position = self.offsets[lo]
+        result = set()
+        while True:
+            position = self.data.find(needle, position, end)
+            if position < 0:
+                break
+            ordinal = bisect_right(self.offsets, position) - 1
+            result.add(ordinal)
+            # 跳到下一篇文档，每篇文档只需命中一次
+            position = self.offsets[ordinal + 1]
+        return result
+
+    def close(self):
+        """
+        释放映射
+        """
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        self.data = b''
+        self.offsets = array('Q', [0])
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
@@ -0,0 +1,257 @@
+"""
+分片并行查询
+"""
+import atexit
+import heapq
+import itertools
+import multiprocessing
+import queue
+import time
+from typing import List, Tuple
+
+from search.metrics import record_stage, paused as metrics_paused, CANDIDATES_SCORED
+from search.profile import current_profile
+from search.deadline import Deadline, current_deadline, deadline_scope
+
+# 等待分片回复的期限：查询截止时间之后再宽限的秒数；查询没有截止时间时的上限
+_REPLY_GRACE = 1.0
+_REPLY_TIMEOUT = 30.0
+
+
+def _shard_main(searcher, lo: int, hi: int, conn):
+    """
+    分片工作进程主循环
+
+    进程fork自主进程，直接使用继承来的索引，只负责文档序号区间[lo, hi)。
+    一次查询分两到三步：match（查找候选并返回局部统计量）、
+    expand（加入模糊扩展词的候选，可选）、score（用全局统计量打分并返回局部top-k）。
+    每个请求带主进程查询的截止时间（time.monotonic()绝对值，各进程共用同一时钟），
+    回复中标明结果是否因到期而不完整。
+
+    fork时主进程的其它线程可能正持有指标的锁，子进程中这些锁永远不会释放；
+    分片进程的指标本来就不回传，整个进程内暂停记录，不会去获取这些锁
+    """
+    with metrics_paused():
+        _shard_loop(searcher, lo, hi, conn)
+    conn.close()
+
+
+def _shard_loop(searcher, lo: int, hi: int, conn):
+    candidates = set()
+    while True:
+        try:
+            op, args, expires = conn.recv()
+        except EOFError:
+            break
+
+        if op == 'close':
+            break
+
+        deadline = Deadline.at(expires) if expires is not None else None
+        try:
+            with deadline_scope(deadline):
+                if op == 'match':
+                    query_tokens, = args
+                    candidates, matched = searcher._match_candidates(query_tokens, lo, hi)
+                    result = (matched, searcher._collect_stats(candidates, query_tokens))
+                elif op == 'expand':
+                    query_tokens, extra_terms = args
+                    candidates |= searcher._posting_candidates(extra_terms, lo, hi)
+                    result = searcher._collect_stats(candidates, query_tokens)
+                elif op == 'score':
+                    query_tokens, query_weights, stats, k = args
+                    result = searcher._rank_candidates(candidates, query_tokens, query_weights, stats, k)
+                    candidates = set()
+                else:
+                    raise ValueError(f"Unknown shard operation: {op}")
+            conn.send((True, result, deadline is not None and deadline.partial))
+        except Exception as e:
+            conn.send((False, f"{type(e).__name__}: {e}", False))
+
+
+class ShardPool:
+    """
+    分片进程池
+
+    将文档按序号划分为若干连续区间，每个区间由一个常驻工作进程负责。
+    查询分发到所有分片并行执行，汇总全局统计量后再由各分片打分，
+    最后按top-k归并，结果与单进程查询一致。
+
+    工作进程fork自主进程以共享内存中的索引（写时复制），而不是用spawn重新加载。
+    分片在截止时间（加宽限）内没有回复或已退出时被重新拉起，
+    该查询改在主进程内打分，不会因某个分片卡住或崩溃而阻塞所有查询。
+
+    同一组分片进程按请求顺序处理，一次只服务一个查询；启动channels组分片进程，
+    每个查询取一组空闲的使用，最多channels个查询同时在分片上执行。
+    """
+
+    def __init__(self, searcher, num_shards: int, channels: int = 1):
+        """
+        启动分片工作进程
+
+        Args:
+            searcher: 已构建好索引的搜索引擎
+            num_shards: 分片数量
+            channels: 分片进程组数，即可同时执行的查询数
+        """
+        self.searcher = searcher
+        self._ctx = multiprocessing.get_context('fork')
+
+        total = len(searcher.doc_ids)
+        bounds = [total * i // num_shards for i in range(num_shards + 1)]
+        self.ranges: List[Tuple[int, int]] = list(zip(bounds, bounds[1:]))
+
+        # processes[组][分片]、connections[组][分片]
+        channels = max(channels, 1)
+        self.processes = [[None] * num_shards for _ in range(channels)]
+        self.connections = [[None] * num_shards for _ in range(channels)]
+        self._idle: queue.Queue = queue.Queue()
+        for channel in range(channels):
+            for index in range(num_shards):
+                self._start(channel, index)
+            self._idle.put(channel)
+        atexit.register(self.close)
+
+    def _start(self, channel: int, index: int):
+        """
+        启动第channel组第index个分片的工作进程
+        """
+        lo, hi = self.ranges[index]
+        parent_conn, child_conn = self._ctx.Pipe()
+        process = self._ctx.Process(target=_shard_main, args=(self.searcher, lo, hi, child_conn), daemon=True)
+        process.start()
+        child_conn.close()
+        self.processes[channel][index] = process
+        self.connections[channel][index] = parent_conn
+
+    def _restart(self, channel: int, index: int):
+        """
+        结束无响应或已退出的分片进程并重新拉起；迟到的回复随旧管道一起丢弃
+        """
+        print(f"Restarting search shard {index} (group {channel})")
+        try:
+            self.connections[channel][index].close()
+        except Exception:
+            pass
+        process = self.processes[channel][index]
+        if process.is_alive():
+            process.kill()
+        process.join(timeout=1)
+        self._start(channel, index)
+
+    def _broadcast(self, channel: int, op: str, args: tuple) -> List:
+        """
+        向一组中的所有分片发送同一请求并收集结果
+
+        分片出错时抛出RuntimeError；没有按时回复或已退出的分片在抛出前重新拉起
+        """
+        deadline = current_deadline()
+        expires = deadline.expires if deadline is not None else None
+        reply_by = expires + _REPLY_GRACE if expires is not None else time.monotonic() + _REPLY_TIMEOUT
+
+        errors = []
+        broken = []
+        sent = []
+        connections = self.connections[channel]
+        for index, conn in enumerate(connections):
+            try:
+                conn.send((op, args, expires))
+                sent.append(index)
+            except (OSError, ValueError) as e:
+                broken.append(index)
+                errors.append(f"shard {index}: {e}")
+
+        results = []
+        for index in sent:
+            conn = connections[index]
+            try:
+                if not conn.poll(max(reply_by - time.monotonic(), 0)):
+                    raise TimeoutError('no reply before deadline')
+                ok, result, partial = conn.recv()
+            except (OSError, EOFError) as e:
+                broken.append(index)
+                errors.append(f"shard {index}: {type(e).__name__}: {e}")
+                continue
+            if ok:
+                results.append(result)
+            else:
+                errors.append(f"shard {index}: {result}")
+            if partial:
+                deadline.partial = True
+
+        for index in broken:
+            self._restart(channel, index)
+        if errors:
+            raise RuntimeError(f"Shard {op} failed: {errors[0]}")
+        return results
+
+    def score(self, query_tokens: List[str], fuzzy: bool, k: int = None) -> List[Tuple[float, int]]:
+        """
+        在所有分片上并行打分
+
+        Args:
+            query_tokens: 查询词
+            fuzzy: 是否对未命中的查询词做模糊扩展
+            k: 只返回前k个结果，缺省返回全部候选
+
+        Returns:
+            (负分数, 文档序号) 列表；给定k时已排好序
+        """
+        channel = self._idle.get()
+        try:
+            shard_results, start = self._score_on_shards(channel, query_tokens, fuzzy, k)
+        except RuntimeError as e:
+            shard_results = None
+            print(f"Warning: {e}, scoring in process")
+        finally:
+            self._idle.put(channel)
+        if shard_results is None:
+            return self.searcher._score_local(query_tokens, fuzzy, k)
+
+        if k is not None:
+            results = list(itertools.islice(heapq.merge(*shard_results), k))
+            record_stage('topk', start)
+            return results
+        return list(itertools.chain.from_iterable(shard_results))
+
+    def _score_on_shards(self, channel: int, query_tokens: List[str], fuzzy: bool, k: int = None):
+        """
+        在第channel组分片上依次执行match、expand、score，返回各分片的结果和当前时间
+        """
+        start = time.perf_counter()
+        replies = self._broadcast(channel, 'match', (query_tokens,))
+        matched = set().union(*(m for m, _ in replies))
+        stats_list = [stats for _, stats in replies]
+
+        # 模糊扩展需要全局的命中情况，由主进程决定后下发
+        query_tokens, query_weights = self.searcher._expand_query(query_tokens, matched, fuzzy)
+        if query_weights:
+            stats_list = self._broadcast(channel, 'expand', (query_tokens, list(query_weights)))
+        start = record_stage('candidates', start)
+
+        # 分片进程内的指标不回传，候选数和打分耗时在这里统计
+        stats = self.searcher._merge_stats(stats_list)
+        shard_results = self._broadcast(channel, 'score', (query_tokens, query_weights, stats, k))
+        start = record_stage('scoring', start)
+        CANDIDATES_SCORED.inc(stats['doc_count'])
+        profile = current_profile()
+        if profile is not None:
+            profile.tokens = list(query_tokens)
+            profile.count('candidates', stats['doc_count'])
+            profile.count('scored', stats['doc_count'])
+        return shard_results, start
+
+    def close(self):
+        """
+        关闭所有分片工作进程
+        """
+        for conn in itertools.chain.from_iterable(self.connections):
+            try:
+                conn.send(('close', (), None))
+                conn.close()
+            except Exception:
+                pass
+        for process in itertools.chain.from_iterable(self.processes):
+            process.join(timeout=1)
+        self.connections = []
+        self.processes = []
@@ -0,0 +1,91 @@
+"""
+前缀自动补全
+"""
+import heapq
+from bisect import bisect_left
+from typing import Dict, List, Tuple
+
+
+class Suggester:
+    """
+    基于有序词表的前缀补全
+
+    词表按小写形式排序存放，任一前缀对应的词恰好是有序词表中的一段连续区间，
+    通过二分查找即可定位。命中词数超过top_n的前缀（即前缀树中的"热门"节点）
+    在构建时预先算好按权重排序的top_n补全；其余前缀的区间本身不超过top_n个词，
+    查询时直接排序返回。这样查询代价只与前缀长度有关，与词表大小无关。
+    """
+
+    def __init__(self, top_n: int = 10):
+        """
+        初始化补全器
+
+        Args:
+            top_n: 每个前缀预先计算的补全数量
+        """
+        self.top_n = top_n
+        self.keys: List[str] = []
+        self.terms: List[str] = []
+        self.weights: List[float] = []
+        self.top: Dict[str, Tuple[int, ...]] = {}
+
+    def build(self, term_weights: Dict[str, float]):
+        """
+        构建前缀索引
+
+        Args:
+            term_weights: 词 -> 权重（文档频率与查询频率的加权和）
+        """
+        entries = sorted((term.lower(), term, weight) for term, weight in term_weights.items())
+        keys = [key for key, _, _ in entries]
+        weights = [weight for _, _, weight in entries]
+
+        # 统计每个前缀覆盖的词数，只为超过top_n的前缀预计算补全
+        prefix_counts: Dict[str, int] = {}
+        for key in keys:
+            for i in range(1, len(key) + 1):
+                prefix = key[:i]
+                prefix_counts[prefix] = prefix_counts.get(prefix, 0) + 1
+
+        top = {}
+        for prefix, count in prefix_counts.items():
+            if count <= self.top_n:
+                continue
+            lo = bisect_left(keys, prefix)
+            ordinals = heapq.nlargest(self.top_n, range(lo, lo + count), key=weights.__getitem__)
+            top[prefix] = tuple(ordinals)
+
+        self.keys = keys
+        self.terms = [term for _, term, _ in entries]
+        self.weights = weights
+        self.top = top
+
+    def suggest(self, prefix: str, limit: int = None) -> List[str]:
+        """
+        获取前缀的补全词
+
+        Args:
+            prefix: 用户输入的前缀
+            limit: 返回数量，不超过top_n
+
+        Returns:
+            按权重降序排列的补全词列表
+        """
+        prefix = prefix.strip().lower()
+        if not prefix or not self.keys:
+            return []
+
+        limit = min(limit or self.top_n, self.top_n)
+        ordinals = self.top.get(prefix)
+        if ordinals is None:
+            # 非热门前缀：对应区间最多top_n个词
+            lo = bisect_left(self.keys, prefix)
+            hi = lo
+            while hi < len(self.keys) and hi - lo <= self.top_n and self.keys[hi].startswith(prefix):
+                hi += 1
+            ordinals = sorted(range(lo, hi), key=self.weights.__getitem__, reverse=True)
+
+        return [self.terms[i] for i in ordinals[:limit]]
+
+    def __len__(self) -> int:
+        return len(self.terms)
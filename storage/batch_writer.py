@@ -0,0 +1,120 @@
+"""
+文档批量写入
+"""
+import time
+import threading
+from typing import List
+
+from storage.data_model import Document
+from storage.hbase_client import HBaseClient
+
+
+class BatchWriteError(Exception):
+    """
+    一批文档写入失败；docs为这一批的全部文档，调用方可以重试或逐个报告
+    """
+
+    def __init__(self, docs: List[Document], cause: Exception):
+        super().__init__(f"Failed to write batch of {len(docs)} documents: {cause}")
+        self.docs = docs
+
+
+class BatchWriter:
+    """
+    缓冲文档并批量写入存储
+
+    缓冲的文档数达到batch_size，或最早缓冲的文档已等待flush_interval秒时，
+    在add()中通过HBaseClient.save_documents写入一批；结束时需调用flush()或close()
+    写入剩余文档。可被多个线程同时使用。
+    """
+
+    def __init__(self, hbase_client: HBaseClient, batch_size: int = None, flush_interval: float = None):
+        """
+        Args:
+            hbase_client: HBase客户端
+            batch_size: 每批文档数，默认取storage.write_batch_size
+            flush_interval: 缓冲的最长等待时间（秒），默认取storage.write_flush_interval
+        """
+        storage_config = hbase_client.storage_config
+        self.hbase_client = hbase_client
+        self.batch_size = batch_size or storage_config.get('write_batch_size', 500)
+        self.flush_interval = flush_interval if flush_interval is not None else \
+            storage_config.get('write_flush_interval', 2.0)
+
+        self._buffer: List[Document] = []
+        self._buffer_started = 0.0
+        self._lock = threading.Lock()
+
+        # 写入统计
+        self.batches = 0
+        self.documents = 0
+        self.failed = 0
+        self.seconds = 0.0
+
+    def add(self, doc: Document):
+        """
+        缓冲一个文档，满足条件时写入一批
+        """
+        with self._lock:
+            if not self._buffer:
+                self._buffer_started = time.monotonic()
+            self._buffer.append(doc)
+            due = (len(self._buffer) >= self.batch_size
+                   or time.monotonic() - self._buffer_started >= self.flush_interval)
+        if due:
+            self.flush()
+
+    def flush(self) -> int:
+        """
+        写入当前缓冲的全部文档
+
+        Returns:
+            写入的文档数；写入失败时这一批文档计入failed，并抛出带有这批文档的BatchWriteError
+        """
+        with self._lock:
+            docs, self._buffer = self._buffer, []
+        if not docs:
+            return 0
+
+        start = time.perf_counter()
+        try:
+            self.hbase_client.save_documents(docs)
+        except Exception as e:
+            with self._lock:
+                self.failed += len(docs)
+            print(f"Failed to write batch of {len(docs)} documents: {e}")
+            raise BatchWriteError(docs, e) from e
+        elapsed = time.perf_counter() - start
+
+        with self._lock:
+            self.batches += 1
+            self.documents += len(docs)
+            self.seconds += elapsed
+        print(f"Wrote batch of {len(docs)} documents in {elapsed * 1000:.1f} ms")
+        return len(docs)
+
+    def pending(self) -> int:
+        """
+        尚未写入的文档数
+        """
+        with self._lock:
+            return len(self._buffer)
+
+    def stats(self) -> dict:
+        """
+        写入统计
+        """
+        with self._lock:
+            return {
+                'batches': self.batches,
+                'documents': self.documents,
+                'failed': self.failed,
+                'pending': len(self._buffer),
+                'avg_batch_ms': self.seconds * 1000 / self.batches if self.batches else 0.0,
+            }
+
+    def close(self):
+        """
+        写入剩余文档
+        """
+        self.flush()
@@ -0,0 +1,170 @@
+"""
+正文压缩编码
+"""
+import lzma
+import struct
+import zlib
+from collections import Counter
+from typing import Dict, Iterable, Optional
+
+# 压缩后的正文以0xff开头（合法的UTF-8文本不会出现该字节），第二个字节为压缩算法，
+# 未压缩的正文就是UTF-8文本，旧数据无需迁移即可读取
+_MAGIC = b'\xff'
+_ZLIB = b'z'
+_LZMA = b'x'
+# zlib预置字典：其后4字节为字典编号（字典内容的crc32）
+_ZLIB_DICT = b'd'
+_DICT_ID = struct.Struct('<I')
+
+# 已加载的预置字典：编号 -> 字典内容
+_dictionaries: Dict[int, bytes] = {}
+
+
+def register_dictionary(dictionary: bytes) -> int:
+    """
+    注册预置字典，返回字典编号；解压用该字典压缩的正文前必须先注册
+    """
+    dictionary_id = zlib.crc32(dictionary)
+    _dictionaries[dictionary_id] = dictionary
+    return dictionary_id
+
+
+def is_encoded(data: bytes) -> bool:
+    """
+    是否为压缩后的正文
+    """
+    return data[:1] == _MAGIC
+
+
+def decode_content(data: bytes) -> str:
+    """
+    将存储的正文还原为文本；未压缩的正文按UTF-8解码
+    """
+    if not is_encoded(data):
+        return data.decode('utf-8')
+
+    codec = data[1:2]
+    if codec == _ZLIB:
+        raw = zlib.decompress(data[2:])
+    elif codec == _LZMA:
+        raw = lzma.decompress(data[2:])
+    elif codec == _ZLIB_DICT:
+        (dictionary_id,) = _DICT_ID.unpack_from(data, 2)
+        dictionary = _dictionaries.get(dictionary_id)
+        if dictionary is None:
+            raise ValueError(f"Unknown content dictionary: {dictionary_id:08x}")
+        decompressor = zlib.decompressobj(zdict=dictionary)
+        raw = decompressor.decompress(data[2 + _DICT_ID.size:]) + decompressor.flush()
+    else:
+        raise ValueError(f"Unknown content codec: {codec!r}")
+    return raw.decode('utf-8')
+
+
+def decode_content_prefix(data: bytes, max_chars: int) -> str:
+    """
+    只解压正文开头的部分，返回不超过max_chars个字符，用于摘要等只需要开头的场合
+    """
+    # UTF-8每个字符最多4字节
+    max_bytes = max_chars * 4
+    if not is_encoded(data):
+        raw = data[:max_bytes]
+    else:
+        codec = data[1:2]
+        if codec == _ZLIB:
+            raw = zlib.decompressobj().decompress(data[2:], max_bytes)
+        elif codec == _LZMA:
+            raw = lzma.LZMADecompressor().decompress(data[2:], max_bytes)
+        elif codec == _ZLIB_DICT:
+            (dictionary_id,) = _DICT_ID.unpack_from(data, 2)
+            dictionary = _dictionaries.get(dictionary_id)
+            if dictionary is None:
+                raise ValueError(f"Unknown content dictionary: {dictionary_id:08x}")
+            raw = zlib.decompressobj(zdict=dictionary).decompress(data[2 + _DICT_ID.size:], max_bytes)
+        else:
+            raise ValueError(f"Unknown content codec: {codec!r}")
+    # 截断处可能落在一个字符的中间
+    return raw.decode('utf-8', errors='ignore')[:max_chars]
+
+
+class EncodedContent:
+    """
+    压缩后的正文，调用decode()时才解压
+    """
+    __slots__ = ('data',)
+
+    def __init__(self, data: bytes):
+        self.data = data
+
+    def decode(self) -> str:
+        return decode_content(self.data)
+
+    def decode_prefix(self, max_chars: int) -> str:
+        return decode_content_prefix(self.data, max_chars)
+
+
+class ContentCodec:
+    """
+    正文压缩编码器
+
+    短于min_bytes或压缩后没有变小的正文保持原样（UTF-8），
+    每个值自带是否压缩及所用算法的标记
+    """
+
+    def __init__(self, codec: str = 'zlib', level: int = 6, min_bytes: int = 256,
+                 dictionary: Optional[bytes] = None):
+        """
+        Args:
+            codec: 压缩算法，zlib、lzma或none
+            level: 压缩级别
+            min_bytes: 不压缩短于该字节数的正文
+            dictionary: zlib预置字典，由train_dictionary()生成，只用于zlib
+        """
+        if codec not in ('zlib', 'lzma', 'none'):
+            raise ValueError(f"Unknown content codec: {codec}")
+        self.codec = codec
+        self.level = level
+        self.min_bytes = min_bytes
+        self.dictionary = dictionary if codec == 'zlib' else None
+        self.dictionary_id = register_dictionary(dictionary) if self.dictionary else None
+
+    def encode(self, text: str) -> bytes:
+        """
+        编码正文，返回要存储的字节
+        """
+        raw = text.encode('utf-8')
+        if self.codec == 'none' or len(raw) < self.min_bytes:
+            return raw
+
+        if self.codec == 'lzma':
+            data = _MAGIC + _LZMA + lzma.compress(raw, preset=min(self.level, 9))
+        elif self.dictionary is not None:
+            compressor = zlib.compressobj(self.level, zdict=self.dictionary)
+            data = (_MAGIC + _ZLIB_DICT + _DICT_ID.pack(self.dictionary_id)
+                    + compressor.compress(raw) + compressor.flush())
+        else:
+            data = _MAGIC + _ZLIB + zlib.compress(raw, self.level)
+        return data if len(data) < len(raw) else raw
+
+
+def train_dictionary(texts: Iterable[str], size: int = 32 * 1024, min_length: int = 8) -> bytes:
+    """
+    由样本正文生成zlib预置字典
+
+    取在多个文档中重复出现的行（页眉、页脚、导航等模板文字），
+    出现越多的放在越靠后的位置（离被压缩的数据越近），总长度不超过size字节
+    """
+    counts = Counter()
+    for text in texts:
+        lines = {line.strip() for line in text.splitlines()}
+        counts.update(line for line in lines if len(line) >= min_length)
+
+    common = [line for line, count in counts.most_common() if count > 1]
+    chunks = []
+    total = 0
+    for line in common:
+        encoded = (line + '\n').encode('utf-8')
+        if total + len(encoded) > size:
+            break
+        chunks.append(encoded)
+        total += len(encoded)
+    return b''.join(reversed(chunks))
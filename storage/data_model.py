@@ -1,10 +1,33 @@
 """
 数据模型定义
 """
+import base64
 from dataclasses import dataclass
-from typing import Optional
+from typing import Optional, Union
 from datetime import datetime
 
+from storage.content_codec import ContentCodec, EncodedContent, is_encoded
+
+
+class _ContentField:
+    """
+    正文字段：可以保存压缩后的正文（EncodedContent），每次读取时才解压，
+    不缓存解压结果，常驻内存的文档只占压缩后的大小
+    """
+    
+    def __set_name__(self, owner, name):
+        self.attr = f'_{name}'
+    
+    def __get__(self, doc, owner=None) -> str:
+        if doc is None:
+            # 没有默认值，dataclass据此将其视为必填字段
+            raise AttributeError(self.attr[1:])
+        value = doc.__dict__[self.attr]
+        return value.decode() if isinstance(value, EncodedContent) else value
+    
+    def __set__(self, doc, value: Union[str, EncodedContent]):
+        doc.__dict__[self.attr] = value
+
 
 @dataclass
 class Document:
@@ -13,7 +36,7 @@ class Document:
     """
     url: str
     title: str
-    content: str
+    content: str = _ContentField()
     file_type: str
     file_size: int = 0
     source: str = ""
@@ -24,20 +47,51 @@ class Document:
         if self.crawl_time is None:
             self.crawl_time = datetime.now()
     
-    def to_dict(self) -> dict:
+    def content_prefix(self, max_chars: int) -> str:
+        """
+        正文的前max_chars个字符；压缩保存的正文只解压开头部分
+        """
+        value = self.__dict__['_content']
+        if isinstance(value, EncodedContent):
+            return value.decode_prefix(max_chars)
+        return value[:max_chars]
+    
+    def encoded_content(self, codec: Optional[ContentCodec] = None) -> bytes:
+        """
+        正文的存储形式：已经是压缩形式时直接返回，不重新压缩；
+        否则按codec编码，codec为None时为UTF-8文本
+        """
+        value = self.__dict__['_content']
+        if isinstance(value, EncodedContent):
+            return value.data
+        return codec.encode(value) if codec is not None else value.encode('utf-8')
+    
+    def to_dict(self, content_codec: Optional[ContentCodec] = None) -> dict:
         """
         转换为字典格式，用于存储到HBase
+        
+        Args:
+            content_codec: 指定时正文按该编码压缩，压缩后的正文以base64保存，
+                并以content_encoding标记；压缩无效时仍为原文
         """
-        return {
+        content = self.content if content_codec is None else self.encoded_content(content_codec)
+        data = {
             'url': self.url,
             'title': self.title,
-            'content': self.content,
+            'content': content,
             'file_type': self.file_type,
             'file_size': str(self.file_size),
             'source': self.source,
             'crawl_time': self.crawl_time.isoformat() if self.crawl_time else '',
             'file_path': self.file_path or ''
         }
+        if isinstance(content, bytes):
+            if is_encoded(content):
+                data['content'] = base64.b64encode(content).decode('ascii')
+                data['content_encoding'] = 'base64'
+            else:
+                data['content'] = content.decode('utf-8')
+        return data
     
     @classmethod
     def from_dict(cls, data: dict) -> 'Document':
@@ -51,12 +105,17 @@ class Document:
             except:
                 pass
         
+        content = data.get('content', '')
+        if data.get('content_encoding') == 'base64':
+            # 压缩后的正文，读取时才解压
+            content = EncodedContent(base64.b64decode(content))
+        
         return cls(
             url=data.get('url', ''),
             title=data.get('title', ''),
-            content=data.get('content', ''),
+            content=content,
             file_type=data.get('file_type', ''),
-            file_size=int(data.get('file_size', 0)),
+            file_size=int(data.get('file_size') or 0),
             source=data.get('source', ''),
             crawl_time=crawl_time,
             file_path=data.get('file_path')
@@ -0,0 +1,153 @@
+"""
+文档读取缓存：按字节数限制大小的LRU缓存，同时缓存不存在的文档
+"""
+import time
+import threading
+from collections import OrderedDict
+from typing import Optional, Union
+
+from storage.data_model import Document
+
+# 缓存中表示“文档不存在”的值
+MISSING = object()
+
+# 每个条目除文档内容外的估计开销（字节）：键、元组、Document对象等
+_ENTRY_OVERHEAD = 256
+
+
+def _document_size(doc: Document) -> int:
+    """
+    估计文档在缓存中占用的字节数；压缩保存的正文按压缩后的大小计算
+    """
+    size = _ENTRY_OVERHEAD + len(doc.encoded_content())
+    for value in (doc.url, doc.title, doc.file_type, doc.source, doc.file_path):
+        if value:
+            size += len(value)
+    return size
+
+
+class DocumentCache:
+    """
+    文档的读穿透缓存
+
+    按最近使用顺序淘汰，总大小不超过max_bytes。不存在的文档也缓存（负缓存），
+    避免反复查询同一个不存在的row key。条目超过ttl秒后失效，其它进程写入的文档
+    最迟在ttl秒后可见；本进程写入文档时调用invalidate()立即失效。可被多个线程同时使用。
+
+    缓存的Document对象由所有读取者共享，读取者不应修改。
+    """
+
+    def __init__(self, max_bytes: int, ttl: float = 300, negative_ttl: float = 30):
+        """
+        Args:
+            max_bytes: 缓存总大小上限（字节）
+            ttl: 文档条目的有效期（秒），0表示不过期
+            negative_ttl: “文档不存在”条目的有效期（秒），0表示不过期
+        """
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+
+        # row key -> (文档或MISSING, 大小, 过期时间)
+        self._entries: OrderedDict = OrderedDict()
+        self._bytes = 0
+        # 每次失效加一；读取前记下，写回时已变化则放弃写回，避免把失效前读到的旧文档放回缓存
+        self._generation = 0
+        self._lock = threading.Lock()
+
+        # 命中统计
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    def get(self, row_key: str) -> Union[Document, object, None]:
+        """
+        查找缓存
+
+        Returns:
+            缓存的文档；缓存了“文档不存在”时返回MISSING；未缓存时返回None
+        """
+        with self._lock:
+            entry = self._entries.get(row_key)
+            if entry is not None and entry[2] and entry[2] < time.monotonic():
+                self._remove(row_key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(row_key)
+            if entry[0] is MISSING:
+                self.negative_hits += 1
+            else:
+                self.hits += 1
+            return entry[0]
+
+    def put(self, row_key: str, doc: Optional[Document], generation: int):
+        """
+        缓存读取结果，doc为None表示文档不存在
+
+        Args:
+            generation: 读取存储之前取得的generation；其间有过失效时不写入
+        """
+        if doc is None:
+            value, size, ttl = MISSING, _ENTRY_OVERHEAD + len(row_key), self.negative_ttl
+        else:
+            value, size, ttl = doc, _document_size(doc), self.ttl
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._remove(row_key)
+            self._entries[row_key] = (value, size, time.monotonic() + ttl if ttl else 0)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def invalidate(self, *row_keys: str):
+        """
+        使这些文档的缓存失效（包括“文档不存在”的缓存）
+        """
+        with self._lock:
+            self._generation += 1
+            for row_key in row_keys:
+                self._remove(row_key)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        """
+        命中统计
+        """
+        with self._lock:
+            lookups = self.hits + self.negative_hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'negative_hits': self.negative_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_ratio': (self.hits + self.negative_hits) / lookups if lookups else 0.0,
+            }
+
+    def _remove(self, row_key: str):
+        entry = self._entries.pop(row_key, None)
+        if entry is not None:
+            self._bytes -= entry[1]
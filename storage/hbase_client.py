@@ -3,15 +3,39 @@ HBase客户端封装
 """
 import yaml
 import os
-from typing import Optional, List, Dict
+import json
+import base64
+import dataclasses
+import time
+import queue
+import threading
+from contextlib import contextmanager
+from typing import Optional, List, Dict, Callable, Iterator, Tuple
 from pathlib import Path
 from storage.data_model import Document
+from storage.local_store import LocalStore
+from storage.content_codec import ContentCodec, EncodedContent, is_encoded
+from storage.document_cache import DocumentCache, MISSING
+
+# 并行扫描中某一段扫描完成的标记
+_RANGE_DONE = object()
+
+# 正文单独存放在content列族，元数据在info列族；只读元数据时不必传输正文
+CONTENT_COLUMN = 'content:text'
+# 旧表没有content列族，正文与元数据一起存放在info列族
+LEGACY_CONTENT_COLUMN = 'info:content'
+
+DOCUMENT_FIELDS = [field.name for field in dataclasses.fields(Document)]
 
 
 class HBaseClient:
     """
     HBase客户端，用于连接和操作HBase
     如果HBase不可用，使用本地文件作为fallback
+
+    happybase.Connection不是线程安全的，客户端持有一个有上限的连接池，
+    每次操作从池中借出当前线程专用的连接；出错的连接由连接池重建，
+    不再关闭整个客户端重连，多个线程可以共用同一个客户端
     """
     
     def __init__(self, config_path: Optional[str] = None):
@@ -33,44 +57,181 @@ class HBaseClient:
         self.port = self.hbase_config.get('port', 9090)
         self.table_name = self.hbase_config.get('table_name', 'ustc_documents')
         self.index_table_name = self.hbase_config.get('index_table_name', 'ustc_index')
+        self.pool_size = self.hbase_config.get('pool_size', 8)
+        self.timeout = self.hbase_config.get('timeout', 5000)
+        self.health_check_interval = self.hbase_config.get('health_check_interval', 30)
+        # table.batch()每累积多少个写操作发送一次
+        self.batch_size = self.hbase_config.get('batch_size', 500)
+        # 扫描器每次RPC取回的行数
+        self.scan_batch_size = self.hbase_config.get('scan_batch_size', 1000)
+        # 全表扫描时按row key前缀分段并行扫描的段数，不超过连接池大小
+        self.scan_splits = self.hbase_config.get('scan_splits', 4)
+        # 新建文档表时info列族保留的版本数
+        self.max_versions = self.hbase_config.get('max_versions', 3)
+        # 新建文档表时content列族使用的压缩算法（NONE、GZ、SNAPPY、LZ4等）
+        self.content_compression = self.hbase_config.get('content_compression', 'GZ')
+        # 正文写入的列，由文档表是否有content列族决定
+        self.content_column = CONTENT_COLUMN
+        
+        # 正文压缩编码
+        self.content_codec = self._init_content_codec()
+        
+        # 按row key读取文档的缓存，document_cache_mb为0时不缓存
+        self.document_cache = None
+        cache_mb = self.storage_config.get('document_cache_mb', 64)
+        if cache_mb:
+            self.document_cache = DocumentCache(
+                int(cache_mb * 1024 * 1024),
+                ttl=self.storage_config.get('document_cache_ttl', 300),
+                negative_ttl=self.storage_config.get('document_negative_cache_ttl', 30)
+            )
         
         # 尝试连接HBase
-        self.connection = None
+        self.pool = None
+        self._pool_lock = threading.Lock()
         self.use_hbase = False
+        self._last_checked = {}
         self._init_connection()
         
         # 如果HBase不可用，使用本地存储
+        self.local_store = None
+        self.local_index_store = None
         if not self.use_hbase:
+            # 旧版本每个文档一个JSON文件，与下载的文件放在同一目录
             self.local_storage_path = os.path.join(
                 Path(__file__).parent.parent,
                 self.storage_config.get('file_storage_path', './data/storage')
             )
             os.makedirs(self.local_storage_path, exist_ok=True)
-            print(f"Warning: HBase not available, using local storage at {self.local_storage_path}")
+            
+            local_store_path = os.path.join(
+                Path(__file__).parent.parent,
+                self.storage_config.get('local_store_path', './data/store')
+            )
+            segment_max_bytes = int(self.storage_config.get('local_segment_max_mb', 64) * 1024 * 1024)
+            compact_ratio = self.storage_config.get('local_compact_ratio', 0.5)
+            refresh_interval = self.storage_config.get('local_refresh_interval', 1.0)
+            self.local_store = LocalStore(os.path.join(local_store_path, 'documents'),
+                                          segment_max_bytes, compact_ratio, refresh_interval)
+            self.local_index_store = LocalStore(os.path.join(local_store_path, 'index'),
+                                                segment_max_bytes, compact_ratio, refresh_interval)
+            print(f"Warning: HBase not available, using local storage at {local_store_path}")
+            
+            # 首次使用时导入旧版本的文档文件（保留原文件）
+            if not len(self.local_store):
+                stats = self._import_legacy_documents()
+                if stats['old_rows']:
+                    print(f"Imported {stats['migrated']} documents from {stats['old_rows']} legacy files")
+    
+    def _init_content_codec(self) -> ContentCodec:
+        """
+        按配置创建正文压缩编码器，并加载预置字典
+        """
+        dictionary = None
+        dictionary_path = self.storage_config.get('content_dictionary_path')
+        if dictionary_path:
+            dictionary_path = os.path.join(Path(__file__).parent.parent, dictionary_path)
+            try:
+                with open(dictionary_path, 'rb') as f:
+                    dictionary = f.read()
+            except OSError as e:
+                print(f"Warning: failed to load content dictionary {dictionary_path}: {e}")
+        return ContentCodec(
+            codec=self.storage_config.get('content_codec', 'zlib'),
+            level=self.storage_config.get('content_compress_level', 6),
+            min_bytes=self.storage_config.get('content_min_bytes', 256),
+            dictionary=dictionary
+        )
     
     def _init_connection(self):
         """
-        初始化HBase连接
+        初始化HBase连接池
         """
         try:
-            import happybase
-            self.connection = happybase.Connection(
-                host=self.host,
-                port=self.port,
-                timeout=5000
-            )
+            self.pool = self._create_pool()
             # 测试连接
-            self.connection.tables()
+            with self._connection() as connection:
+                connection.tables()
             self.use_hbase = True
-            print("HBase connection established")
+            print(f"HBase connection pool established (size={self.pool_size})")
             
             # 创建表（如果不存在）
             self._create_tables()
         except Exception as e:
             print(f"HBase connection failed: {e}")
             print("Will use local file storage instead")
+            self.pool = None
             self.use_hbase = False
     
+    def _create_pool(self):
+        import happybase
+        return happybase.ConnectionPool(
+            size=self.pool_size,
+            host=self.host,
+            port=self.port,
+            timeout=self.timeout
+        )
+    
+    def reset_after_fork(self):
+        """
+        在fork出的子进程中调用：丢弃从父进程继承的连接池（其中的Thrift套接字仍由父进程使用），
+        首次使用时重新建立连接；多个进程不能共用同一个连接
+        """
+        self._pool_lock = threading.Lock()
+        self._last_checked = {}
+        if self.use_hbase:
+            self.pool = None
+    
+    @contextmanager
+    def _connection(self) -> Iterator:
+        """
+        从连接池借出当前线程使用的连接
+        
+        同一线程嵌套借出时得到同一个连接；闲置超过health_check_interval秒的连接
+        借出前先检查一次，已失效的重新打开。操作中出现Thrift或网络错误时，
+        连接池在归还前重建该连接
+        """
+        if self.pool is None:
+            with self._pool_lock:
+                if self.pool is None:
+                    self.pool = self._create_pool()
+        with self.pool.connection() as connection:
+            self._check_health(connection)
+            yield connection
+    
+    def _check_health(self, connection):
+        """
+        检查闲置较久的连接，失效时重新打开
+        """
+        now = time.monotonic()
+        last_checked = self._last_checked.get(id(connection))
+        self._last_checked[id(connection)] = now
+        if last_checked is not None and now - last_checked < self.health_check_interval:
+            return
+        
+        try:
+            connection.tables()
+        except Exception as e:
+            print(f"HBase connection unhealthy, reopening: {e}")
+            connection.close()
+            connection.open()
+    
+    def _with_retry(self, operation: Callable, description: str, max_retries: int = 5):
+        """
+        借出连接执行operation(connection)，失败时退避后重试
+        
+        出错的连接已由连接池重建，重试只需重新借出，不会关闭其它线程正在使用的连接
+        """
+        for attempt in range(max_retries):
+            try:
+                with self._connection() as connection:
+                    return operation(connection)
+            except Exception as e:
+                print(f"Error {description} (attempt {attempt + 1}/{max_retries}): {e}")
+                if attempt == max_retries - 1:
+                    raise
+                time.sleep(min(0.2 * 2 ** attempt, 2.0))
+    
     def _create_tables(self):
         """
         创建HBase表（如果不存在）
@@ -79,157 +240,307 @@ class HBaseClient:
             return
         
         try:
-            tables = self.connection.tables()
-            
-            # 创建文档表
-            if self.table_name.encode() not in tables:
-                self.connection.create_table(
-                    self.table_name,
-                    {
-                        'info': dict(),  # 元数据列族
-                        'file': dict(),  # 文件数据列族（可选）
-                    }
-                )
-                print(f"Created table: {self.table_name}")
-            
-            # 创建索引表
-            if self.index_table_name.encode() not in tables:
-                self.connection.create_table(
-                    self.index_table_name,
-                    {
-                        'index': dict(),  # 倒排索引列族
-                    }
-                )
-                print(f"Created table: {self.index_table_name}")
+            with self._connection() as connection:
+                self._create_missing_tables(connection)
         except Exception as e:
             print(f"Error creating tables: {e}")
     
+    def _create_missing_tables(self, connection):
+        """
+        创建不存在的文档表和索引表
+        """
+        tables = connection.tables()
+        
+        # 创建文档表
+        if self.table_name.encode() not in tables:
+            connection.create_table(
+                self.table_name,
+                {
+                    'info': dict(max_versions=self.max_versions),  # 元数据列族，保留最近几次爬取的版本
+                    'content': dict(max_versions=1, compression=self.content_compression),  # 正文列族
+                    'file': dict(),  # 文件数据列族（可选）
+                }
+            )
+            print(f"Created table: {self.table_name}")
+        
+        families = {name.decode() if isinstance(name, bytes) else name
+                    for name in connection.table(self.table_name).families()}
+        if 'content' not in families:
+            self.content_column = LEGACY_CONTENT_COLUMN
+            print(f"Table {self.table_name} has no 'content' column family, storing content in 'info'. "
+                  f"Add it with: alter '{self.table_name}', {{NAME => 'content', COMPRESSION => '{self.content_compression}'}}")
+        
+        # 创建索引表
+        if self.index_table_name.encode() not in tables:
+            connection.create_table(
+                self.index_table_name,
+                {
+                    'index': dict(),  # 倒排索引列族
+                }
+            )
+            print(f"Created table: {self.index_table_name}")
+    
     def _generate_row_key(self, url: str) -> str:
         """
-        生成Row Key
+        生成Row Key：URL的md5，与搜索器的文档ID相同
+        
+        同一URL总是对应同一行，重新爬取时覆盖原来的行而不是新增一行；
+        历史版本由info列族的多版本保留（hbase.max_versions），crawl_time列记录每次爬取的时间
         """
         import hashlib
-        from datetime import datetime
-        
-        # 使用URL的hash + 时间戳
-        url_hash = hashlib.md5(url.encode()).hexdigest()[:8]
-        timestamp = int(datetime.now().timestamp() * 1000)
-        return f"{url_hash}_{timestamp}"
+        return hashlib.md5(url.encode()).hexdigest()
     
     def save_document(self, doc: Document) -> str:
         """
-        保存文档到HBase或本地存储
+        保存文档到HBase或本地存储；同一URL重复保存时更新已有的文档
         
         Returns:
             row_key: 文档的row key
         """
         row_key = self._generate_row_key(doc.url)
         
-        if self.use_hbase:
-            return self._save_to_hbase(doc, row_key)
-        else:
-            return self._save_to_local(doc, row_key)
+        try:
+            if self.use_hbase:
+                return self._save_to_hbase(doc, row_key)
+            else:
+                return self._save_to_local(doc, row_key)
+        finally:
+            # 写入失败时行可能已部分更新，同样失效
+            if self.document_cache is not None:
+                self.document_cache.invalidate(row_key)
     
     def _save_to_hbase(self, doc: Document, row_key: str) -> str:
         """
         保存到HBase，带重试机制
         """
-        import time
-        max_retries = 5
-        for attempt in range(max_retries):
-            try:
-                if not self.connection:
-                    self._init_connection()
-                
-                table = self.connection.table(self.table_name)
-                
-                data = doc.to_dict()
-                
-                # 准备HBase数据
-                hbase_data = {}
-                for key, value in data.items():
-                    if value:
-                        hbase_data[f'info:{key}'] = str(value).encode('utf-8')
-                
-                # 如果文件路径存在，可以存储文件信息
-                if doc.file_path:
-                    hbase_data['info:file_path'] = doc.file_path.encode('utf-8')
-                
-                table.put(row_key.encode(), hbase_data)
-                return row_key
-            except Exception as e:
-                print(f"Error saving to HBase (attempt {attempt + 1}/{max_retries}): {e}")
-                
-                # 尝试重连
-                print("Attempting to reconnect to HBase...")
-                try:
-                    self.close()
-                    time.sleep(1) # 等待一秒再重连
-                    self._init_connection()
-                except Exception as reconnect_error:
-                    print(f"Reconnection failed: {reconnect_error}")
-                
-                # 如果是最后一次尝试，则抛出异常
-                if attempt == max_retries - 1:
-                    raise
+        def write(connection):
+            with connection.table(self.table_name).batch() as batch:
+                self._put_document(batch, row_key.encode(), doc)
+        
+        self._with_retry(write, 'saving to HBase')
+        return row_key
+    
+    def _put_document(self, batch, row_key: bytes, doc: Document):
+        """
+        在batch中写入文档：已变为空值的列写入空值，
+        使更新后的行与新文档一致，不残留上一次爬取的旧值
 
-    def _save_to_local(self, doc: Document, row_key: str) -> str:
+        不删除这些列：HBase的删除会删掉该列的全部版本，
+        写入空值作为新版本，info列族保留的历史版本（hbase.max_versions）不受影响
         """
-        保存到本地文件（JSON格式）
+        hbase_data = self._document_cells(doc)
+        for key in DOCUMENT_FIELDS:
+            hbase_data.setdefault(self._field_column(key), b'')
+        if self.content_column != LEGACY_CONTENT_COLUMN:
+            # 加入content列族之前写入的正文
+            hbase_data.setdefault(LEGACY_CONTENT_COLUMN, b'')
+        batch.put(row_key, hbase_data)
+    
+    def _document_cells(self, doc: Document) -> Dict[str, bytes]:
+        """
+        将文档转换为HBase的列数据；正文按content_codec压缩，单元格自带压缩标记
         """
-        import json
+        data = doc.to_dict(content_codec=self.content_codec)
+        content_encoding = data.pop('content_encoding', None)
         
-        doc_file = os.path.join(self.local_storage_path, f"{row_key}.json")
-        with open(doc_file, 'w', encoding='utf-8') as f:
-            json.dump(doc.to_dict(), f, ensure_ascii=False, indent=2)
+        # 准备HBase数据
+        hbase_data = {}
+        for key, value in data.items():
+            if not value:
+                continue
+            if key == 'content' and content_encoding == 'base64':
+                # 压缩后的正文以二进制存储
+                hbase_data[self._field_column(key)] = base64.b64decode(value)
+            else:
+                hbase_data[self._field_column(key)] = str(value).encode('utf-8')
         
-        return row_key
+        # 如果文件路径存在，可以存储文件信息
+        if doc.file_path:
+            hbase_data['info:file_path'] = doc.file_path.encode('utf-8')
+        
+        return hbase_data
     
-    def get_document(self, row_key: str) -> Optional[Document]:
+    def _field_column(self, field: str) -> str:
         """
-        从HBase或本地存储获取文档
+        文档字段对应的HBase列
         """
-        if self.use_hbase:
-            return self._get_from_hbase(row_key)
-        else:
-            return self._get_from_local(row_key)
+        return self.content_column if field == 'content' else f'info:{field}'
     
-    def _get_from_hbase(self, row_key: str) -> Optional[Document]:
+    def _hbase_columns(self, columns: Optional[List[str]]) -> Optional[List[str]]:
+        """
+        将要读取的文档字段转换为HBase列；None表示读取全部列
         """
-        从HBase获取文档
+        if not columns:
+            return None
+        hbase_columns = []
+        for field in columns:
+            hbase_columns.append(self._field_column(field))
+            if field == 'content' and self.content_column != LEGACY_CONTENT_COLUMN:
+                hbase_columns.append(LEGACY_CONTENT_COLUMN)
+        return hbase_columns
+    
+    def save_documents(self, docs: List[Document]) -> List[str]:
+        """
+        批量保存文档，一批文档只借出一次连接、打开一次表，
+        写操作通过table.batch()合并提交，而不是每个文档一次同步put
+        
+        Args:
+            docs: 文档列表
+        
+        Returns:
+            row_keys: 与docs顺序一致的row key列表
         """
+        row_keys = [self._generate_row_key(doc.url) for doc in docs]
+        
+        def write(connection):
+            # 重试时整批重写，row key由URL决定，重复写入是幂等的
+            with connection.table(self.table_name).batch(batch_size=self.batch_size) as batch:
+                for doc, row_key in zip(docs, row_keys):
+                    self._put_document(batch, row_key.encode(), doc)
+        
         try:
-            table = self.connection.table(self.table_name)
-            row = table.row(row_key.encode())
-            
-            if not row:
+            if self.use_hbase:
+                self._with_retry(write, 'saving batch to HBase')
+            else:
+                self.local_store.put_many(
+                    (row_key, self._encode_local(doc)) for doc, row_key in zip(docs, row_keys)
+                )
+        finally:
+            if self.document_cache is not None:
+                self.document_cache.invalidate(*row_keys)
+        return row_keys
+
+    def _save_to_local(self, doc: Document, row_key: str) -> str:
+        """
+        保存到本地日志结构存储
+        """
+        self.local_store.put(row_key, self._encode_local(doc))
+        return row_key
+    
+    def _encode_local(self, doc: Document) -> bytes:
+        return json.dumps(doc.to_dict(content_codec=self.content_codec), ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    
+    def get_document(self, row_key: str, columns: Optional[List[str]] = None) -> Optional[Document]:
+        """
+        从HBase或本地存储获取文档
+        
+        启用document_cache时先查缓存；缓存中的文档包含全部字段，也用于只读取部分字段的请求。
+        只有读取全部字段的结果（包括文档不存在）写入缓存，返回的文档由缓存共享，不应修改
+        
+        Args:
+            row_key: 文档的row key
+            columns: 只读取这些字段（如['url', 'title']），None表示全部字段
+        """
+        cache = self.document_cache
+        if cache is not None:
+            cached = cache.get(row_key)
+            if cached is MISSING:
                 return None
-            
-            # 解析数据
-            data = {}
-            for key, value in row.items():
-                col_family, col_name = key.decode().split(':')
-                if col_family == 'info':
-                    data[col_name] = value.decode('utf-8')
-            
-            return Document.from_dict(data)
+            if cached is not None:
+                return cached
+            generation = cache.generation
+        
+        try:
+            if self.use_hbase:
+                doc = self._get_from_hbase(row_key, columns)
+            else:
+                doc = self._get_from_local(row_key, columns)
         except Exception as e:
-            print(f"Error getting from HBase: {e}")
+            print(f"Error getting document {row_key}: {e}")
+            return None
+        
+        if cache is not None and not columns:
+            cache.put(row_key, doc, generation)
+        return doc
+    
+    def get_documents(self, row_keys: List[str], columns: Optional[List[str]] = None) -> List[Optional[Document]]:
+        """
+        批量读取文档：先查缓存，其余的文档在HBase中通过一次table.rows()读取
+        
+        Args:
+            row_keys: 文档的row key列表
+            columns: 只读取这些字段，None表示全部字段
+        
+        Returns:
+            与row_keys顺序一致的文档列表，不存在的文档为None
+        """
+        cache = self.document_cache
+        generation = cache.generation if cache is not None else 0
+        
+        results = {}
+        pending = []
+        for row_key in row_keys:
+            if row_key in results:
+                continue
+            cached = cache.get(row_key) if cache is not None else None
+            if cached is None:
+                pending.append(row_key)
+            results[row_key] = None if cached is MISSING else cached
+        
+        if pending:
+            try:
+                if self.use_hbase:
+                    fetched = self._get_many_from_hbase(pending, columns)
+                else:
+                    fetched = {row_key: self._get_from_local(row_key, columns) for row_key in pending}
+            except Exception as e:
+                print(f"Error getting {len(pending)} documents: {e}")
+                fetched = None
+            
+            if fetched is not None:
+                for row_key in pending:
+                    doc = fetched.get(row_key)
+                    results[row_key] = doc
+                    if cache is not None and not columns:
+                        cache.put(row_key, doc, generation)
+        
+        return [results[row_key] for row_key in row_keys]
+    
+    def get_document_by_url(self, url: str, columns: Optional[List[str]] = None) -> Optional[Document]:
+        """
+        按URL直接读取文档，不需要扫描
+        """
+        return self.get_document(self._generate_row_key(url), columns)
+    
+    def _get_from_hbase(self, row_key: str, columns: Optional[List[str]] = None) -> Optional[Document]:
+        """
+        从HBase获取文档；读取失败时抛出异常，与文档不存在区分
+        """
+        with self._connection() as connection:
+            row = connection.table(self.table_name).row(row_key.encode(), columns=self._hbase_columns(columns))
+        
+        if not row:
             return None
+        
+        return self._row_to_document(row_key.encode(), row)
     
-    def _get_from_local(self, row_key: str) -> Optional[Document]:
+    def _get_many_from_hbase(self, row_keys: List[str], columns: Optional[List[str]] = None) -> Dict[str, Document]:
         """
-        从本地文件获取文档
+        通过一次table.rows()读取多个文档，返回row key -> 文档，不存在的文档不在结果中
         """
-        import json
+        with self._connection() as connection:
+            rows = connection.table(self.table_name).rows([row_key.encode() for row_key in row_keys],
+                                                          columns=self._hbase_columns(columns))
         
-        doc_file = os.path.join(self.local_storage_path, f"{row_key}.json")
-        if not os.path.exists(doc_file):
+        docs = {}
+        for key, data in rows:
+            doc = self._row_to_document(key, data)
+            if doc is not None:
+                docs[key.decode()] = doc
+        return docs
+    
+    def _get_from_local(self, row_key: str, columns: Optional[List[str]] = None) -> Optional[Document]:
+        """
+        从本地日志结构存储获取文档
+        """
+        value = self.local_store.get(row_key)
+        if value is None:
             return None
         
         try:
-            with open(doc_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
+            data = json.loads(value)
+            if columns:
+                data = {key: value for key, value in data.items() if key in columns}
             return Document.from_dict(data)
         except Exception as e:
             print(f"Error getting from local: {e}")
@@ -237,149 +548,382 @@ class HBaseClient:
     
     def get_all_documents(self, limit: Optional[int] = None) -> List[Document]:
         """
-        获取所有文档
+        获取所有文档（全部读入内存；文档较多时使用iter_documents逐个处理）
         """
         documents = []
+        try:
+            for doc in self.iter_documents(limit=limit):
+                documents.append(doc)
+        except Exception as e:
+            # 多次重试后扫描仍失败时返回已读到的部分结果
+            print(f"Failed to load all documents: {e}")
+            print(f"Returning partial results: {len(documents)} documents")
+            return documents
         
         if self.use_hbase:
-            import time
-            max_retries = 3
-            for attempt in range(max_retries):
-                try:
-                    if not self.connection:
-                        self._init_connection()
-                    
-                    table = self.connection.table(self.table_name)
-                    count = 0
-                    batch_size = 0
-                    last_key = None
-                    
-                    try:
-                        for key, data in table.scan():
-                            if limit and count >= limit:
-                                break
-                            
-                            try:
-                                row_data = {}
-                                for col_key, col_value in data.items():
-                                    col_family, col_name = col_key.decode().split(':')
-                                    if col_family == 'info':
-                                        row_data[col_name] = col_value.decode('utf-8')
-                                
-                                doc = Document.from_dict(row_data)
-                                documents.append(doc)
-                                count += 1
-                                batch_size += 1
-                                last_key = key
-                                
-                                # 每处理 1000 条打印一次进度
-                                if batch_size % 1000 == 0:
-                                    print(f"Loaded {batch_size} documents...")
-                            except Exception as row_error:
-                                print(f"Error processing row {key}: {row_error}")
-                                continue
-                        
-                        print(f"Successfully loaded {len(documents)} documents from HBase")
-                        # 如果加载的文档数量太少，可能是扫描提前中断了
-                        if len(documents) < 100 and attempt < max_retries - 1:
-                            print(f"Warning: Only {len(documents)} documents loaded, may be incomplete. Retrying...")
-                            documents = []  # 清空，准备重试
-                            raise Exception("Incomplete scan detected")
-                        
-                        break  # 成功则退出重试循环
-                    except (BrokenPipeError, ConnectionError, OSError) as scan_error:
-                        print(f"Connection error during scan (loaded {len(documents)} so far): {scan_error}")
-                        if attempt < max_retries - 1:
-                            # 如果已经加载了一些文档，先保存，然后重试
-                            if len(documents) > 0:
-                                print(f"Partial results: {len(documents)} documents, will retry for complete scan")
-                            documents = []  # 清空，准备完整重试
-                            raise  # 重新抛出异常，触发重连逻辑
-                        else:
-                            # 最后一次尝试，返回已加载的部分结果
-                            print(f"Returning partial results: {len(documents)} documents")
-                            break
-                except Exception as e:
-                    print(f"Error scanning HBase (attempt {attempt + 1}/{max_retries}): {e}")
-                    if attempt < max_retries - 1:
-                        print("Attempting to reconnect...")
-                        try:
-                            self.close()
-                            time.sleep(1)
-                            self._init_connection()
-                        except:
-                            pass
-                    else:
-                        print(f"Failed to load documents after {max_retries} attempts")
+            print(f"Successfully loaded {len(documents)} documents from HBase")
+        return documents
+    
+    def iter_documents(self, limit: Optional[int] = None, columns: Optional[List[str]] = None,
+                       row_start: Optional[bytes] = None, row_stop: Optional[bytes] = None,
+                       batch_size: Optional[int] = None, splits: Optional[int] = None) -> Iterator[Document]:
+        """
+        逐个读取文档，内存占用与文档总数无关
+        
+        HBase扫描连接出错时从最后读到的row key之后继续，不重新从头扫描；
+        连续多次失败后抛出异常。迭代期间占用当前线程借出的连接，应在同一线程中消费完或关闭。
+        
+        全表扫描时将row key空间分为splits段，各段在各自的线程和连接上并行扫描，
+        结果合并为一个流，此时文档不按row key排序
+        
+        Args:
+            limit: 最多读取的文档数
+            columns: 只读取这些字段（如['url', 'title', 'source']），其余字段取默认值；None表示全部字段
+            row_start: 起始row key（包含），仅HBase
+            row_stop: 结束row key（不包含），仅HBase
+            batch_size: 扫描器每次取回的行数，默认取hbase.scan_batch_size
+            splits: 并行扫描的段数，默认取hbase.scan_splits；1表示按row key顺序扫描，
+                指定row_start或row_stop时总是顺序扫描
+        """
+        if not self.use_hbase:
+            yield from self._iter_local_documents(limit, columns)
+            return
+        
+        batch_size = batch_size or self.scan_batch_size
+        splits = min(splits or self.scan_splits, self.pool_size)
+        if splits > 1 and row_start is None and row_stop is None:
+            yield from self._parallel_scan_documents(limit, columns, batch_size, splits)
         else:
-            # 从本地文件读取
-            import json
-            count = 0
-            for filename in os.listdir(self.local_storage_path):
-                if filename.endswith('.json'):
-                    if limit and count >= limit:
-                        break
-                    
-                    doc_file = os.path.join(self.local_storage_path, filename)
-                    try:
-                        with open(doc_file, 'r', encoding='utf-8') as f:
-                            data = json.load(f)
-                        doc = Document.from_dict(data)
-                        documents.append(doc)
+            yield from self._scan_documents(limit, columns, row_start, row_stop, batch_size)
+    
+    def _scan_documents(self, limit: Optional[int], columns: Optional[List[str]],
+                        row_start: Optional[bytes], row_stop: Optional[bytes],
+                        batch_size: int, max_retries: int = 3, progress: bool = True) -> Iterator[Document]:
+        """
+        扫描HBase文档表，出错时从断点继续
+        """
+        hbase_columns = self._hbase_columns(columns)
+        resume_key = row_start
+        count = 0
+        failures = 0
+        
+        while True:
+            try:
+                with self._connection() as connection:
+                    table = connection.table(self.table_name)
+                    scanner = table.scan(
+                        row_start=resume_key,
+                        row_stop=row_stop,
+                        columns=hbase_columns,
+                        batch_size=batch_size,
+                        limit=limit - count if limit else None
+                    )
+                    for key, data in scanner:
+                        # 下次从这一行之后继续
+                        resume_key = key + b'\x00'
+                        failures = 0
+                        doc = self._row_to_document(key, data)
+                        if doc is None:
+                            continue
+                        
+                        yield doc
                         count += 1
-                    except:
-                        continue
+                        
+                        # 每处理 1000 条打印一次进度
+                        if progress and count % 1000 == 0:
+                            print(f"Loaded {count} documents...")
+                        if limit and count >= limit:
+                            return
+                return
+            except Exception as e:
+                failures += 1
+                if failures > max_retries:
+                    print(f"Error scanning HBase after {count} documents, giving up: {e}")
+                    raise
+                print(f"Error scanning HBase after {count} documents (attempt {failures}/{max_retries}): {e}")
+                # 出错的连接已由连接池重建，稍等后重新借出，从断点继续扫描
+                time.sleep(1)
+    
+    def _split_row_ranges(self, splits: int) -> List[Tuple[Optional[bytes], Optional[bytes]]]:
+        """
+        按row key开头的md5十六进制前缀将整个表均匀划分为splits段
         
-        return documents
+        第一段没有起点、最后一段没有终点，不以十六进制开头的row key也会被扫描到
+        """
+        bounds = [f'{i * 256 // splits:02x}'.encode() for i in range(1, splits)]
+        return list(zip([None] + bounds, bounds + [None]))
+    
+    def _parallel_scan_documents(self, limit: Optional[int], columns: Optional[List[str]],
+                                 batch_size: int, splits: int) -> Iterator[Document]:
+        """
+        分段并行扫描HBase文档表，合并为一个流
+        
+        每段在单独的线程中扫描，借出各自的连接，并各自从断点重试；
+        结果经有界队列传给调用方，调用方消费慢时扫描线程随之暂停。
+        某一段最终失败时停止其它段并抛出该异常
+        """
+        results = queue.Queue(maxsize=batch_size)
+        stop = threading.Event()
+        
+        def put(item) -> bool:
+            while not stop.is_set():
+                try:
+                    results.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+        
+        def scan_range(row_start, row_stop):
+            docs = self._scan_documents(None, columns, row_start, row_stop, batch_size, progress=False)
+            try:
+                for doc in docs:
+                    if not put(doc):
+                        return
+                put(_RANGE_DONE)
+            except Exception as e:
+                put(e)
+            finally:
+                # 在本线程中关闭扫描，归还本线程借出的连接
+                docs.close()
+        
+        ranges = self._split_row_ranges(splits)
+        threads = [
+            threading.Thread(target=scan_range, args=row_range, name=f'hbase-scan-{i}', daemon=True)
+            for i, row_range in enumerate(ranges)
+        ]
+        for thread in threads:
+            thread.start()
+        
+        remaining = len(threads)
+        count = 0
+        try:
+            while remaining:
+                item = results.get()
+                if item is _RANGE_DONE:
+                    remaining -= 1
+                    continue
+                if isinstance(item, Exception):
+                    raise item
+                
+                yield item
+                count += 1
+                
+                # 每处理 1000 条打印一次进度
+                if count % 1000 == 0:
+                    print(f"Loaded {count} documents...")
+                if limit and count >= limit:
+                    return
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
+    
+    def _row_to_document(self, key: bytes, data: Dict[bytes, bytes]) -> Optional[Document]:
+        """
+        将HBase的一行转换为文档，无法解析时返回None
+        """
+        try:
+            row_data = {}
+            content = None
+            for col_key, col_value in data.items():
+                col_key = col_key.decode()
+                col_family, col_name = col_key.split(':', 1)
+                if col_key == CONTENT_COLUMN or col_key == LEGACY_CONTENT_COLUMN:
+                    # content列族中的正文优先于旧行留在info列族中的正文
+                    if content is None or col_key == CONTENT_COLUMN:
+                        content = col_value
+                elif col_family == 'info':
+                    row_data[col_name] = col_value.decode('utf-8')
+            
+            doc = Document.from_dict(row_data)
+            if content is not None:
+                # 压缩的正文在读取doc.content时才解压
+                doc.content = EncodedContent(content) if is_encoded(content) else content.decode('utf-8')
+            return doc
+        except Exception as row_error:
+            print(f"Error processing row {key}: {row_error}")
+            return None
+    
+    def _iter_local_documents(self, limit: Optional[int], columns: Optional[List[str]]) -> Iterator[Document]:
+        """
+        逐个读取本地存储的文档
+        """
+        count = 0
+        for _, value in self.local_store.items():
+            if limit and count >= limit:
+                break
+            
+            try:
+                data = json.loads(value)
+                if columns:
+                    data = {key: value for key, value in data.items() if key in columns}
+                doc = Document.from_dict(data)
+            except:
+                continue
+            
+            yield doc
+            count += 1
+    
+    def migrate_row_keys(self, dry_run: bool = False) -> Dict[str, int]:
+        """
+        将旧格式（URL哈希前8位_时间戳）的行迁移为按URL确定的row key
+        
+        同一URL的多个旧行只保留最近爬取的一个，写入新行后删除旧行；
+        旧行按row key有序，同一URL的旧行前缀相同、彼此相邻，按前缀分组处理，内存占用很小
+        
+        Args:
+            dry_run: 只统计，不写入也不删除
+        
+        Returns:
+            统计：扫描的旧行数、迁移的文档数、删除的旧行数
+        """
+        stats = {'old_rows': 0, 'migrated': 0, 'deleted': 0}
+        
+        if not self.use_hbase:
+            return self._migrate_local_row_keys(dry_run, stats)
+        
+        def flush(group):
+            # group: 同一前缀的旧行 [(row_key, doc)]，按URL保留爬取时间最新的一个
+            latest = {}
+            for row_key, doc in group:
+                current = latest.get(doc.url)
+                if current is None or self._is_newer(doc, row_key, *current):
+                    latest[doc.url] = (doc, row_key)
+            stats['migrated'] += len(latest)
+            stats['deleted'] += len(group)
+            if dry_run:
+                return
+            
+            def write(connection):
+                table = connection.table(self.table_name)
+                new_keys = {self._generate_row_key(url).encode(): doc for url, (doc, _) in latest.items()}
+                # 迁移前已按新格式重新爬取过的文档保留较新的一份
+                for row_key, data in table.rows(list(new_keys), columns=['info:crawl_time']):
+                    existing = self._row_to_document(row_key, data)
+                    if existing is not None and self._is_newer(existing, row_key, new_keys[row_key], b''):
+                        del new_keys[row_key]
+                with table.batch(batch_size=self.batch_size) as batch:
+                    for row_key, doc in new_keys.items():
+                        self._put_document(batch, row_key, doc)
+                    for row_key, _ in group:
+                        batch.delete(row_key)
+            self._with_retry(write, 'migrating rows')
+        
+        group = []
+        group_prefix = None
+        with self._connection() as connection:
+            for key, data in connection.table(self.table_name).scan(batch_size=self.scan_batch_size):
+                if b'_' not in key:
+                    continue
+                doc = self._row_to_document(key, data)
+                if doc is None or not doc.url:
+                    continue
+                
+                stats['old_rows'] += 1
+                prefix = key.split(b'_', 1)[0]
+                if prefix != group_prefix and group:
+                    flush(group)
+                    group = []
+                group_prefix = prefix
+                group.append((key, doc))
+                
+                if stats['old_rows'] % 1000 == 0:
+                    print(f"Scanned {stats['old_rows']} old rows...")
+        if group:
+            flush(group)
+        
+        if self.document_cache is not None and not dry_run:
+            self.document_cache.clear()
+        return stats
+    
+    def _migrate_local_row_keys(self, dry_run: bool, stats: Dict[str, int]) -> Dict[str, int]:
+        """
+        将旧版本本地存储的文档文件导入日志结构存储，并删除旧文件
+        """
+        if not dry_run:
+            return self._import_legacy_documents(remove=True)
+        
+        urls = set()
+        for _, doc in self._legacy_documents():
+            stats['old_rows'] += 1
+            urls.add(doc.url)
+        stats['migrated'] = len(urls)
+        stats['deleted'] = stats['old_rows']
+        return stats
+    
+    def _legacy_documents(self) -> Iterator[Tuple[str, Document]]:
+        """
+        旧版本本地存储的文档：file_storage_path下每个文档一个JSON文件
+        """
+        with os.scandir(self.local_storage_path) as entries:
+            for entry in entries:
+                if not entry.name.endswith('.json') or not entry.is_file():
+                    continue
+                try:
+                    with open(entry.path, 'r', encoding='utf-8') as f:
+                        data = json.load(f)
+                except Exception:
+                    continue
+                if isinstance(data, dict) and data.get('url'):
+                    yield entry.path, Document.from_dict(data)
+    
+    def _import_legacy_documents(self, remove: bool = False) -> Dict[str, int]:
+        """
+        将旧版本的文档文件按URL写入日志结构存储，同一URL保留最近爬取的一份
+        
+        Args:
+            remove: 导入后删除旧文件
+        """
+        stats = {'old_rows': 0, 'migrated': 0, 'deleted': 0}
+        urls = set()
+        for path, doc in self._legacy_documents():
+            stats['old_rows'] += 1
+            urls.add(doc.url)
+            row_key = self._generate_row_key(doc.url)
+            existing = self._get_from_local(row_key)
+            if existing is None or self._is_newer(doc, '', existing, ''):
+                self._save_to_local(doc, row_key)
+            if remove:
+                os.remove(path)
+                stats['deleted'] += 1
+        stats['migrated'] = len(urls)
+        return stats
+    
+    def _is_newer(self, doc: Document, row_key, current_doc: Document, current_row_key) -> bool:
+        """
+        比较同一URL的两个旧行：优先按爬取时间，其次按旧row key中的时间戳
+        """
+        if doc.crawl_time and current_doc.crawl_time and doc.crawl_time != current_doc.crawl_time:
+            return doc.crawl_time > current_doc.crawl_time
+        return row_key > current_row_key
     
     def save_index(self, term: str, doc_ids: List[str], term_freq: Dict[str, int]):
         """
         保存倒排索引到HBase
         """
         if self.use_hbase:
-            import time
-            max_retries = 5
-            for attempt in range(max_retries):
-                try:
-                    if not self.connection:
-                        self._init_connection()
-                        
-                    table = self.connection.table(self.index_table_name)
-                    
-                    # 存储文档ID列表和词频
-                    data = {
-                        b'index:doc_ids': ','.join(doc_ids).encode('utf-8'),
-                        b'index:term_freq': str(term_freq).encode('utf-8'),
-                        b'index:doc_count': str(len(doc_ids)).encode('utf-8')
-                    }
-                    
-                    table.put(term.encode(), data)
-                    break # 成功则退出循环
-                except Exception as e:
-                    print(f"Error saving index to HBase (attempt {attempt + 1}/{max_retries}): {e}")
-                    
-                    # 尝试重连
-                    try:
-                        self.close()
-                        time.sleep(1)
-                        self._init_connection()
-                    except:
-                        pass
-                        
-                    if attempt == max_retries - 1:
-                        print(f"Failed to save index for term: {term}")
-        else:
-            # 保存到本地文件
-            import json
-            index_file = os.path.join(self.local_storage_path, 'index', f"{term}.json")
-            os.makedirs(os.path.dirname(index_file), exist_ok=True)
+            # 存储文档ID列表和词频
+            data = {
+                b'index:doc_ids': ','.join(doc_ids).encode('utf-8'),
+                b'index:term_freq': str(term_freq).encode('utf-8'),
+                b'index:doc_count': str(len(doc_ids)).encode('utf-8')
+            }
             
-            with open(index_file, 'w', encoding='utf-8') as f:
-                json.dump({
-                    'term': term,
-                    'doc_ids': doc_ids,
-                    'term_freq': term_freq
-                }, f, ensure_ascii=False)
+            try:
+                self._with_retry(
+                    lambda connection: connection.table(self.index_table_name).put(term.encode(), data),
+                    'saving index to HBase'
+                )
+            except Exception:
+                print(f"Failed to save index for term: {term}")
+        else:
+            # 保存到本地日志结构存储
+            self.local_index_store.put(term, json.dumps({
+                'term': term,
+                'doc_ids': doc_ids,
+                'term_freq': term_freq
+            }, ensure_ascii=False).encode('utf-8'))
     
     def get_index(self, term: str) -> Optional[Dict]:
         """
@@ -387,8 +931,8 @@ class HBaseClient:
         """
         if self.use_hbase:
             try:
-                table = self.connection.table(self.index_table_name)
-                row = table.row(term.encode())
+                with self._connection() as connection:
+                    row = connection.table(self.index_table_name).row(term.encode())
                 
                 if not row:
                     return None
@@ -405,24 +949,39 @@ class HBaseClient:
                 print(f"Error getting index from HBase: {e}")
                 return None
         else:
-            # 从本地文件读取
-            import json
-            index_file = os.path.join(self.local_storage_path, 'index', f"{term}.json")
-            if not os.path.exists(index_file):
+            # 从本地日志结构存储读取
+            value = self.local_index_store.get(term)
+            if value is None:
                 return None
             
             try:
-                with open(index_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
+                return json.loads(value)
             except:
                 return None
     
+    def cache_stats(self) -> Optional[dict]:
+        """
+        文档缓存的命中统计；未启用缓存时返回None
+        """
+        return self.document_cache.stats() if self.document_cache is not None else None
+    
     def close(self):
         """
-        关闭连接
+        关闭连接池中的连接和本地存储
         """
-        if self.connection:
-            try:
-                self.connection.close()
-            except:
-                pass
+        for store in (self.local_store, self.local_index_store):
+            if store is not None:
+                store.close()
+        if self.pool:
+            # happybase的连接池没有提供关闭方法，逐个取出空闲连接关闭
+            while True:
+                try:
+                    connection = self.pool._queue.get_nowait()
+                except Exception:
+                    break
+                try:
+                    connection.close()
+                except:
+                    pass
+            self.pool = None
+            self._last_checked.clear()
@@ -0,0 +1,376 @@
+"""
+本地日志结构存储：HBase不可用时保存文档和索引
+"""
+import os
+import mmap
+import time
+import struct
+import threading
+import zlib
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+# 记录格式：[校验和 4字节][值长度 4字节][标志 1字节][键长度 2字节][键][值]
+# 校验和覆盖校验和之后的全部内容
+_CRC = struct.Struct('<I')
+_BODY = struct.Struct('<IBH')
+_HEADER_SIZE = _CRC.size + _BODY.size
+
+_PUT = 0
+_DELETE = 1
+
+_SEGMENT_PREFIX = 'segment-'
+_SEGMENT_SUFFIX = '.log'
+
+# 索引中的位置压缩为一个整数：段号 | 记录偏移 | 记录长度
+_OFFSET_BITS = 40
+_LENGTH_BITS = 32
+
+
+def _pack_location(segment: int, offset: int, length: int) -> int:
+    return (segment << (_OFFSET_BITS + _LENGTH_BITS)) | (offset << _LENGTH_BITS) | length
+
+
+def _unpack_location(location: int) -> Tuple[int, int, int]:
+    length = location & ((1 << _LENGTH_BITS) - 1)
+    offset = (location >> _LENGTH_BITS) & ((1 << _OFFSET_BITS) - 1)
+    segment = location >> (_OFFSET_BITS + _LENGTH_BITS)
+    return segment, offset, length
+
+
+class LocalStore:
+    """
+    日志结构的本地键值存储
+
+    记录只追加写入段文件（segment-NNNNNN.log），同一个键的新记录覆盖旧记录，
+    删除写入墓碑记录。内存中只保存键到记录位置的索引，打开时扫描各段的记录头重建；
+    写满的段用mmap读取。被覆盖和删除的记录超过一定比例时，compact()把仍然有效的
+    记录复制到新的段并删除旧段。
+
+    同一时间只应有一个进程写入；其它进程打开同一目录只读时，通过refresh()看到新追加的记录。
+    """
+
+    def __init__(self, path: str, segment_max_bytes: int = 64 * 1024 * 1024, compact_ratio: float = 0.5,
+                 refresh_interval: float = 1.0):
+        """
+        Args:
+            path: 段文件所在目录
+            segment_max_bytes: 单个段文件的大小上限，超过后写入新的段
+            compact_ratio: 失效记录占全部记录的比例超过该值时，换段后自动压缩
+            refresh_interval: get()未找到键时最多每隔这么多秒refresh()一次，
+                其它进程写入的记录最迟在这段时间后可见
+        """
+        self.path = path
+        self.segment_max_bytes = segment_max_bytes
+        self.compact_ratio = compact_ratio
+        self.refresh_interval = refresh_interval
+        os.makedirs(path, exist_ok=True)
+
+        # 键 -> 压缩后的记录位置
+        self._index: Dict[str, int] = {}
+        # 已写满（或由其它进程写入）的段：段号 -> mmap
+        self._maps: Dict[int, mmap.mmap] = {}
+        # 各段已扫描到的偏移，refresh()从这里继续
+        self._scanned: Dict[int, int] = {}
+        # 本进程正在写入的段，首次写入时才创建
+        self._active_id: Optional[int] = None
+        self._active = None
+        self._active_reader = None
+        self._active_size = 0
+
+        self._total_bytes = 0
+        self._dead_bytes = 0
+        self._compacting = False
+        self._lock = threading.RLock()
+
+        self._load()
+        # 上次扫描段文件的时间
+        self._refreshed = time.monotonic()
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._index
+
+    def get(self, key: str) -> Optional[bytes]:
+        """
+        读取键对应的值，不存在时返回None
+        """
+        with self._lock:
+            location = self._index.get(key)
+            if location is None:
+                # 可能是其它进程新写入的记录；反复查询不存在的键时不每次都扫描目录
+                if time.monotonic() - self._refreshed < self.refresh_interval:
+                    return None
+                self.refresh()
+                location = self._index.get(key)
+                if location is None:
+                    return None
+            return self._decode(self._read(location))
+
+    def put(self, key: str, value: bytes):
+        """
+        写入一条记录
+        """
+        self.put_many([(key, value)])
+
+    def put_many(self, items: Iterable[Tuple[str, bytes]]):
+        """
+        写入多条记录，全部追加后才刷新一次文件
+        """
+        with self._lock:
+            appended = False
+            for key, value in items:
+                self._append(key, value, _PUT)
+                appended = True
+            if appended:
+                self._active.flush()
+
+    def delete(self, key: str):
+        """
+        删除一条记录
+        """
+        with self._lock:
+            if key not in self._index:
+                return
+            self._append(key, b'', _DELETE)
+            self._active.flush()
+
+    def keys(self) -> List[str]:
+        with self._lock:
+            return list(self._index)
+
+    def items(self) -> Iterator[Tuple[str, bytes]]:
+        """
+        按记录在文件中的位置顺序遍历全部有效记录
+        """
+        with self._lock:
+            self.refresh()
+            entries = sorted(self._index.items(), key=lambda item: item[1])
+
+        for key, location in entries:
+            with self._lock:
+                try:
+                    record = self._read(location)
+                except (KeyError, ValueError):
+                    # 遍历期间该段已被压缩，按键重新定位
+                    current = self._index.get(key)
+                    if current is None:
+                        continue
+                    record = self._read(current)
+            value = self._decode(record)
+            if value is not None:
+                yield key, value
+
+    def refresh(self):
+        """
+        索引其它进程追加的记录；有段已被删除（其它进程压缩过）时重新加载
+        """
+        with self._lock:
+            self._refreshed = time.monotonic()
+            segment_ids = self._segment_ids()
+            if any(segment_id not in segment_ids for segment_id in self._scanned):
+                # 本进程正在写入的段也重新扫描
+                self._close_active()
+                self._close_maps()
+                self._index.clear()
+                self._scanned.clear()
+                self._total_bytes = 0
+                self._dead_bytes = 0
+
+            for segment_id in segment_ids:
+                if segment_id == self._active_id:
+                    continue
+                size = os.path.getsize(self._segment_path(segment_id))
+                if size > self._scanned.get(segment_id, 0):
+                    self._map_segment(segment_id)
+                    self._scan_segment(segment_id)
+
+    def compact(self):
+        """
+        把仍然有效的记录复制到新的段，删除旧段
+        """
+        with self._lock:
+            if self._compacting:
+                return
+            self._compacting = True
+            try:
+                self._seal_active()
+                old_ids = sorted(self._maps)
+                entries = sorted(self._index.items(), key=lambda item: item[1])
+
+                # 新的段号大于所有旧段，重新打开时新段中的记录优先
+                index = {}
+                for key, location in entries:
+                    record = self._read(location)
+                    if self._active is None or self._active_size >= self.segment_max_bytes:
+                        self._seal_active()
+                        self._open_active()
+                    offset = self._active_size
+                    self._active.write(record)
+                    self._active_size += len(record)
+                    self._scanned[self._active_id] = self._active_size
+                    index[key] = _pack_location(self._active_id, offset, len(record))
+                if self._active is not None:
+                    self._active.flush()
+
+                self._index = index
+                for segment_id in old_ids:
+                    self._maps.pop(segment_id).close()
+                    self._scanned.pop(segment_id, None)
+                    os.remove(self._segment_path(segment_id))
+
+                self._total_bytes = sum(_unpack_location(location)[2] for location in index.values())
+                self._dead_bytes = 0
+                print(f"Compacted local store {self.path}: {len(old_ids)} segments, {len(index)} records")
+            finally:
+                self._compacting = False
+
+    def close(self):
+        with self._lock:
+            self._close_active()
+            self._close_maps()
+
+    def _segment_path(self, segment_id: int) -> str:
+        return os.path.join(self.path, f'{_SEGMENT_PREFIX}{segment_id:06d}{_SEGMENT_SUFFIX}')
+
+    def _segment_ids(self) -> List[int]:
+        segment_ids = []
+        for name in os.listdir(self.path):
+            if name.startswith(_SEGMENT_PREFIX) and name.endswith(_SEGMENT_SUFFIX):
+                try:
+                    segment_ids.append(int(name[len(_SEGMENT_PREFIX):-len(_SEGMENT_SUFFIX)]))
+                except ValueError:
+                    continue
+        return sorted(segment_ids)
+
+    def _load(self):
+        for segment_id in self._segment_ids():
+            self._map_segment(segment_id)
+            self._scan_segment(segment_id)
+
+    def _map_segment(self, segment_id: int):
+        old = self._maps.pop(segment_id, None)
+        if old is not None:
+            old.close()
+        with open(self._segment_path(segment_id), 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return
+            self._maps[segment_id] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _scan_segment(self, segment_id: int):
+        """
+        从上次扫描到的位置起读取记录头，更新索引
+
+        记录不完整（正在写入或写入时崩溃）时停止，下次从该位置继续
+        """
+        data = self._maps.get(segment_id)
+        offset = self._scanned.get(segment_id, 0)
+        size = len(data) if data is not None else 0
+        while offset + _HEADER_SIZE <= size:
+            value_len, flags, key_len = _BODY.unpack_from(data, offset + _CRC.size)
+            length = _HEADER_SIZE + key_len + value_len
+            if key_len == 0 or offset + length > size:
+                break
+            key = bytes(data[offset + _HEADER_SIZE:offset + _HEADER_SIZE + key_len]).decode('utf-8')
+            self._update_index(key, _pack_location(segment_id, offset, length), flags)
+            offset += length
+        self._scanned[segment_id] = offset
+
+    def _update_index(self, key: str, location: int, flags: int):
+        length = location & ((1 << _LENGTH_BITS) - 1)
+        old = self._index.get(key)
+        if old is not None:
+            self._dead_bytes += old & ((1 << _LENGTH_BITS) - 1)
+        self._total_bytes += length
+        if flags == _DELETE:
+            self._index.pop(key, None)
+            self._dead_bytes += length
+        else:
+            self._index[key] = location
+
+    def _append(self, key: str, value: bytes, flags: int):
+        key_bytes = key.encode('utf-8')
+        body = _BODY.pack(len(value), flags, len(key_bytes)) + key_bytes + value
+        record = _CRC.pack(zlib.crc32(body)) + body
+
+        if self._active is None:
+            self._open_active()
+        elif self._active_size >= self.segment_max_bytes:
+            self._roll()
+
+        offset = self._active_size
+        self._active.write(record)
+        self._active_size += len(record)
+        self._scanned[self._active_id] = self._active_size
+        self._update_index(key, _pack_location(self._active_id, offset, len(record)), flags)
+
+    def _open_active(self):
+        """
+        创建新的段用于写入；段号取现有最大段号加一，与其它进程冲突时顺延
+        """
+        segment_ids = self._segment_ids()
+        segment_id = (segment_ids[-1] + 1) if segment_ids else 1
+        while True:
+            try:
+                fd = os.open(self._segment_path(segment_id), os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+                break
+            except FileExistsError:
+                segment_id += 1
+        self._active = os.fdopen(fd, 'wb')
+        self._active_reader = open(self._segment_path(segment_id), 'rb')
+        self._active_id = segment_id
+        self._active_size = 0
+        self._scanned[segment_id] = 0
+
+    def _seal_active(self):
+        """
+        结束当前段的写入，之后改用mmap读取
+        """
+        if self._active is None:
+            return
+        segment_id = self._active_id
+        self._close_active()
+        self._map_segment(segment_id)
+
+    def _roll(self):
+        self._seal_active()
+        if self._total_bytes and self._dead_bytes > self.compact_ratio * self._total_bytes:
+            self.compact()
+        if self._active is None:
+            self._open_active()
+
+    def _close_active(self):
+        if self._active is not None:
+            # 段中的记录都已在索引中，refresh()不应再重放
+            self._scanned[self._active_id] = self._active_size
+            self._active.close()
+            self._active_reader.close()
+        self._active = None
+        self._active_reader = None
+        self._active_id = None
+        self._active_size = 0
+
+    def _close_maps(self):
+        for data in self._maps.values():
+            data.close()
+        self._maps.clear()
+
+    def _read(self, location: int) -> bytes:
+        segment_id, offset, length = _unpack_location(location)
+        if segment_id == self._active_id:
+            self._active_reader.seek(offset)
+            return self._active_reader.read(length)
+        return self._maps[segment_id][offset:offset + length]
+
+    def _decode(self, record: bytes) -> Optional[bytes]:
+        """
+        校验记录并取出值；记录损坏时返回None
+        """
+        (crc,) = _CRC.unpack_from(record)
+        if zlib.crc32(memoryview(record)[_CRC.size:]) != crc:
+            print(f"Warning: corrupted record in local store {self.path}")
+            return None
+        value_len, _, key_len = _BODY.unpack_from(record, _CRC.size)
+        start = _HEADER_SIZE + key_len
+        return bytes(record[start:start + value_len])
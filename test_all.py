@@ -70,6 +70,184 @@ def test_storage():
         return False
 
 
+def test_local_store():
+    """测试本地存储：空写入不出错，压缩后refresh()不应重放旧段中的记录"""
+    print("\n" + "=" * 50)
+    print("测试2.1: 本地日志结构存储")
+    print("=" * 50)
+    
+    import random
+    import shutil
+    import tempfile
+    from storage.local_store import LocalStore
+    
+    path = tempfile.mkdtemp()
+    store = LocalStore(path, segment_max_bytes=4096, refresh_interval=0)
+    try:
+        # 新建的存储还没有正在写入的段
+        store.put_many([])
+        
+        rng = random.Random(0)
+        expected = {}
+        
+        def write(count):
+            for i in range(count):
+                key = f'key-{rng.randrange(300)}'
+                if rng.random() < 0.2:
+                    store.delete(key)
+                    expected.pop(key, None)
+                else:
+                    value = f'value-{i}-'.encode() * 8
+                    store.put(key, value)
+                    expected[key] = value
+        
+        # 压缩跨越多个段，之后的写入覆盖压缩后的记录
+        write(5000)
+        store.compact()
+        write(500)
+        # 查询不存在的键会触发refresh()
+        store.get('no-such-key')
+        
+        actual = dict(store.items())
+        mismatched = [key for key in set(expected) | set(actual) if expected.get(key) != actual.get(key)]
+        print(f"  {len(actual)} 个键，{len(mismatched)} 个与预期不一致")
+    finally:
+        store.close()
+        shutil.rmtree(path)
+    
+    assert not mismatched, f"local store returned stale records: {mismatched[:5]}"
+    print("✓ 本地存储压缩与刷新正确")
+    return True
+
+
+def test_content_codec():
+    """测试正文压缩编码：各算法往返一致，未压缩的旧数据可读，正文前缀正确"""
+    print("\n" + "=" * 50)
+    print("测试2.2: 正文压缩编码")
+    print("=" * 50)
+    
+    from storage.content_codec import ContentCodec, decode_content, decode_content_prefix, \
+        is_encoded, train_dictionary
+    from storage.data_model import Document
+    
+    template = "中国科学技术大学 版权所有 地址：安徽省合肥市金寨路96号\n"
+    texts = [template + f"第{i}篇通知：关于2024年秋季学期课程安排的说明。" * 20 + "\n" + template
+             for i in range(20)]
+    dictionary = train_dictionary(texts)
+    codecs = {
+        'zlib': ContentCodec('zlib'),
+        'lzma': ContentCodec('lzma'),
+        'zlib+dict': ContentCodec('zlib', dictionary=dictionary),
+        'none': ContentCodec('none'),
+    }
+    
+    sizes = {}
+    for name, codec in codecs.items():
+        sizes[name] = 0
+        for text in texts:
+            data = codec.encode(text)
+            sizes[name] += len(data)
+            assert is_encoded(data) == (name != 'none'), name
+            assert decode_content(data) == text, name
+            for n in (0, 1, 37, 200, len(text) + 10):
+                assert decode_content_prefix(data, n) == text[:n], (name, n)
+            
+            # 经过存储格式（to_dict/from_dict）后正文和前缀不变
+            doc = Document.from_dict(Document(url='http://example.com/', title='t', content=text,
+                                              file_type='html').to_dict(codec))
+            assert doc.content == text and doc.content_prefix(201) == text[:201], name
+    print(f"  压缩后大小: {sizes}")
+    assert sizes['zlib+dict'] < sizes['zlib'] < sizes['none']
+    
+    # 短正文不压缩；未压缩的旧数据（UTF-8原文、没有content_encoding）照常读取
+    assert not is_encoded(codecs['zlib'].encode("短正文"))
+    legacy = Document.from_dict({'url': 'http://example.com/old', 'title': '旧文档',
+                                 'content': "旧版本保存的正文" * 50, 'file_type': 'html'})
+    assert legacy.content == "旧版本保存的正文" * 50
+    assert legacy.content_prefix(10) == "旧版本保存的正文旧版"
+    assert decode_content("旧版本保存的正文".encode('utf-8')) == "旧版本保存的正文"
+    print("✓ 正文压缩编码正确")
+    return True
+
+
+def test_document_cache():
+    """测试文档缓存：总大小不超过上限，失效期间读到的旧文档不写回"""
+    print("\n" + "=" * 50)
+    print("测试2.3: 文档读取缓存")
+    print("=" * 50)
+    
+    from storage.document_cache import DocumentCache, MISSING
+    from storage.data_model import Document
+    
+    def make(i, size=1000):
+        return Document(url=f'http://example.com/{i}', title=f'文档{i}', content='x' * size, file_type='html')
+    
+    cache = DocumentCache(max_bytes=10000)
+    for i in range(50):
+        cache.put(f'row{i}', make(i), cache.generation)
+        assert cache.stats()['bytes'] <= cache.max_bytes
+    stats = cache.stats()
+    print(f"  写入50个文档后: {stats['entries']} 个条目, {stats['bytes']} 字节, 淘汰 {stats['evictions']} 个")
+    assert 0 < stats['entries'] < 50 and stats['evictions'] == 50 - stats['entries']
+    # 按最近使用淘汰：最早写入的已被淘汰，最近写入的仍在
+    assert cache.get('row0') is None and cache.get('row49').url == 'http://example.com/49'
+    # 超过上限的单个文档不缓存
+    cache.put('huge', make('huge', 20000), cache.generation)
+    assert cache.get('huge') is None
+    
+    # 读取存储期间有写入使缓存失效：旧的读取结果不写回
+    generation = cache.generation
+    cache.invalidate('row49')
+    cache.put('row49', make('stale'), generation)
+    assert cache.get('row49') is None
+    cache.put('row49', make(49), cache.generation)
+    assert cache.get('row49').url == 'http://example.com/49'
+    
+    # 不存在的文档也缓存，失效后清除
+    cache.put('absent', None, cache.generation)
+    assert cache.get('absent') is MISSING
+    cache.invalidate('absent')
+    assert cache.get('absent') is None
+    
+    cache.clear()
+    assert len(cache) == 0 and cache.stats()['bytes'] == 0
+    print("✓ 文档缓存大小限制与失效正确")
+    return True
+
+
+def test_file_download():
+    """测试文件下载接口只提供爬取下载的文件"""
+    print("\n" + "=" * 50)
+    print("测试2.4: 文件下载接口")
+    print("=" * 50)
+    
+    from web.app import app, file_root
+    
+    client = app.test_client()
+    sample = file_root / 'txt' / 'download_test.txt'
+    created = not sample.exists()
+    sample.parent.mkdir(parents=True, exist_ok=True)
+    if created:
+        sample.write_text('download test', encoding='utf-8')
+    try:
+        downloaded = client.get('/files/txt/download_test.txt').status_code
+    finally:
+        if created:
+            sample.unlink()
+    
+    # 索引JSON、文档JSON和目录穿越都不能访问
+    rejected = {path: client.get(path).status_code for path in (
+        '/files/index/01.json',
+        '/files/080531ac_1768223460130.json',
+        '/files/txt/../index/01.json',
+    )}
+    print(f"  下载文件: {downloaded}，拒绝: {rejected}")
+    assert downloaded == 200
+    assert all(status == 404 for status in rejected.values()), rejected
+    print("✓ 文件下载接口只提供下载的文件")
+    return True
+
+
 def test_tokenizer():
     """测试分词器"""
     print("\n" + "=" * 50)
@@ -140,6 +318,67 @@ def test_ranking():
         return False
 
 
+def test_suggester():
+    """测试自动补全排序：与逐个比较的结果一致，查询频率提升排名，查询频率计数有上限"""
+    print("\n" + "=" * 50)
+    print("测试4.1: 自动补全排序")
+    print("=" * 50)
+    
+    import random
+    from search.suggest import Suggester
+    
+    rng = random.Random(0)
+    alphabet = 'abc中文'
+    weights = {}
+    while len(weights) < 300:
+        term = ''.join(rng.choice(alphabet) for _ in range(rng.randint(1, 5)))
+        weights[term] = rng.randint(1, 1000)
+    
+    suggester = Suggester(top_n=5)
+    suggester.build(weights)
+    # 热门前缀用预先计算的结果，其余前缀现场排序，都应与逐个比较的结果一致
+    prefixes = {term[:i] for term in weights for i in range(1, len(term) + 1)}
+    for prefix in prefixes:
+        matches = [term for term in weights if term.lower().startswith(prefix)]
+        expected = sorted(weights[term] for term in matches)[::-1][:5]
+        actual = suggester.suggest(prefix)
+        assert [weights[term] for term in actual] == expected, prefix
+        assert suggester.suggest(prefix, limit=2) == actual[:2]
+    print(f"  {len(prefixes)} 个前缀的补全与逐个比较一致")
+    
+    # 不加载索引，只设置补全和查询频率用到的字段
+    import threading
+    from collections import Counter
+    from search.searcher import Searcher
+    searcher = Searcher.__new__(Searcher)
+    searcher.inverted_index = {'search': {'d1': 1, 'd2': 1, 'd3': 1}, 'searcher': {'d1': 1, 'd2': 1},
+                               'season': {'d3': 1}}
+    searcher.suggester = Suggester(top_n=2)
+    searcher.suggest_query_weight = 5.0
+    searcher.suggest_query_log_path = None
+    searcher.query_term_counts = Counter()
+    searcher._query_terms_lock = threading.Lock()
+    searcher.suggest_query_terms_max = 10
+    
+    # 按文档频率排序；查询频率按suggest_query_weight加权，常被查询的词排到前面
+    searcher.build_suggester()
+    assert searcher.suggester.suggest('sea') == ['search', 'searcher']
+    searcher._count_query_terms(['season'])
+    searcher.build_suggester()
+    assert searcher.suggester.suggest('sea') == ['season', 'search']
+    
+    # 查询频率计数超过上限时减半，只出现一次的词被淘汰
+    for i in range(5):
+        searcher._count_query_terms(['下载', '通知'])
+    for i in range(20):
+        searcher._count_query_terms([f'随机{i}'])
+    counts = searcher.query_terms_snapshot()
+    print(f"  查询频率计数: {dict(counts)}")
+    assert len(counts) <= 10 and counts['下载'] > 0 and counts['通知'] > 0
+    print("✓ 自动补全排序正确")
+    return True
+
+
 def test_text_processor():
     """测试文本处理"""
     print("\n" + "=" * 50)
@@ -212,6 +451,64 @@ def test_searcher():
         return False
 
 
+def test_shard_concurrency():
+    """测试分片进程池可同时执行多个查询，结果与单进程一致（需要数据）"""
+    print("\n" + "=" * 50)
+    print("测试7: 分片并发查询")
+    print("=" * 50)
+    
+    import time
+    import threading
+    from search.searcher import Searcher
+    
+    searcher = Searcher()
+    if len(searcher.documents) < 2:
+        print("⚠ 没有数据，跳过分片测试")
+        return True
+    
+    searcher.warm()
+    queries = ["下载", "文件", "新闻", "学校"]
+    expected = {q: searcher._score_local(searcher.tokenizer.tokenize(q), False, 10) for q in queries}
+    
+    searcher.shard_channels = 2
+    searcher.start_shards(2)
+    pool = searcher.shard_pool
+    
+    # 记录同时在分片上执行的查询数
+    lock = threading.Lock()
+    in_flight = [0, 0]
+    score_on_shards = pool._score_on_shards
+    
+    def tracked(*args):
+        with lock:
+            in_flight[0] += 1
+            in_flight[1] = max(in_flight)
+        try:
+            time.sleep(0.2)
+            return score_on_shards(*args)
+        finally:
+            with lock:
+                in_flight[0] -= 1
+    
+    pool._score_on_shards = tracked
+    results = {}
+    try:
+        threads = [threading.Thread(target=lambda q=q: results.__setitem__(
+            q, pool.score(searcher.tokenizer.tokenize(q), False, 10))) for q in queries]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    finally:
+        searcher.close()
+    
+    print(f"  最多同时执行 {in_flight[1]} 个查询")
+    assert in_flight[1] == 2, in_flight
+    assert results == expected
+    print("✓ 分片并发查询结果与单进程一致")
+    return True
+
+
 def main():
     """运行所有测试"""
     print("\n" + "=" * 50)
@@ -222,10 +519,16 @@ def main():
     
     results.append(("模块导入", test_imports()))
     results.append(("存储模块", test_storage()))
+    results.append(("本地存储", test_local_store()))
+    results.append(("正文压缩", test_content_codec()))
+    results.append(("文档缓存", test_document_cache()))
+    results.append(("文件下载", test_file_download()))
     results.append(("分词器", test_tokenizer()))
     results.append(("排序算法", test_ranking()))
+    results.append(("自动补全", test_suggester()))
     results.append(("文本处理", test_text_processor()))
     results.append(("搜索引擎", test_searcher()))
+    results.append(("分片并发", test_shard_concurrency()))
     
     # 总结
     print("\n" + "=" * 50)
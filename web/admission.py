@@ -0,0 +1,85 @@
+"""
+搜索请求准入控制
+"""
+import functools
+import threading
+from flask import jsonify, make_response
+
+from search.metrics import SHED
+
+
+class AdmissionControl:
+    """
+    并发准入控制
+
+    同时执行的请求不超过max_concurrent个，超出的请求最多max_queue个排队等待
+    queue_timeout秒；队列已满或等待超时的请求立即返回503，
+    避免突发的高代价查询使请求无限堆积、所有请求一起超时。
+    """
+
+    def __init__(self, max_concurrent: int, max_queue: int = 0, queue_timeout: float = 0.1):
+        """
+        Args:
+            max_concurrent: 同时执行的请求上限，0表示不限制
+            max_queue: 排队等待的请求上限
+            queue_timeout: 排队等待的最长时间（秒）
+        """
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._slots = threading.BoundedSemaphore(max_concurrent) if max_concurrent > 0 else None
+        self._waiting = 0
+        self._lock = threading.Lock()
+
+    def try_acquire(self) -> bool:
+        """
+        尝试获得执行名额
+        """
+        if self._slots is None:
+            return True
+        if self._slots.acquire(blocking=False):
+            return True
+
+        with self._lock:
+            if self._waiting >= self.max_queue:
+                return False
+            self._waiting += 1
+        try:
+            return self._slots.acquire(timeout=self.queue_timeout)
+        finally:
+            with self._lock:
+                self._waiting -= 1
+
+    def release(self):
+        if self._slots is not None:
+            self._slots.release()
+
+    def limit(self, view):
+        """
+        视图装饰器：未获得名额时返回503；流式响应在发送完毕后才释放名额
+        """
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if not self.try_acquire():
+                SHED.inc()
+                response = jsonify({
+                    'success': False,
+                    'message': '服务繁忙，请稍后重试',
+                    'results': []
+                })
+                response.status_code = 503
+                response.headers['Retry-After'] = '1'
+                return response
+
+            try:
+                response = make_response(view(*args, **kwargs))
+            except Exception:
+                self.release()
+                raise
+            if response.is_streamed:
+                response.call_on_close(self.release)
+            else:
+                self.release()
+            return response
+
+        return wrapper
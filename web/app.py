@@ -2,14 +2,24 @@
 Flask Web应用
 """
 import sys
+import time
+import threading
 from pathlib import Path
-from flask import Flask, render_template, request, jsonify
+import json
+from flask import Flask, render_template, request, jsonify, Response, send_from_directory, abort
 import yaml
 
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from storage.hbase_client import HBaseClient
-from search.searcher import Searcher
+from search.manager import SearcherManager
+from search.cluster import ClusterSearcher
+from search.metrics import REGISTRY, record_stage, PARTIAL, MultiprocessCollector
+from search.profile import QueryProfile, SlowQueryLog, profiling
+from search.deadline import Deadline, deadline_scope
+from web.admission import AdmissionControl
+from web.http_cache import make_etag, not_modified, set_cache_headers, compress_response
+from utils.file_handler import get_file_type
 
 app = Flask(__name__)
 
@@ -21,8 +31,96 @@ with open(config_path, 'r', encoding='utf-8') as f:
 web_config = config.get('web', {})
 app.config['DEBUG'] = web_config.get('debug', True)
 
-# 初始化搜索器
-searcher = Searcher()
+# 慢查询日志：耗时超过阈值的查询连同剖析写入轮转日志文件
+# 多进程服务时各工作进程的指标写入该目录，/metrics导出所有进程的汇总值
+metrics_collector = None
+if web_config.get('metrics_dir'):
+    metrics_dir = Path(web_config['metrics_dir'])
+    if not metrics_dir.is_absolute():
+        metrics_dir = Path(__file__).parent.parent / metrics_dir
+    metrics_collector = MultiprocessCollector(REGISTRY, str(metrics_dir),
+                                              web_config.get('metrics_dump_interval', 5))
+
+slow_query_log = None
+if web_config.get('slow_query_log_path') and web_config.get('slow_query_ms') is not None:
+    slow_query_log = SlowQueryLog(
+        web_config['slow_query_log_path'],
+        web_config['slow_query_ms'],
+        max_bytes=int(web_config.get('slow_query_log_max_mb', 10) * 1024 * 1024),
+        backup_count=web_config.get('slow_query_log_backups', 5)
+    )
+
+# 查询截止时间：到期返回已找到的最好结果并标记为不完整
+search_timeout = web_config.get('search_timeout_ms', 1000) / 1000.0
+
+# 准入控制：并发搜索超过上限时排队，队列满或等待超时立即返回503
+admission = AdmissionControl(
+    web_config.get('max_concurrent_searches', 0),
+    web_config.get('max_queued_searches', 0),
+    web_config.get('queue_timeout_ms', 100) / 1000.0
+)
+
+
+def request_timeout(value) -> float:
+    """
+    请求可用timeout_ms缩短截止时间，但不能超过配置值
+    """
+    try:
+        return min(float(value) / 1000.0, search_timeout) if value else search_timeout
+    except (TypeError, ValueError):
+        return search_timeout
+
+
+# 爬取文件的存储目录：FilesPipeline按 <文件类型>/<文件名> 保存
+storage_config = config.get('storage', {})
+file_root = Path(storage_config.get('file_storage_path', './data/files'))
+if not file_root.is_absolute():
+    file_root = Path(__file__).parent.parent / file_root
+file_root = file_root.resolve()
+file_max_age = web_config.get('file_max_age', 3600)
+# 由前置的nginx等反向代理发送文件（X-Sendfile），应用只返回响应头
+app.config['USE_X_SENDFILE'] = web_config.get('use_x_sendfile', False)
+
+# HTTP缓存与压缩
+cache_max_age = web_config.get('cache_max_age', 0)
+compress_min_bytes = web_config.get('compress_min_bytes', 1024)
+
+# 初始化搜索器：集群模式下作为协调器，将查询分发到各搜索节点；
+# 单机模式下索引重建后自动热更新
+cluster_config = config.get('cluster', {})
+if cluster_config.get('enabled'):
+    searcher = ClusterSearcher(cluster_config, config.get('search', {}))
+else:
+    searcher = SearcherManager()
+
+_hbase_client = None
+_hbase_client_lock = threading.Lock()
+
+
+def reset_after_fork(worker: int):
+    """
+    多进程服务时每个工作进程fork后调用：重建从主进程继承的HBase连接池，
+    慢查询日志改为写入本进程自己的文件，开始汇总各进程的指标
+    """
+    clients = [getattr(searcher, 'hbase_client', None), _hbase_client]
+    for client in {id(client): client for client in clients if client is not None}.values():
+        client.reset_after_fork()
+    if slow_query_log is not None:
+        slow_query_log.reopen(f'worker{worker}')
+    if metrics_collector is not None:
+        metrics_collector.start()
+
+
+def get_hbase_client() -> HBaseClient:
+    """
+    获取共享的HBase客户端；集群模式下协调器本身不加载文档，首次需要时才创建
+    """
+    global _hbase_client
+    if _hbase_client is None:
+        with _hbase_client_lock:
+            if _hbase_client is None:
+                _hbase_client = HBaseClient()
+    return _hbase_client
 
 
 @app.route('/')
@@ -33,20 +131,94 @@ def index():
     return render_template('index.html')
 
 
+def download_url(file_path):
+    """
+    本地保存的文件对应的下载地址，不在文件存储目录中时返回None
+    """
+    if not file_path:
+        return None
+    try:
+        relative = Path(file_path).resolve().relative_to(file_root)
+    except ValueError:
+        return None
+    if len(relative.parts) < 2:
+        return None
+    return '/files/' + relative.as_posix()
+
+
+def format_result(doc, score):
+    """
+    格式化单条搜索结果
+    """
+    # 正文可能以压缩形式保存，摘要只解压开头部分；多取一个字符判断是否被截断
+    content = doc.content_prefix(201)
+    return {
+        'url': doc.url,
+        'title': doc.title,
+        'content': content[:200] + '...' if len(content) > 200 else content,
+        'source': doc.source,
+        'file_type': doc.file_type,
+        'file_size': doc.file_size,
+        'score': round(score, 4),
+        'file_path': doc.file_path,
+        'download_url': download_url(doc.file_path)
+    }
+
+
+@app.after_request
+def compress(response):
+    """
+    压缩较大的JSON响应
+    """
+    return compress_response(response, compress_min_bytes)
+
+
 @app.route('/search', methods=['GET', 'POST'])
 def search():
     """
     搜索接口
+
+    GET请求的结果只随索引代数变化：ETag由索引代数和请求参数生成，
+    客户端带If-None-Match且仍然有效时直接返回304，不执行搜索，也不占用准入名额
+    """
+    etag = None
+    generation = searcher.generation
+    if (request.method == 'GET' and not request.args.get('stream') and not request.args.get('profile')
+            and request.accept_mimetypes.best != 'application/x-ndjson'):
+        etag = make_etag(generation, 'search', sorted(request.args.items(multi=True)))
+        cached = not_modified(etag, generation)
+        if cached is not None:
+            return cached
+    return run_search(etag, generation)
+
+
+@admission.limit
+def run_search(etag, generation):
+    """
+    执行搜索请求
     """
     if request.method == 'POST':
         data = request.get_json()
         query = data.get('query', '').strip()
         source = data.get('source', '')
         max_results = data.get('max_results', 50)
+        cursor = data.get('cursor')
+        fuzzy = data.get('fuzzy')
+        want_profile = bool(data.get('profile'))
+        timeout = request_timeout(data.get('timeout_ms'))
+        stream = bool(data.get('stream'))
     else:
         query = request.args.get('q', '').strip()
         source = request.args.get('source', '')
         max_results = int(request.args.get('limit', 50))
+        cursor = request.args.get('cursor')
+        fuzzy = request.args.get('fuzzy')
+        if fuzzy is not None:
+            fuzzy = fuzzy.lower() in ('1', 'true', 'yes')
+        want_profile = request.args.get('profile', '').lower() in ('1', 'true', 'yes')
+        timeout = request_timeout(request.args.get('timeout_ms'))
+        stream = request.args.get('stream', '').lower() in ('1', 'true', 'yes')
+    stream = stream or request.accept_mimetypes.best == 'application/x-ndjson'
     
     if not query:
         return jsonify({
@@ -55,33 +227,51 @@ def search():
             'results': []
         })
     
+    if stream:
+        return stream_search(query, source, max_results, fuzzy, timeout)
+    
+    # 请求剖析：?profile=1时随结果返回，开启慢查询日志时每个请求都记录以便事后写入
+    profile = QueryProfile() if want_profile or slow_query_log else None
+    deadline = Deadline(timeout)
+    
     try:
-        # 执行搜索
-        if source:
-            results = searcher.search_by_source(query, source, max_results)
-        else:
-            results = searcher.search(query, max_results)
-        
-        # 格式化结果
-        formatted_results = []
-        for doc, score in results:
-            formatted_results.append({
-                'url': doc.url,
-                'title': doc.title,
-                'content': doc.content[:200] + '...' if len(doc.content) > 200 else doc.content,
-                'source': doc.source,
-                'file_type': doc.file_type,
-                'file_size': doc.file_size,
-                'score': round(score, 4),
-                'file_path': doc.file_path
-            })
-        
-        return jsonify({
-            'success': True,
-            'query': query,
-            'count': len(formatted_results),
-            'results': formatted_results
-        })
+        with profiling(profile), deadline_scope(deadline):
+            # 执行搜索，携带cursor参数（第一页为空串）时按游标分页
+            next_cursor = None
+            if cursor is not None:
+                results, next_cursor = searcher.search_page(query, max_results, cursor, source, fuzzy)
+            elif source:
+                results = searcher.search_by_source(query, source, max_results, fuzzy)
+            else:
+                results = searcher.search(query, max_results, fuzzy)
+            
+            # 格式化结果
+            start = time.perf_counter()
+            formatted_results = [format_result(doc, score) for doc, score in results]
+            
+            response = {
+                'success': True,
+                'query': query,
+                'count': len(formatted_results),
+                'results': formatted_results,
+                # 超过截止时间时结果是已找到的最好结果，可能不完整
+                'partial': deadline.partial
+            }
+            if deadline.partial:
+                PARTIAL.inc()
+            if cursor is not None:
+                response['next_cursor'] = next_cursor
+            if want_profile:
+                # 剖析本身要随响应序列化，序列化耗时不计入其中
+                record_stage('serialize', start)
+                response['profile'] = profile.to_dict()
+                return jsonify(response)
+            response = jsonify(response)
+            record_stage('serialize', start)
+        # 不完整的结果不可缓存
+        if not deadline.partial:
+            set_cache_headers(response, etag, generation, cache_max_age)
+        return response
     
     except Exception as e:
         return jsonify({
@@ -89,6 +279,137 @@ def search():
             'message': f'搜索出错: {str(e)}',
             'results': []
         })
+    
+    finally:
+        if slow_query_log is not None:
+            slow_query_log.maybe_log(profile, query=query, source=source, cursor=cursor,
+                                     fuzzy=fuzzy, max_results=max_results)
+
+
+def stream_search(query, source, max_results, fuzzy, timeout):
+    """
+    以NDJSON流式返回搜索结果
+
+    每行一个结果，边从候选堆中取出、边格式化、边发送；最后一行为汇总
+    {"success": true, "done": true, "count": ..., "partial": ...}
+    """
+    def generate():
+        deadline = Deadline(timeout)
+        count = 0
+        try:
+            with deadline_scope(deadline):
+                for doc, score in searcher.iter_search(query, max_results, fuzzy, source):
+                    count += 1
+                    yield json.dumps(format_result(doc, score), ensure_ascii=False) + '\n'
+            if deadline.partial:
+                PARTIAL.inc()
+            yield json.dumps({
+                'success': True,
+                'done': True,
+                'query': query,
+                'count': count,
+                'partial': deadline.partial
+            }, ensure_ascii=False) + '\n'
+        except Exception as e:
+            yield json.dumps({
+                'success': False,
+                'message': f'搜索出错: {str(e)}'
+            }, ensure_ascii=False) + '\n'
+    
+    return Response(generate(), mimetype='application/x-ndjson')
+
+
+@app.route('/search/batch', methods=['POST'])
+@admission.limit
+def search_batch():
+    """
+    批量搜索接口
+
+    请求体: {"queries": [...], "max_results": 10, "fuzzy": false, "timeout_ms": 1000}
+    以NDJSON逐行返回每个查询的结果，顺序与请求一致；截止时间对每个查询单独计算
+    """
+    data = request.get_json() or {}
+    queries = [str(q).strip() for q in data.get('queries', [])]
+    max_results = data.get('max_results', 50)
+    fuzzy = data.get('fuzzy')
+    timeout = request_timeout(data.get('timeout_ms'))
+    
+    def generate():
+        deadline = Deadline(timeout)
+        try:
+            with deadline_scope(deadline):
+                for query, results in searcher.search_many(queries, max_results, fuzzy):
+                    start = time.perf_counter()
+                    formatted_results = [format_result(doc, score) for doc, score in results]
+                    line = json.dumps({
+                        'success': True,
+                        'query': query,
+                        'count': len(formatted_results),
+                        'results': formatted_results,
+                        'partial': deadline.partial
+                    }, ensure_ascii=False) + '\n'
+                    record_stage('serialize', start)
+                    if deadline.partial:
+                        PARTIAL.inc()
+                    deadline.reset(timeout)
+                    yield line
+        except Exception as e:
+            yield json.dumps({
+                'success': False,
+                'message': f'搜索出错: {str(e)}'
+            }, ensure_ascii=False) + '\n'
+    
+    return Response(generate(), mimetype='application/x-ndjson')
+
+
+@app.route('/suggest')
+def suggest():
+    """
+    搜索词自动补全接口
+    """
+    prefix = request.args.get('q', '')
+    limit = int(request.args.get('limit', 10))
+    return jsonify({
+        'success': True,
+        'prefix': prefix,
+        'suggestions': searcher.suggest(prefix, limit)
+    })
+
+
+@app.route('/files/<path:filename>')
+def download_file(filename):
+    """
+    下载爬取保存的文件
+
+    支持Range请求（断点续传、PDF阅读器按需加载）和条件请求（ETag/Last-Modified）。
+    文件以wsgi.file_wrapper返回，由WSGI服务器分块发送，gunicorn等服务器使用sendfile零拷贝发送；
+    配置use_x_sendfile后交给反向代理发送。
+    ?download=1时以附件形式下载。
+    """
+    # 只提供FilesPipeline下载的文件：路径必须正好是 <文件类型>/<文件名>，
+    # 存储目录中的文档JSON、index/下的索引JSON等其它文件不对外提供
+    filename = filename.strip('/')
+    name = filename.rsplit('/', 1)[-1]
+    if filename != f"{get_file_type(name)}/{name}":
+        abort(404)
+    return send_from_directory(
+        file_root, filename,
+        conditional=True,
+        as_attachment=request.args.get('download', '').lower() in ('1', 'true', 'yes'),
+        max_age=file_max_age
+    )
+
+
+@app.route('/metrics')
+def metrics():
+    """
+    Prometheus指标接口；多进程服务时导出所有工作进程的汇总值
+    """
+    if metrics_collector is not None and metrics_collector.active:
+        body = metrics_collector.render()
+    else:
+        body = REGISTRY.render()
+    return Response(body, mimetype='text/plain; version=0.0.4')
 
 
 @app.route('/sources')
@@ -96,15 +417,25 @@ def get_sources():
     """
     获取所有来源网站列表
     """
+    generation = searcher.generation
+    etag = make_etag(generation, 'sources')
+    cached = not_modified(etag, generation)
+    if cached is not None:
+        return cached
+    
     try:
-        hbase_client = HBaseClient()
-        documents = hbase_client.get_all_documents()
-        sources = list(set(doc.source for doc in documents if doc.source))
-        sources.sort()
-        return jsonify({
+        if isinstance(searcher, ClusterSearcher):
+            # 只读取source列，逐行扫描
+            documents = get_hbase_client().iter_documents(columns=['source'])
+            sources = sorted(set(doc.source for doc in documents if doc.source))
+        else:
+            # 来源列表取自已加载的索引，随索引代数缓存
+            sources = searcher.sources()
+        response = jsonify({
             'success': True,
             'sources': sources
         })
+        return set_cache_headers(response, etag, generation, cache_max_age)
     except Exception as e:
         return jsonify({
             'success': False,
@@ -0,0 +1,207 @@
+"""
+ASGI应用：asyncio事件循环负责连接与网络读写，请求处理在线程池中执行
+"""
+import io
+import sys
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from werkzeug.wsgi import FileWrapper
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from web.app import app as flask_app, searcher, web_config, cluster_config
+
+# 执行请求的线程数：决定同时在处理的请求数（打分、等待存储I/O，集群模式下等待各节点回复），
+# 与连接数无关；超出的请求在事件循环中排队，只占用协程
+asgi_threads = web_config.get('asgi_threads', 32)
+executor = ThreadPoolExecutor(max_workers=asgi_threads, thread_name_prefix='asgi-worker')
+# 请求体大小上限
+max_request_bytes = web_config.get('max_request_bytes', 1024 * 1024)
+# 每个响应在事件循环与工作线程之间缓冲的块数，客户端读得慢时工作线程随之暂停
+response_buffer_chunks = 8
+
+_START = object()
+_DONE = object()
+
+
+def _build_environ(scope, body: bytes) -> dict:
+    """
+    由ASGI请求构造WSGI environ
+    """
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        # 请求体已完整读入，分块传输的请求也按实际长度提供
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+        'wsgi.file_wrapper': lambda f, block_size=64 * 1024: FileWrapper(f, block_size),
+    }
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name == 'CONTENT_TYPE':
+            environ['CONTENT_TYPE'] = value
+        elif name == 'CONTENT_LENGTH':
+            continue
+        else:
+            key = f'HTTP_{name}'
+            environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+
+async def _read_body(receive):
+    """
+    读取请求体，超过上限时返回None；客户端断开时抛出ConnectionError
+    """
+    chunks = []
+    size = 0
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            raise ConnectionError('client disconnected')
+        chunk = message.get('body', b'')
+        size += len(chunk)
+        if size > max_request_bytes:
+            return None
+        chunks.append(chunk)
+        if not message.get('more_body'):
+            return b''.join(chunks)
+
+
+def _run_wsgi(environ, loop, queue: asyncio.Queue, cancelled):
+    """
+    在工作线程中执行Flask应用，并把响应头和响应体逐块放入队列
+
+    同一请求（包括流式响应的整个生成过程）始终在同一个线程中执行，
+    查询截止时间、剖析等线程局部状态与WSGI服务器下的行为一致
+    """
+    def put(item):
+        if cancelled.is_set():
+            raise ConnectionError('client disconnected')
+        asyncio.run_coroutine_threadsafe(queue.put(item), loop).result()
+
+    response_start = {}
+
+    def start_response(status, headers, exc_info=None):
+        response_start['status'] = int(status.split(' ', 1)[0])
+        response_start['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                                     for name, value in headers]
+        return lambda data: None
+
+    try:
+        result = flask_app(environ, start_response)
+        try:
+            put((_START, response_start['status'], response_start['headers']))
+            for chunk in result:
+                if chunk:
+                    put(chunk)
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+    except ConnectionError:
+        return
+    except Exception as e:
+        print(f"Error handling {environ['PATH_INFO']}: {e}")
+    try:
+        put(_DONE)
+    except ConnectionError:
+        pass
+
+
+async def _handle_http(scope, receive, send):
+    try:
+        body = await _read_body(receive)
+    except ConnectionError:
+        return
+    if body is None:
+        await send({'type': 'http.response.start', 'status': 413,
+                    'headers': [(b'content-type', b'text/plain; charset=utf-8')]})
+        await send({'type': 'http.response.body', 'body': b'Request body too large'})
+        return
+
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(maxsize=response_buffer_chunks)
+    cancelled = threading.Event()
+    task = loop.run_in_executor(executor, _run_wsgi, _build_environ(scope, body), loop, queue, cancelled)
+
+    started = False
+    try:
+        while True:
+            item = await queue.get()
+            if item is _DONE:
+                break
+            if isinstance(item, tuple) and item and item[0] is _START:
+                await send({'type': 'http.response.start', 'status': item[1], 'headers': item[2]})
+                started = True
+                continue
+            await send({'type': 'http.response.body', 'body': item, 'more_body': True})
+    except BaseException as e:
+        # 客户端断开或任务被取消：通知工作线程停止，并取走已放入的块使其不再阻塞
+        cancelled.set()
+        while not queue.empty():
+            queue.get_nowait()
+        if isinstance(e, Exception):
+            return
+        raise
+
+    await task
+    if not started:
+        await send({'type': 'http.response.start', 'status': 500,
+                    'headers': [(b'content-type', b'text/plain; charset=utf-8')]})
+    await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+
+
+async def _handle_lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            # 启动时在后台线程中预先构建索引，不阻塞事件循环
+            try:
+                await asyncio.get_running_loop().run_in_executor(executor, searcher.warm)
+            except Exception as e:
+                await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                return
+            if cluster_config.get('enabled'):
+                print(f"ASGI: cluster mode, at most {asgi_threads} searches in flight "
+                      f"(web.asgi_threads); each waits on the node fan-out in a worker thread")
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            executor.shutdown(wait=False)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    """
+    ASGI入口
+
+    事件循环只负责接收连接、读取请求体和发送响应，大量空闲或慢速连接只占用协程；
+    路由、打分和存储I/O沿用web/app.py中的Flask应用，在线程池中执行，
+    事件循环不会被打分或HBase调用阻塞。
+
+    正在处理的请求各占一个线程，同时处理的请求数上限是web.asgi_threads。
+    集群模式下协调器向各节点分发查询是阻塞调用，每个/search在等待节点回复期间都占用线程，
+    ASGI只节省空闲和慢速连接的开销，不提高同时进行的集群查询数；需要时调大asgi_threads
+    """
+    if scope['type'] == 'http':
+        await _handle_http(scope, receive, send)
+    elif scope['type'] == 'lifespan':
+        await _handle_lifespan(receive, send)
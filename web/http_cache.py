@@ -0,0 +1,124 @@
+"""
+HTTP缓存与压缩：按索引代数生成ETag/Last-Modified，压缩较大的JSON响应
+"""
+import gzip
+import hashlib
+import json
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Optional
+from flask import request, Response
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# 压缩后的表示在ETag后附加编码后缀，与未压缩的表示区分
+ENCODING_SUFFIXES = {'br': '-br', 'gzip': '-gz'}
+
+
+def make_etag(generation: int, *parts) -> Optional[str]:
+    """
+    由索引代数和请求参数生成强ETag；代数为0（索引代数未知）时返回None
+    """
+    if not generation:
+        return None
+    digest = hashlib.sha1(json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str).encode('utf-8'))
+    return f'"{generation:x}-{digest.hexdigest()[:16]}"'
+
+
+def _strip_encoding(tag: str) -> str:
+    tag = tag.strip()
+    if tag.startswith('W/'):
+        tag = tag[2:]
+    for suffix in ENCODING_SUFFIXES.values():
+        if tag.endswith(suffix + '"'):
+            return tag[:-len(suffix) - 1] + '"'
+    return tag
+
+
+def not_modified(etag: Optional[str], generation: int) -> Optional[Response]:
+    """
+    检查条件请求，客户端缓存仍然有效时返回304响应，否则返回None
+
+    优先比较If-None-Match；没有时比较If-Modified-Since与索引代数的时间
+    """
+    if etag is None:
+        return None
+
+    matched_tag = etag
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match is not None:
+        # 304响应回送客户端缓存的那个表示（可能是压缩后的）的ETag
+        tags = {_strip_encoding(tag): tag.strip() for tag in if_none_match.split(',')}
+        if etag in tags:
+            matched_tag = tags[etag]
+        elif '*' not in tags:
+            return None
+    else:
+        if_modified_since = request.headers.get('If-Modified-Since')
+        if not if_modified_since:
+            return None
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return None
+        # HTTP日期精确到秒
+        if generation // 1000 > since:
+            return None
+
+    response = Response(status=304)
+    response.headers['ETag'] = matched_tag
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
+
+
+def set_cache_headers(response: Response, etag: Optional[str], generation: int, max_age: int = 0) -> Response:
+    """
+    为响应设置ETag、Last-Modified和Cache-Control
+    """
+    if etag is None:
+        return response
+    response.headers['ETag'] = etag
+    response.headers['Last-Modified'] = formatdate(generation / 1000.0, usegmt=True)
+    response.headers['Cache-Control'] = f'public, max-age={max_age}'
+    return response
+
+
+def _choose_encoding() -> Optional[str]:
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        return 'br'
+    if accepted['gzip']:
+        return 'gzip'
+    return None
+
+
+def compress_response(response: Response, min_bytes: int = 1024, gzip_level: int = 6,
+                      brotli_quality: int = 5) -> Response:
+    """
+    压缩不小于min_bytes的JSON响应
+
+    客户端支持且已安装brotli时优先使用br，否则使用gzip；流式响应不压缩
+    """
+    if (response.direct_passthrough or response.is_streamed or response.status_code != 200
+            or response.mimetype != 'application/json' or 'Content-Encoding' in response.headers):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = _choose_encoding()
+    data = response.get_data()
+    if encoding is None or len(data) < min_bytes:
+        return response
+
+    if encoding == 'br':
+        data = brotli.compress(data, quality=brotli_quality)
+    else:
+        data = gzip.compress(data, compresslevel=gzip_level)
+
+    response.set_data(data)
+    response.headers['Content-Encoding'] = encoding
+    etag = response.headers.get('ETag')
+    if etag:
+        response.headers['ETag'] = etag[:-1] + ENCODING_SUFFIXES[encoding] + '"'
+    return response
@@ -0,0 +1,166 @@
+"""
+搜索节点服务：服务一个索引分区，供集群协调器调用
+"""
+import sys
+import heapq
+import threading
+import dataclasses
+from collections import OrderedDict
+from pathlib import Path
+from flask import Flask, request, jsonify, Response, g
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from search.searcher import Searcher
+from search.metrics import REGISTRY, CACHE_HITS, CACHE_MISSES
+from search.deadline import Deadline, deadline_scope
+
+
+def create_node_app(searcher: Searcher, content_chars: int = 1000) -> Flask:
+    """
+    创建搜索节点应用
+
+    Args:
+        searcher: 只加载了本分区文档的搜索引擎
+        content_chars: 返回文档内容的最大字符数，避免传输整篇大文档
+
+    Returns:
+        Flask应用
+    """
+    app = Flask(__name__)
+
+    # 统计阶段的候选集合缓存，打分阶段落在同一副本时无需重新查找
+    candidate_cache = OrderedDict()
+    cache_lock = threading.Lock()
+
+    def find_candidates(tokens, extra_terms):
+        key = (tuple(tokens), tuple(extra_terms))
+        with cache_lock:
+            if key in candidate_cache:
+                candidate_cache.move_to_end(key)
+                CACHE_HITS.labels('node_candidates').inc()
+                return candidate_cache[key]
+        CACHE_MISSES.labels('node_candidates').inc()
+
+        searcher._build_doc_tokens()
+        base_tokens = [token for token in tokens if token not in extra_terms]
+        candidates, matched = searcher._match_candidates(base_tokens)
+        if extra_terms:
+            candidates |= searcher._posting_candidates(extra_terms)
+
+        deadline = request_deadline()
+        if deadline is not None and deadline.partial:
+            # 因截止时间而不完整的候选集合不缓存
+            return candidates, matched
+        with cache_lock:
+            candidate_cache[key] = (candidates, matched)
+            while len(candidate_cache) > 64:
+                candidate_cache.popitem(last=False)
+        return candidates, matched
+
+    def request_deadline():
+        """
+        协调器在请求中带timeout_ms时，本节点的查找和打分也受其约束
+        """
+        timeout_ms = (request.get_json(silent=True) or {}).get('timeout_ms')
+        if not timeout_ms:
+            return None
+        if 'search_deadline' not in g:
+            g.search_deadline = Deadline(timeout_ms / 1000.0)
+        return g.search_deadline
+
+    @app.route('/node/health')
+    def health():
+        """
+        节点健康检查
+        """
+        return jsonify({
+            'success': True,
+            'partition': list(searcher.partition) if searcher.partition else None,
+            'generation': searcher.generation,
+            'doc_count': len(searcher.documents)
+        })
+
+    @app.route('/node/metrics')
+    def metrics():
+        """
+        Prometheus指标接口
+        """
+        return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+    @app.route('/node/stats', methods=['POST'])
+    def stats():
+        """
+        返回本分区的命中情况和打分统计量
+        """
+        data = request.get_json()
+        tokens = data.get('tokens', [])
+        deadline = request_deadline()
+        with deadline_scope(deadline):
+            candidates, matched = find_candidates(tokens, data.get('extra_terms', []))
+        return jsonify({
+            'success': True,
+            'matched': sorted(matched),
+            'stats': searcher._collect_stats(candidates, tokens),
+            'partial': deadline is not None and deadline.partial
+        })
+
+    @app.route('/node/expand', methods=['POST'])
+    def expand():
+        """
+        返回本分区词典中与查询词相近的词
+        """
+        data = request.get_json()
+        searcher._build_doc_tokens()
+        return jsonify({
+            'success': True,
+            'expansions': {token: searcher._fuzzy_candidates(token) for token in data.get('tokens', [])}
+        })
+
+    @app.route('/node/score', methods=['POST'])
+    def score():
+        """
+        用全局统计量打分，返回本分区排在边界之后的前k个结果
+        """
+        data = request.get_json()
+        tokens = data.get('tokens', [])
+        weights = data.get('weights', {})
+        source = data.get('source', '')
+        k = data.get('k')
+        boundary = tuple(data['boundary']) if data.get('boundary') else None
+
+        deadline = request_deadline()
+        with deadline_scope(deadline):
+            candidates, _ = find_candidates(tokens, list(weights))
+            ranked = searcher._rank_candidates(candidates, tokens, weights, data['stats'])
+        scored = []
+        for neg_score, ordinal in ranked:
+            doc = searcher.documents[searcher.doc_ids[ordinal]]
+            if source and source not in doc.source:
+                continue
+            # 集群内以(分数, URL)排序，URL全局唯一，与副本内的文档序号无关
+            item = (neg_score, doc.url)
+            if boundary is None or item > boundary:
+                scored.append((item, doc))
+        top = heapq.nsmallest(k, scored, key=lambda x: x[0]) if k is not None else sorted(scored, key=lambda x: x[0])
+
+        results = []
+        for (neg_score, _), doc in top:
+            # 压缩保存的正文只解压需要返回的开头部分
+            doc_dict = dataclasses.replace(doc, content=doc.content_prefix(content_chars)).to_dict()
+            results.append({'score': -neg_score, 'doc': doc_dict})
+        return jsonify({'success': True, 'results': results,
+                        'partial': deadline is not None and deadline.partial})
+
+    @app.route('/node/suggest', methods=['POST'])
+    def suggest():
+        """
+        本分区的自动补全
+        """
+        data = request.get_json()
+        return jsonify({
+            'success': True,
+            'suggestions': searcher.suggest(data.get('q', ''), data.get('limit'))
+        })
+
+    return app
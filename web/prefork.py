@@ -0,0 +1,164 @@
+"""
+多进程服务：预先构建索引后fork多个工作进程
+"""
+import gc
+import os
+import sys
+import time
+import signal
+import socket
+import threading
+from typing import Callable, Optional
+
+from werkzeug.serving import make_server
+
+
+def _serve_worker(app, searcher, host: str, port: int, fd: int, num_shards: int,
+                  worker: int, after_fork: Optional[Callable[[int], None]]):
+    """
+    工作进程主函数，从不返回
+    """
+    # 恢复默认信号处理，由主进程统一转发
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+
+    try:
+        if after_fork is not None:
+            after_fork(worker)
+        if num_shards > 1:
+            searcher.start_shards(num_shards)
+        server = make_server(host, port, app, threaded=True, fd=fd)
+        # 收到SIGTERM后不再接受新连接，等正在处理的请求完成后退出；
+        # shutdown会等待serve_forever返回，须在其它线程中调用
+        server.daemon_threads = False
+        signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(
+            target=server.shutdown, daemon=True).start())
+        server.serve_forever()
+        server.server_close()
+        if num_shards > 1:
+            searcher.stop_shards()
+    except Exception as e:
+        print(f"Worker {os.getpid()} failed: {e}")
+        os._exit(1)
+    os._exit(0)
+
+
+def serve_prefork(app, searcher, host: str = '127.0.0.1', port: int = 5000, workers: int = 2,
+                  after_fork: Optional[Callable[[int], None]] = None):
+    """
+    以多个进程服务同一个Flask应用
+
+    主进程先完成分词、倒排索引、文本段等全部构建，再冻结GC（gc.freeze），
+    使已有对象不再被垃圾回收扫描、不会因回收而写入对象头，
+    之后fork出的工作进程以写时复制方式共享这份只读索引，
+    文本段通过mmap映射，各进程共享同一份页缓存。
+    所有工作进程共用主进程创建的监听套接字，由内核分配连接。
+    工作进程异常退出时由主进程重新拉起。
+
+    searcher支持热更新（有reload方法和reload_interval）时，由主进程定期检查并加载新一代索引，
+    工作进程不各自加载；切换后逐个拉起新的工作进程，再让旧进程处理完当前请求后退出，
+    新一代索引同样只构建一次并由各进程共享。
+
+    Args:
+        app: Flask应用
+        searcher: 应用使用的搜索器
+        host: 监听地址
+        port: 监听端口
+        workers: 工作进程数
+        after_fork: 每个工作进程fork后首先调用，参数为工作进程编号（0到workers-1，
+            重新拉起的进程沿用原编号），用于重建不能跨进程共享的连接和日志文件
+    """
+    reload_interval = getattr(searcher, 'reload_interval', 0) if hasattr(searcher, 'reload') else 0
+    if reload_interval:
+        searcher.disable_watcher()
+
+    searcher.warm()
+
+    # 分片工作进程不能跨fork共享，由每个服务进程各自启动
+    num_shards = 0
+    if getattr(searcher, 'shard_pool', None) is not None:
+        num_shards = searcher.num_shards
+        searcher.stop_shards()
+
+    gc.collect()
+    gc.freeze()
+
+    sock = socket.socket(socket.AF_INET6 if ':' in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(128)
+    sock.set_inheritable(True)
+
+    children = {}
+    # 已被新进程替换、正在处理剩余请求的旧工作进程
+    retiring = set()
+    stopping = False
+
+    def spawn(worker: int):
+        pid = os.fork()
+        if pid == 0:
+            _serve_worker(app, searcher, host, port, sock.fileno(), num_shards, worker, after_fork)
+        children[pid] = (time.monotonic(), worker)
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children) + list(retiring):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    for worker in range(workers):
+        spawn(worker)
+    print(f"Serving on http://{host}:{port} with {workers} workers")
+
+    def roll():
+        # 新一代索引已在主进程加载完成：重新冻结GC后逐个替换工作进程
+        gc.unfreeze()
+        gc.collect()
+        gc.freeze()
+        for pid, (started, worker) in list(children.items()):
+            del children[pid]
+            spawn(worker)
+            retiring.add(pid)
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        print(f"Restarted {len(children)} workers on index generation {searcher.generation}")
+
+    next_reload = time.monotonic() + reload_interval
+    while children or retiring:
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG if reload_interval else 0)
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        if pid == 0:
+            if not stopping and time.monotonic() >= next_reload:
+                try:
+                    if searcher.reload():
+                        roll()
+                except Exception as e:
+                    print(f"Error reloading index: {e}")
+                next_reload = time.monotonic() + reload_interval
+            time.sleep(0.5)
+            continue
+        retiring.discard(pid)
+        child = children.pop(pid, None)
+        if child is None or stopping:
+            continue
+        started, worker = child
+        print(f"Worker {pid} exited with status {status}, restarting")
+        # 启动即退出的进程稍等再拉起，避免快速循环
+        if time.monotonic() - started < 1:
+            time.sleep(1)
+        spawn(worker)
+
+    sock.close()
+    sys.exit(0)